@@ -0,0 +1,582 @@
+"""
+Analyse de CV avec GPT-5 Vision, indépendante de l'interface Streamlit.
+Les fonctions de ce module peuvent être appelées depuis des threads de travail.
+"""
+
+import hashlib
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jiter
+
+import config
+import scheduler
+from db import make_cache_key, get_cached_analysis, store_cached_analysis, record_parse_failure
+from timings import recording, span
+from utils import (pdf_to_images_from_bytes, optimize_page_image, image_data_url,
+                   extract_text_layer, score_text_layer)
+
+MODEL_NAME = "gpt-5-mini"
+
+PROMPT_TEMPLATE = """
+Vous êtes un expert RH très exigeant.
+Votre mission : analyser le CV en fonction de l’offre d’emploi fournie.
+
+⚠️ Règles strictes :
+- Le JSON doit contenir **exactement et uniquement** les champs suivants, sans en ajouter d'autres.
+- Les champs numériques doivent rester des nombres (pas de texte).
+- Les détails et explications doivent être intégrés **uniquement** dans les champs texte comme "commentaires" ou "experience_pertinente".
+- N'utilisez pas de sous-objets ou de champs imbriqués.
+
+Champs attendus dans le JSON final :
+{{
+  "nom_prenom": "Nom et prénom du candidat (extrait du CV)",
+  "score_technique": [nombre sur 40],
+  "score_experience": [nombre sur 30],
+  "score_formation": [nombre sur 15],
+  "score_soft_skills": [nombre sur 15],
+  "score_global": [nombre sur 100],
+  "points_forts": ["liste des points forts du candidat"],
+  "points_faibles": ["liste des points faibles ou manques"],
+  "competences_matchees": ["compétences qui correspondent à l'offre"],
+  "competences_manquantes": ["compétences requises mais absentes"],
+  "experience_pertinente": "description détaillée de l'expérience pertinente",
+  "recommandation": "Recommandé / À considérer / Non recommandé",
+  "commentaires": "analyse détaillée du profil",
+  "pages_analysees": [nombre de pages du CV]
+}}
+
+Critères de notation :
+- Compétences techniques requises : 40 points max
+- Expérience pertinente : 30 points max
+- Formation et qualifications : 15 points max
+- Compétences soft skills : 15 points max
+
+Voici l'offre d'emploi à analyser :
+{job_offer}
+"""
+
+TEXT_SECTION_TEMPLATE = """
+Texte extrait du CV ({nb_pages} page(s)) :
+{cv_text}
+"""
+
+VISION_SECTION_TEMPLATE = """
+CV du candidat en images ({nb_pages} page(s)) :
+"""
+
+# Toute modification du prompt change cette empreinte et invalide le cache
+PROMPT_HASH = hashlib.sha256(
+    (PROMPT_TEMPLATE + TEXT_SECTION_TEMPLATE + VISION_SECTION_TEMPLATE).encode()
+).hexdigest()[:16]
+
+# Méthodes enregistrées dans `methode_analyse`
+METHOD_TEXT = "GPT-5 texte"
+METHOD_VISION = "GPT-5 vision"
+
+# Score minimal de la couche texte pour éviter le rendu en images
+TEXT_LAYER_MIN_SCORE = 0.6
+# Longueur maximale du texte de CV envoyé au modèle
+MAX_CV_TEXT_CHARS = 30000
+# Tokens de sortie prévus par analyse (pour l'admission dans le seau de tokens)
+EXPECTED_OUTPUT_TOKENS = 1500
+# Nombre de reprises, en fin de lot, des CV en échec pour une erreur transitoire
+FAILED_ITEM_PASSES = 1
+
+# Réparation d'une réponse invalide : appel texte seul, sans le CV ni l'offre
+REPAIR_INSTRUCTIONS = """
+La réponse JSON ci-dessous, produite lors de l'analyse d'un CV, est invalide.
+Corrigez-la pour qu'elle respecte le schéma imposé, en conservant son contenu :
+n'inventez aucune information qui n'y figure pas.
+"""
+REPAIR_SECTION_TEMPLATE = """
+Erreur de validation :
+{error}
+
+Réponse à corriger :
+{content}
+"""
+# Longueur maximale de la réponse invalide envoyée à la réparation
+MAX_REPAIR_CHARS = 20000
+
+
+def get_client(**options):
+    """Client OpenAI hors Streamlit ; OPENAI_BASE_URL permet de cibler un serveur de test."""
+    import openai  # import différé : le SDK n'est chargé qu'à la première analyse
+    return openai.OpenAI(api_key=os.environ.get("OPENAI_API_KEY") or config.OPENAI_API_KEY, **options)
+
+
+def build_prompt(job_offer):
+    """
+    Construit les instructions d'analyse pour une offre. Le texte ne dépend que de
+    l'offre : il est identique, à l'octet près, pour tous les CV analysés pour elle.
+    """
+    return PROMPT_TEMPLATE.format(job_offer=job_offer)
+
+
+def prompt_cache_key(job_offer):
+    """Clé de routage du cache de prompt de l'API : les requêtes d'une même offre partagent leur préfixe."""
+    return hashlib.sha256((PROMPT_HASH + job_offer).encode()).hexdigest()[:32]
+
+
+def _request_body(job_offer, content_parts):
+    """
+    Corps de la requête Responses, identique en mode interactif et en mode batch.
+    Les instructions et l'offre forment un préfixe stable, suivi du contenu propre au CV,
+    pour que l'API serve ce préfixe depuis son cache de prompt d'un CV à l'autre.
+    """
+    from analysis_schema import response_format  # import différé : pydantic n'est chargé qu'à la première analyse
+    return {
+        "model": MODEL_NAME,
+        "reasoning": {"effort": "minimal"},
+        "prompt_cache_key": prompt_cache_key(job_offer),
+        "text": response_format(),
+        "input": [
+            {
+                "role": "developer",
+                "content": [{"type": "input_text", "text": build_prompt(job_offer)}]
+            },
+            {
+                "role": "user",
+                "content": content_parts
+            }
+        ]
+    }
+
+
+def build_text_request(pages_text, job_offer):
+    """Construit la requête d'analyse à partir de la couche texte (une str par page)."""
+    cv_text = "\n\n".join(text.strip() for text in pages_text)[:MAX_CV_TEXT_CHARS]
+    cv_section = TEXT_SECTION_TEMPLATE.format(nb_pages=len(pages_text), cv_text=cv_text)
+    body = _request_body(job_offer, [{"type": "input_text", "text": cv_section}])
+    return body, {"method": METHOD_TEXT, "pages": len(pages_text)}
+
+
+def build_vision_request(pdf_bytes, job_offer):
+    """
+    Construit la requête d'analyse à partir du rendu des pages en images.
+    Retourne (body, details) avec le détail de la charge utile par page,
+    ou None si le PDF est vide.
+    """
+    with span("render"):
+        images = pdf_to_images_from_bytes(pdf_bytes)
+    if not images:
+        return None
+
+    content_parts = [{
+        "type": "input_text",
+        "text": VISION_SECTION_TEMPLATE.format(nb_pages=len(images))
+    }]
+    payload = []
+    for img in images:
+        with span("encode"):
+            encoded = optimize_page_image(img)
+            image_url = image_data_url(encoded)
+        content_parts.append({
+            "type": "input_image",
+            "image_url": image_url
+        })
+        payload.append({
+            "format": encoded["mime"],
+            "bytes": len(encoded["data"]),
+            "tokens": encoded["tokens"],
+            "original_tokens": encoded["original_tokens"],
+        })
+
+    return _request_body(job_offer, content_parts), {"method": METHOD_VISION, "pages": len(images), "payload": payload}
+
+
+def build_request(pdf_bytes, job_offer):
+    """
+    Construit la requête la moins coûteuse pour un CV : texte seul si la couche texte
+    du PDF est de bonne qualité, rendu en images sinon (PDF scanné ou image).
+    Retourne (body, details) où `details["method"]` vaut METHOD_TEXT ou METHOD_VISION,
+    ou None si le PDF est vide.
+    """
+    with span("text_layer"):
+        pages_text = extract_text_layer(pdf_bytes)
+        text_score = score_text_layer(pages_text)
+    if text_score >= TEXT_LAYER_MIN_SCORE:
+        return build_text_request(pages_text, job_offer)
+    return build_vision_request(pdf_bytes, job_offer)
+
+
+def estimate_cost(tokens, price_factor=1.0):
+    """Coût (USD) des tokens consommés ; les tokens d'entrée lus dans le cache de prompt sont moins chers."""
+    cached = tokens.get("cached", 0)
+    return price_factor * ((tokens["prompt"] - cached) * config.PRICE_INPUT
+                           + cached * config.PRICE_CACHED_INPUT
+                           + tokens["completion"] * config.PRICE_OUTPUT) / 1000
+
+
+def usage_record(result, price_factor=1.0):
+    """
+    Consommation d'une analyse à enregistrer avec elle (colonnes de `analyses`) : tokens
+    facturés, latence de l'appel au modèle, modèle, nombre de pages et coût. Un résultat
+    servi par le cache n'a rien coûté : ses tokens et son coût sont nuls.
+    """
+    billed = {"prompt": 0, "completion": 0, "cached": 0} if result.get("cached") else result["tokens"]
+    return {
+        "prompt_tokens": billed["prompt"],
+        "completion_tokens": billed["completion"],
+        "cached_tokens": billed.get("cached", 0),
+        "latency_ms": (result.get("timings") or {}).get("total_ms"),
+        "model": result.get("model", MODEL_NAME),
+        "nb_pages": result.get("pages"),
+        "cost_usd": estimate_cost(billed, price_factor),
+    }
+
+
+def prompt_cache_summary(results):
+    """
+    Effet du cache de prompt de l'API sur un lot de résultats (hors résultats servis par
+    le cache local) : part des tokens d'entrée lus dans le cache, nombre de requêtes qui
+    l'ont touché et latence moyenne (ms) des appels avec et sans préfixe en cache.
+    """
+    called = [r for r in results if not r.get("cached")]
+    prompt = sum(r["tokens"]["prompt"] for r in called)
+    cached = sum(r["tokens"].get("cached", 0) for r in called)
+    latencies = {True: [], False: []}
+    for r in called:
+        total_ms = (r.get("timings") or {}).get("total_ms")
+        if total_ms is not None:
+            latencies[r["tokens"].get("cached", 0) > 0].append(total_ms)
+    return {
+        "requests": len(called),
+        "hits": sum(1 for r in called if r["tokens"].get("cached", 0) > 0),
+        "prompt_tokens": prompt,
+        "cached_tokens": cached,
+        "hit_rate": cached / prompt if prompt else 0.0,
+        "latency_hit_ms": sum(latencies[True]) / len(latencies[True]) if latencies[True] else None,
+        "latency_miss_ms": sum(latencies[False]) / len(latencies[False]) if latencies[False] else None,
+    }
+
+
+def estimate_request_tokens(body, details):
+    """Estimation locale des tokens d'une requête (texte ~4 caractères/token, images, sortie)."""
+    text_chars = sum(
+        len(part.get("text", ""))
+        for message in body["input"]
+        for part in message["content"]
+        if part["type"] == "input_text"
+    )
+    image_tokens = sum(page["tokens"] for page in details.get("payload", []))
+    return text_chars // 4 + image_tokens + EXPECTED_OUTPUT_TOKENS
+
+
+def build_repair_request(content, error):
+    """Requête de réparation d'une réponse invalide : texte seul, même schéma imposé."""
+    from analysis_schema import response_format
+    section = REPAIR_SECTION_TEMPLATE.format(error=error, content=content[:MAX_REPAIR_CHARS])
+    body = {
+        "model": MODEL_NAME,
+        "reasoning": {"effort": "minimal"},
+        "text": response_format(),
+        "input": [
+            {"role": "developer", "content": [{"type": "input_text", "text": REPAIR_INSTRUCTIONS}]},
+            {"role": "user", "content": [{"type": "input_text", "text": section}]}
+        ]
+    }
+    return body, {"method": "réparation"}
+
+
+def ensure_valid(result, client):
+    """
+    Valide la réponse d'une analyse ; si elle est invalide, la fait corriger par un appel
+    texte seul (bien moins cher qu'une nouvelle analyse du CV) qui remplace `content`.
+    Les tokens de la réparation s'ajoutent à ceux du résultat et l'échec est enregistré
+    (db.record_parse_failure). Retourne le résultat, encore invalide si la réparation a échoué.
+    """
+    try:
+        parse_analysis(result["content"])
+        return result
+    except ValueError as e:
+        error = _short_error(e)
+
+    wasted_tokens = result["tokens"]["total"]
+    repair = {"error": error, "repaired": False, "tokens": 0}
+    # Une réponse vide (refus, réponse interrompue) n'a rien à réparer
+    if result["content"].strip():
+        repaired = None
+        try:
+            repaired = _call_model(build_repair_request(result["content"], error), client, repair=False)
+            parse_analysis(repaired["content"])
+            result["content"] = repaired["content"]
+            repair["repaired"] = True
+        except ValueError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Réparation impossible : {e}")
+        if repaired is not None:
+            repair["tokens"] = repaired["tokens"]["total"]
+            for key in ("prompt", "completion", "cached", "total"):
+                result["tokens"][key] = result["tokens"].get(key, 0) + repaired["tokens"].get(key, 0)
+    result["repair"] = repair
+    record_parse_failure(result.get("method"), error, repair["repaired"], wasted_tokens, repair["tokens"])
+    status = "réparée" if repair["repaired"] else "non réparée"
+    print(f"🩹 Réponse invalide ({error.splitlines()[0]}) : {status}")
+    return result
+
+
+def _short_error(error):
+    """Message d'une erreur de validation, limité aux premières erreurs."""
+    errors = getattr(error, "errors", None)
+    if callable(errors):
+        return "\n".join(f"{'.'.join(map(str, e['loc'])) or 'réponse'} : {e['msg']}" for e in errors()[:5])
+    return str(error)
+
+
+def _call_model(request, client, on_partial=None, repair=True):
+    body, details = request
+
+    def call():
+        start = time.perf_counter()
+        with span("llm"):
+            if on_partial is None:
+                response = client.responses.create(**body)
+                return response, {"total_ms": round((time.perf_counter() - start) * 1000)}
+            return _stream_model(body, client, on_partial, start)
+
+    # Admission, nouvelles tentatives et disjoncteur partagés par tout le processus
+    response, timings = scheduler.default_scheduler.call(
+        call,
+        estimated_tokens=estimate_request_tokens(body, details),
+        usage_tokens=lambda outcome: outcome[0].usage.total_tokens
+    )
+
+    usage = response.usage
+    input_details = getattr(usage, "input_tokens_details", None)
+    result = {
+        "content": response.output_text,
+        "tokens": {
+            "prompt": usage.input_tokens,
+            "completion": usage.output_tokens,
+            "cached": getattr(input_details, "cached_tokens", None) or 0,
+            "total": usage.total_tokens
+        },
+        "model": body["model"],
+        "timings": timings
+    }
+    result.update(details)
+    if repair:
+        result = ensure_valid(result, client)
+    return result
+
+
+def _stream_model(body, client, on_partial, start):
+    """
+    Appel en streaming : `on_partial(fields)` reçoit le JSON partiel à chaque nouveau
+    champ ou valeur. Retourne la réponse finale (avec `usage`) et les temps mesurés.
+    """
+    text = ""
+    last_fields = None
+    first_field_ms = None
+    response = None
+    for event in client.responses.create(stream=True, **body):
+        if event.type == "response.output_text.delta":
+            text += event.delta
+            fields = parse_partial_analysis(text)
+            if fields and fields != last_fields:
+                if first_field_ms is None:
+                    first_field_ms = round((time.perf_counter() - start) * 1000)
+                last_fields = fields
+                on_partial(fields)
+        elif event.type == "response.completed":
+            response = event.response
+        elif event.type in ("response.failed", "response.incomplete", "error"):
+            failed = getattr(event, "response", None)
+            error = getattr(failed, "error", None) or getattr(event, "message", None) or event.type
+            raise RuntimeError(f"Réponse interrompue : {error}")
+
+    if response is None:
+        raise RuntimeError("Flux terminé sans réponse complète")
+    total_ms = round((time.perf_counter() - start) * 1000)
+    return response, {"first_field_ms": first_field_ms, "total_ms": total_ms}
+
+
+def analyze_cv(pdf_bytes, job_offer, client, on_partial=None):
+    """
+    Analyse un CV par rapport à une offre d'emploi par le chemin choisi par `build_request`.
+    Retourne le texte brut du modèle, les tokens consommés, la méthode utilisée et les
+    temps mesurés, ou None si le PDF est vide. Les erreurs de l'API sont propagées.
+    Avec `on_partial`, la réponse est lue en streaming et les champs déjà générés
+    sont transmis au fur et à mesure.
+    """
+    request = build_request(pdf_bytes, job_offer)
+    if request is None:
+        return None
+    return _call_model(request, client, on_partial)
+
+
+def parse_analysis(analysis_text, lenient=False):
+    """
+    Décode et valide la réponse JSON du modèle (avec ou sans bloc ```json) selon
+    analysis_schema.CVAnalysis, scores ramenés dans leur barème. Lève ValueError si la
+    réponse n'est pas un JSON valide ou ne correspond pas au modèle (voir
+    validate_analysis_json pour `lenient`).
+    """
+    from analysis_schema import validate_analysis_json
+    clean = analysis_text.strip()
+    if clean.startswith("```json"):
+        clean = clean[len("```json"):].strip()
+    if clean.endswith("```"):
+        clean = clean[:-3].strip()
+    return validate_analysis_json(clean, lenient=lenient)
+
+
+def parse_partial_analysis(partial_text):
+    """
+    Décode une réponse JSON incomplète (en cours de streaming) et retourne les champs
+    déjà disponibles, ou None. Un nombre en fin de flux est ignoré tant qu'il peut
+    encore s'allonger (« 7 » peut devenir « 75 »).
+    """
+    start = partial_text.find("{")
+    if start < 0:
+        return None
+    clean = partial_text[start:].rstrip().rstrip("0123456789.-+")
+    try:
+        fields = jiter.from_json(clean.encode(), partial_mode="trailing-strings")
+    except ValueError:
+        return None
+    return fields if isinstance(fields, dict) else None
+
+
+def analyze_cv_cached(pdf_bytes, job_offer, job_offer_id, client, force=False, on_partial=None):
+    """
+    Comme `analyze_cv`, mais réutilise le résultat stocké si le même PDF
+    a déjà été analysé pour la même offre, avec le même modèle et le même prompt.
+    Le résultat porte `cached=True` lorsqu'il provient du cache.
+    """
+    cache_key = make_cache_key(pdf_bytes, job_offer_id, MODEL_NAME, PROMPT_HASH)
+    if not force:
+        with span("cache"):
+            cached = get_cached_analysis(cache_key)
+        if cached:
+            cached["cached"] = True
+            return cached
+
+    result = analyze_cv(pdf_bytes, job_offer, client, on_partial)
+    if result:
+        # Une réponse restée invalide n'est pas mise en cache : une nouvelle analyse pourra réussir
+        if result.get("repair", {}).get("repaired", True):
+            store_cached_analysis(cache_key, result)
+        result["cached"] = False
+    return result
+
+
+def analyze_cvs_concurrently(pdf_files, job_offer, client, max_in_flight=4,
+                             job_offer_id=None, force=False, on_partial=None):
+    """
+    Analyse plusieurs CV en parallèle avec au plus `max_in_flight` appels simultanés.
+
+    `pdf_files` est une liste de tuples (filename, pdf_bytes). Le rendu PDF, l'encodage
+    et l'appel au modèle se chevauchent d'un fichier à l'autre. Produit des tuples
+    (index, result, error) dans l'ordre de fin des appels ; `index` est la position
+    du fichier dans `pdf_files` afin que l'appelant puisse restituer l'ordre d'origine.
+
+    Si `job_offer_id` est fourni, les résultats en cache sont produits immédiatement
+    sans occuper de place dans le pool ; `force=True` ignore le cache.
+
+    Les CV en échec pour une erreur transitoire (429, 5xx, disjoncteur ouvert) après
+    les nouvelles tentatives de l'ordonnanceur sont repris une fois en fin de lot.
+
+    Chaque résultat analysé porte `stages`, la durée (ms) de ses étapes (voir timings.py).
+
+    Avec `on_partial(index, fields)`, les réponses sont lues en streaming. Le callback
+    est appelé depuis le thread qui consomme ce générateur (jamais depuis un thread
+    de travail), avec uniquement l'état le plus récent de chaque CV.
+    """
+    if not pdf_files:
+        return
+
+    hits = []
+    to_analyze = []
+    for index, (_, pdf_bytes) in enumerate(pdf_files):
+        cached = None
+        if job_offer_id is not None and not force:
+            cached = get_cached_analysis(make_cache_key(pdf_bytes, job_offer_id, MODEL_NAME, PROMPT_HASH))
+        if cached:
+            cached["cached"] = True
+            hits.append((index, cached))
+        else:
+            to_analyze.append(index)
+
+    # Les threads de travail ne font que déposer des événements ; ils sont traités ici
+    events = queue.SimpleQueue()
+
+    def analyze(index):
+        pdf_bytes = pdf_files[index][1]
+        partial = None
+        if on_partial is not None:
+            def partial(fields):
+                events.put(("partial", index, fields))
+        # Étapes mesurées dans le thread de travail, transmises avec le résultat
+        with recording() as stages, span("total"):
+            if job_offer_id is not None:
+                result = analyze_cv_cached(pdf_bytes, job_offer, job_offer_id, client, force=True,
+                                           on_partial=partial)
+            else:
+                result = analyze_cv(pdf_bytes, job_offer, client, on_partial=partial)
+        if result is not None:
+            result["stages"] = stages
+        return result
+
+    def is_transient(error):
+        return scheduler.is_retryable(error) or isinstance(error, scheduler.CircuitOpenError)
+
+    max_workers = max(1, min(max_in_flight, len(to_analyze)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cv-analysis") as pool:
+        try:
+            pending_indexes = to_analyze
+            for attempt in range(FAILED_ITEM_PASSES + 1):
+                if attempt:
+                    if not pending_indexes:
+                        break
+                    # Reprise en fin de lot : on laisse le disjoncteur se refermer
+                    time.sleep(scheduler.default_scheduler.breaker.seconds_until_retry())
+                for index in pending_indexes:
+                    future = pool.submit(analyze, index)
+                    future.add_done_callback(lambda f, index=index: events.put(("done", index, f)))
+
+                # Les résultats en cache sont produits pendant que les appels sont en cours
+                if attempt == 0:
+                    for index, cached in hits:
+                        yield index, cached, None
+
+                remaining = len(pending_indexes)
+                retry_later = []
+                while remaining:
+                    pending = [events.get()]
+                    while True:
+                        try:
+                            pending.append(events.get_nowait())
+                        except queue.Empty:
+                            break
+
+                    finished = [(index, future) for kind, index, future in pending if kind == "done"]
+                    finished_indexes = {index for index, _ in finished}
+                    latest = {index: fields for kind, index, fields in pending if kind == "partial"}
+                    for index, fields in latest.items():
+                        if index not in finished_indexes:
+                            on_partial(index, fields)
+
+                    for index, future in finished:
+                        remaining -= 1
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # Échec transitoire : le CV est remis en file plutôt que perdu
+                            if attempt < FAILED_ITEM_PASSES and is_transient(e):
+                                retry_later.append(index)
+                                continue
+                            yield index, None, e
+                            continue
+                        yield index, result, None
+                pending_indexes = retry_later
+        except BaseException:
+            # Interruption (Ctrl+C, générateur abandonné) : les analyses pas encore commencées
+            # sont annulées au lieu d'être exécutées (et payées) à la fermeture du pool
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
@@ -0,0 +1,125 @@
+"""
+Modèle de l'analyse d'un CV, source unique du schéma JSON imposé au modèle
+(structured outputs, mode strict) et de la validation des réponses.
+
+Ce module importe pydantic : il est chargé à la première analyse ou au premier
+décodage, pas au démarrage de l'interface.
+"""
+
+import copy
+from typing import List, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+from skills import fold
+
+# Barème : maximum de chaque critère, le score global étant leur somme
+SCORE_MAXIMUMS = {
+    "score_technique": 40,
+    "score_experience": 30,
+    "score_formation": 15,
+    "score_soft_skills": 15,
+}
+RECOMMENDATIONS = ("Recommandé", "À considérer", "Non recommandé")
+SCHEMA_NAME = "analyse_cv"
+
+
+def closest_recommendation(value):
+    """
+    Recommandation autorisée la plus proche d'un texte libre (« Fortement recommandé »,
+    « Recommandé avec réserves »...), comme en produisaient les analyses antérieures au
+    schéma strict ; « À considérer » à défaut.
+    """
+    text = fold(value) if isinstance(value, str) else ""
+    if "consider" in text or "reserve" in text:
+        return "À considérer"
+    if "non recommand" in text or "pas recommand" in text or text.startswith("non"):
+        return "Non recommandé"
+    return "Recommandé" if "recommand" in text else "À considérer"
+
+
+# Champs de l'analyse (pas de docstring : elle serait envoyée au modèle avec le schéma).
+# Les valeurs par défaut ne servent qu'aux analyses anciennes ou importées : le schéma
+# envoyé au modèle rend tous les champs obligatoires.
+class CVAnalysis(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    nom_prenom: str = Field("", description="Nom et prénom du candidat (extrait du CV)")
+    score_technique: int = Field(0, description="Compétences techniques requises, sur 40")
+    score_experience: int = Field(0, description="Expérience pertinente, sur 30")
+    score_formation: int = Field(0, description="Formation et qualifications, sur 15")
+    score_soft_skills: int = Field(0, description="Compétences soft skills, sur 15")
+    score_global: int = Field(0, description="Somme des quatre scores, sur 100")
+    points_forts: List[str] = Field(default_factory=list, description="Points forts du candidat")
+    points_faibles: List[str] = Field(default_factory=list, description="Points faibles ou manques")
+    competences_matchees: List[str] = Field(default_factory=list, description="Compétences qui correspondent à l'offre")
+    competences_manquantes: List[str] = Field(default_factory=list, description="Compétences requises mais absentes")
+    experience_pertinente: str = Field("", description="Description détaillée de l'expérience pertinente")
+    recommandation: Literal[RECOMMENDATIONS] = Field("À considérer")
+    commentaires: str = Field("", description="Analyse détaillée du profil")
+    pages_analysees: int = Field(0, description="Nombre de pages du CV")
+
+    @field_validator("score_technique", "score_experience", "score_formation", "score_soft_skills")
+    @classmethod
+    def clamp_score(cls, value, info):
+        """Ramène chaque score dans son barème (un 45/40 devient 40/40)."""
+        return min(max(value, 0), SCORE_MAXIMUMS[info.field_name])
+
+    @field_validator("recommandation", mode="before")
+    @classmethod
+    def lenient_recommendation(cls, value, info):
+        """En validation tolérante (import), une valeur hors liste est ramenée à la plus proche."""
+        if (info.context or {}).get("lenient") and value not in RECOMMENDATIONS:
+            return closest_recommendation(value)
+        return value
+
+    @model_validator(mode="after")
+    def recompute_global(self):
+        """Le score global est la somme des critères, une fois ramenés dans leur barème."""
+        self.score_global = sum(getattr(self, name) for name in SCORE_MAXIMUMS)
+        return self
+
+
+def _strict(schema):
+    """Adapte un schéma pydantic au mode strict : champs tous obligatoires, sans défaut ni extra."""
+    if isinstance(schema, dict):
+        schema.pop("default", None)
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["required"] = list(schema["properties"])
+            schema["additionalProperties"] = False
+        for value in schema.values():
+            _strict(value)
+    elif isinstance(schema, list):
+        for value in schema:
+            _strict(value)
+    return schema
+
+
+_RESPONSE_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": SCHEMA_NAME,
+        "strict": True,
+        "schema": _strict(copy.deepcopy(CVAnalysis.model_json_schema())),
+    }
+}
+
+
+def response_format():
+    """Paramètre `text` de l'API Responses imposant le schéma de CVAnalysis."""
+    return copy.deepcopy(_RESPONSE_FORMAT)
+
+
+def validate_analysis_json(json_text, lenient=False):
+    """
+    Décode et valide une réponse JSON : dict des champs de CVAnalysis, scores ramenés
+    dans le barème. Lève pydantic.ValidationError (une ValueError) si le JSON est
+    invalide ou ne correspond pas au modèle. Avec `lenient`, une recommandation hors
+    liste est ramenée à la plus proche au lieu d'être refusée.
+    """
+    return CVAnalysis.model_validate_json(json_text, context={"lenient": lenient}).model_dump()
+
+
+def validate_analysis(data, lenient=False):
+    """Valide une analyse déjà décodée (dict), comme validate_analysis_json."""
+    return CVAnalysis.model_validate(data, context={"lenient": lenient}).model_dump()
@@ -0,0 +1,192 @@
+"""
+Analyse en ligne de commande (sans Streamlit) d'un lot de CV pour une offre d'emploi,
+avec plusieurs analyses en parallèle. L'avancement est enregistré en base : une
+exécution interrompue reprend là où elle s'était arrêtée, sans repayer les CV déjà
+analysés.
+
+Usage :
+    python analyze.py --title "Développeur Python" --offer offre.txt cvs/ [--workers 8]
+    python analyze.py --title "Développeur Python" --offer offre.txt "cvs/**/*.pdf"
+
+Pour tester sans coût, pointer OPENAI_BASE_URL vers benchmarks/fake_openai.py.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import config
+import scheduler
+from analysis import analyze_cvs_concurrently, get_client, parse_analysis, usage_record, prompt_cache_summary
+from db import (init_db, save_job_offer, get_open_run, create_run, add_run_items, get_run_items,
+                insert_run_analyses, mark_run_item_failed, finish_run, insert_timings, BufferedWriter, FLUSH_ROWS)
+from timings import recording, span
+
+# Nombre de fichiers lus en mémoire par analyse simultanée (les PDF sont lus par tranche)
+FILES_PER_WORKER = 8
+
+
+def collect_pdfs(inputs):
+    """Chemins absolus des PDF désignés par des dossiers, des fichiers ou des motifs glob."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item, recursive=True)
+        paths.update(os.path.abspath(path) for path in candidates
+                     if path.lower().endswith(".pdf") and os.path.isfile(path))
+    return sorted(paths)
+
+
+def run_analysis(client, title, job_offer, paths, workers, force=False):
+    """
+    Analyse les fichiers `paths` pour l'offre, en reprenant l'exécution non terminée de
+    cette offre s'il y en a une. Retourne les statistiques de l'exécution.
+    """
+    job_offer_id = save_job_offer(title, job_offer)
+    run_id = get_open_run(job_offer_id)
+    if run_id is None:
+        run_id = create_run(job_offer_id)
+        print(f"🆕 Exécution {run_id} pour l'offre {job_offer_id}")
+    else:
+        print(f"⏯️ Reprise de l'exécution {run_id} pour l'offre {job_offer_id}")
+    add_run_items(run_id, paths)
+
+    todo = [path for path, *_ in get_run_items(run_id, statuses=("pending", "failed"))]
+    total = len(get_run_items(run_id))
+    position = total - len(todo)
+    if position:
+        print(f"⏭️ {position} CV déjà analysés lors d'un passage précédent")
+
+    def save(items):
+        """Écrit un lot d'analyses terminées ; la durée de l'écriture est répartie entre elles."""
+        write_start = time.perf_counter()
+        analysis_ids = insert_run_analyses(run_id, [item[:-1] for item in items])
+        share_ms = (time.perf_counter() - write_start) * 1000 / len(items)
+        timed = []
+        for analysis_id, (*_, stages) in zip(analysis_ids, items):
+            if analysis_id is not None:
+                stages["db_write"] = share_ms
+                stages["total"] = stages.get("total", 0.0) + share_ms
+                timed.append((analysis_id, stages))
+        if timed:
+            insert_timings(timed)
+
+    stats = {"run_id": run_id, "analyzed": 0, "cached": 0, "failed": 0, "tokens": 0}
+    # Tokens et temps de réponse des appels, pour le taux de lecture du cache de prompt
+    calls = []
+    start = time.perf_counter()
+    chunk_size = workers * FILES_PER_WORKER
+    # Les analyses sont enregistrées par lots : un arrêt brutal en perd au plus FLUSH_ROWS,
+    # dont les réponses restent en cache pour la reprise
+    with BufferedWriter(save, max_rows=FLUSH_ROWS) as writer:
+        for offset in range(0, len(todo), chunk_size):
+            chunk, pdf_files = [], []
+            for path in todo[offset:offset + chunk_size]:
+                try:
+                    with open(path, "rb") as f:
+                        pdf_files.append((os.path.basename(path), f.read()))
+                except OSError as e:
+                    mark_run_item_failed(run_id, path, str(e))
+                    stats["failed"] += 1
+                    print(f"❌ {path} : {e}")
+                    continue
+                chunk.append(path)
+
+            for index, result, error in analyze_cvs_concurrently(
+                pdf_files, job_offer, client, max_in_flight=workers, job_offer_id=job_offer_id, force=force
+            ):
+                path, filename = chunk[index], pdf_files[index][0]
+                position += 1
+                if error is not None:
+                    mark_run_item_failed(run_id, path, str(error))
+                    stats["failed"] += 1
+                    print(f"❌ [{position}/{total}] {filename} : {error}")
+                    continue
+                # Étapes du thread d'analyse, complétées par le décodage puis par l'écriture (save)
+                with recording() as stages, span("total"):
+                    stages.update(result.get("stages", {}))
+                    try:
+                        with span("parse"):
+                            parsed = parse_analysis(result["content"])
+                    except ValueError:
+                        parsed = None
+                if parsed is None:
+                    mark_run_item_failed(run_id, path, "réponse invalide")
+                    stats["failed"] += 1
+                    print(f"❌ [{position}/{total}] {filename} : réponse invalide")
+                    continue
+
+                parsed["methode_analyse"] = result.get("method")
+                # Les résultats en cache n'ont rien coûté lors de cette exécution
+                tokens = 0 if result.get("cached") else result["tokens"]["total"]
+                writer.add((path, filename, parsed, job_offer_id, tokens, usage_record(result), stages))
+                stats["analyzed"] += 1
+                stats["cached"] += bool(result.get("cached"))
+                stats["tokens"] += tokens
+                calls.append({key: result.get(key) for key in ("tokens", "timings", "cached")})
+                source = " (cache)" if result.get("cached") else ""
+                print(f"✅ [{position}/{total}] {filename} : {parsed.get('score_global', 0)}/100{source}")
+
+    stats["elapsed"] = time.perf_counter() - start
+    stats["prompt_cache"] = prompt_cache_summary(calls)
+    if not get_run_items(run_id, statuses=("pending", "failed")):
+        finish_run(run_id)
+    return stats
+
+
+def print_summary(stats):
+    elapsed = max(stats["elapsed"], 1e-9)
+    processed = stats["analyzed"] + stats["failed"]
+    print(f"\n📊 {stats['analyzed']} CV analysés ({stats['cached']} depuis le cache), "
+          f"{stats['failed']} échec(s) en {stats['elapsed']:.1f} s")
+    print(f"📈 Débit : {processed * 60 / elapsed:.1f} CV/min, {stats['tokens'] * 60 / elapsed:.0f} tokens/min "
+          f"({stats['tokens']} tokens au total)")
+    prompt_cache = stats["prompt_cache"]
+    if prompt_cache["requests"]:
+        latency = ""
+        if prompt_cache["latency_hit_ms"] is not None and prompt_cache["latency_miss_ms"] is not None:
+            latency = (f", réponse en {prompt_cache['latency_hit_ms']:.0f} ms avec préfixe en cache "
+                       f"contre {prompt_cache['latency_miss_ms']:.0f} ms sans")
+        print(f"🧠 Cache de prompt : {prompt_cache['hit_rate']:.0%} des tokens d'entrée "
+              f"({prompt_cache['cached_tokens']}/{prompt_cache['prompt_tokens']}), "
+              f"{prompt_cache['hits']}/{prompt_cache['requests']} requête(s){latency}")
+    if stats["failed"]:
+        print(f"🔁 Relancez la même commande pour retenter les échecs (exécution {stats['run_id']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--title", required=True, help="Titre de l'offre d'emploi")
+    parser.add_argument("--offer", required=True, help="Fichier texte de l'offre d'emploi")
+    parser.add_argument("--workers", type=int, default=config.MAX_CONCURRENT_ANALYSES,
+                        help="Nombre d'analyses simultanées")
+    parser.add_argument("--force", action="store_true", help="Ignorer le cache et ré-analyser")
+    parser.add_argument("--rpm", type=int, default=scheduler.DEFAULT_REQUESTS_PER_MINUTE,
+                        help="Limite de requêtes par minute du compte")
+    parser.add_argument("--tpm", type=int, default=scheduler.DEFAULT_TOKENS_PER_MINUTE,
+                        help="Limite de tokens par minute du compte")
+    parser.add_argument("inputs", nargs="+", help="Dossiers, fichiers PDF ou motifs glob")
+    args = parser.parse_args()
+
+    paths = collect_pdfs(args.inputs)
+    if not paths:
+        sys.exit("⚠️ Aucun fichier PDF trouvé")
+    with open(args.offer, encoding="utf-8") as f:
+        job_offer = f.read()
+
+    init_db()
+    scheduler.configure(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    client = get_client(max_retries=0)  # les nouvelles tentatives sont gérées par scheduler.py
+    try:
+        stats = run_analysis(client, args.title, job_offer, paths, max(1, args.workers), force=args.force)
+    except KeyboardInterrupt:
+        sys.exit("\n⏸️ Interrompu : relancez la même commande pour reprendre")
+    print_summary(stats)
+
+
+if __name__ == "__main__":
+    main()
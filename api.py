@@ -0,0 +1,363 @@
+"""
+Service HTTP (tornado) pour soumettre des CV depuis un ATS et récupérer les résultats.
+Les CV sont mis dans la file de travaux et analysés par worker.py : l'envoi répond
+immédiatement avec l'ID du lot, à interroger ensuite.
+
+Routes :
+    GET  /api/health                        état du service et nombre de workers actifs
+    POST /api/offers                        {"title": ..., "content": ...} -> {"id": ...}
+    GET  /api/offers/<id>/ranking?limit=20  classement des candidats de l'offre
+    POST /api/offers/<id>/cvs[?force=1]     multipart/form-data (un ou plusieurs PDF), ou un
+                                            corps application/pdf avec ?filename=cv.pdf
+                                            -> 202 {"job_id": ...}
+    GET  /api/jobs/<id>                     état du lot et résultats des CV terminés
+    GET  /api/metrics[?format=json]         durée des étapes d'analyse (p50/p95/p99) sur la
+                                            dernière heure, au format texte Prometheus ou JSON
+
+Usage :
+    python api.py [--port 8000] [--max-upload-mb 50]
+    curl -F cv=@cv1.pdf -F cv=@cv2.pdf http://127.0.0.1:8000/api/offers/<id>/cvs
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+
+import tornado.web
+from tornado.httputil import HTTPHeaders
+
+import config
+import timings
+from analysis import parse_analysis
+from db import (init_db, save_job_offer, get_job_offer, get_analyses_by_job_offer, enqueue_job,
+                get_job, get_job_tasks, count_live_workers, get_stage_durations, get_parse_failure_stats)
+from worker import ensure_worker, HEARTBEAT_SECONDS
+
+DEFAULT_PORT = 8000
+# Les accès SQLite (bloquants) sont exécutés hors de la boucle d'événements
+DB_THREADS = 8
+MAX_FILES_PER_UPLOAD = 200
+MAX_FIELD_BYTES = 1024
+RANKING_DEFAULT_LIMIT = 20
+# Fenêtre glissante des métriques exportées (secondes)
+METRICS_WINDOW_SECONDS = 3600
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="api-db")
+
+
+def run_db(fn, *args):
+    """Exécute un accès à la base dans le pool dédié ; à attendre avec await."""
+    return asyncio.get_running_loop().run_in_executor(_db_executor, fn, *args)
+
+
+class MultipartStream:
+    """
+    Découpage incrémental d'un corps multipart/form-data, alimenté morceau par morceau :
+    seule la fin du tampon (longueur du délimiteur) est conservée entre deux morceaux.
+    Les parties avec un nom de fichier sont conservées dans `files`, les autres
+    (courtes) dans `fields`.
+    """
+
+    def __init__(self, boundary):
+        self.delimiter = b"\r\n--" + boundary
+        # Le premier délimiteur n'est pas précédé d'un saut de ligne
+        self.buffer = b"\r\n"
+        self.state = "preamble"
+        self.part = None
+        self.files = []
+        self.fields = {}
+        self.error = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while self.error is None:
+            if self.state in ("preamble", "body"):
+                index = self.buffer.find(self.delimiter)
+                if index < 0:
+                    keep = len(self.delimiter) + 2
+                    if len(self.buffer) > keep:
+                        self._write(self.buffer[:-keep])
+                        self.buffer = self.buffer[-keep:]
+                    return
+                self._write(self.buffer[:index])
+                rest = self.buffer[index + len(self.delimiter):]
+                if len(rest) < 2:
+                    self.buffer = self.buffer[index:]
+                    return
+                self._end_part()
+                if rest.startswith(b"--"):
+                    self.state = "done"
+                    return
+                self.buffer = rest
+                self.state = "headers"
+            elif self.state == "headers":
+                end = self.buffer.find(b"\r\n\r\n")
+                if end < 0:
+                    return
+                self._start_part(HTTPHeaders.parse(self.buffer[2:end].decode("utf-8", "replace")))
+                self.buffer = self.buffer[end + 4:]
+                self.state = "body"
+            else:
+                return
+
+    def _start_part(self, headers):
+        disposition = Message()
+        disposition["Content-Disposition"] = headers.get("Content-Disposition", "")
+        name = disposition.get_param("name", header="content-disposition")
+        filename = disposition.get_filename()
+        if filename is not None:
+            if len(self.files) >= MAX_FILES_PER_UPLOAD:
+                self.error = f"Au plus {MAX_FILES_PER_UPLOAD} fichiers par envoi"
+                return
+            self.part = (os.path.basename(filename), bytearray(), True)
+        else:
+            self.part = (name, bytearray(), False)
+
+    def _write(self, data):
+        if self.state != "body" or self.part is None:
+            return
+        name, content, is_file = self.part
+        if not is_file and len(content) + len(data) > MAX_FIELD_BYTES:
+            self.error = f"Champ « {name} » trop long"
+            return
+        content += data
+
+    def _end_part(self):
+        if self.part is None:
+            return
+        name, content, is_file = self.part
+        if is_file:
+            self.files.append((name, bytes(content)))
+        elif name:
+            self.fields[name] = content.decode("utf-8", "replace")
+        self.part = None
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def prepare(self):
+        if config.API_TOKEN and self.request.headers.get("Authorization") != f"Bearer {config.API_TOKEN}":
+            raise tornado.web.HTTPError(401, reason="Jeton d'API invalide")
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+    def json_body(self):
+        try:
+            return json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Corps JSON invalide")
+
+
+class HealthHandler(BaseHandler):
+    async def get(self):
+        workers = await run_db(count_live_workers, 3 * HEARTBEAT_SECONDS)
+        self.write({"status": "ok", "workers": workers})
+
+
+class OffersHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        title, content = str(body.get("title", "")).strip(), str(body.get("content", "")).strip()
+        if not title or not content:
+            raise tornado.web.HTTPError(400, reason="Les champs « title » et « content » sont requis")
+        job_offer_id = await run_db(save_job_offer, title, content)
+        self.set_status(201)
+        self.write({"id": job_offer_id})
+
+
+class RankingHandler(BaseHandler):
+    async def get(self, job_offer_id):
+        try:
+            limit = int(self.get_query_argument("limit", RANKING_DEFAULT_LIMIT))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Paramètre « limit » invalide")
+        offer = await run_db(get_job_offer, job_offer_id)
+        if offer is None:
+            raise tornado.web.HTTPError(404, reason="Offre introuvable")
+        rows = await run_db(get_analyses_by_job_offer, job_offer_id, max(1, limit))
+        self.write({
+            "job_offer_id": job_offer_id,
+            "title": offer[1],
+            "candidates": [{
+                "rank": rank,
+                "nom_prenom": nom,
+                "filename": filename,
+                "score_global": score_global,
+                "score_technique": score_technique,
+                "score_experience": score_experience,
+                "score_formation": score_formation,
+                "score_soft_skills": score_soft,
+                "commentaire": commentaire,
+                "date": date,
+            } for rank, (nom, score_global, score_technique, score_experience, score_formation,
+                         score_soft, commentaire, date, filename) in enumerate(rows, start=1)]
+        })
+
+
+@tornado.web.stream_request_body
+class UploadHandler(BaseHandler):
+    """
+    Envoi de CV lu au fil de l'eau : la taille est bornée (413 dès l'en-tête
+    Content-Length ; un envoi par morceaux trop long est interrompu par tornado).
+    """
+
+    def prepare(self):
+        super().prepare()
+        max_bytes = self.settings["max_upload_bytes"]
+        self.request.connection.set_max_body_size(max_bytes)
+        try:
+            content_length = int(self.request.headers.get("Content-Length", 0))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="En-tête Content-Length invalide")
+        if content_length > max_bytes:
+            raise tornado.web.HTTPError(413, reason=f"Envoi limité à {max_bytes // (1024 * 1024)} Mo")
+
+        content_type = self.request.headers.get("Content-Type", "")
+        self.multipart = None
+        self.raw = None
+        if content_type.startswith("multipart/form-data"):
+            boundary = Message()
+            boundary["Content-Type"] = content_type
+            if not boundary.get_param("boundary"):
+                raise tornado.web.HTTPError(400, reason="Délimiteur multipart manquant")
+            self.multipart = MultipartStream(boundary.get_param("boundary").encode())
+        elif content_type.split(";")[0].strip() == "application/pdf":
+            self.raw = bytearray()
+        else:
+            raise tornado.web.HTTPError(415, reason="Envoyez du multipart/form-data ou application/pdf")
+
+    def data_received(self, chunk):
+        if self.multipart is not None:
+            self.multipart.feed(chunk)
+        else:
+            self.raw += chunk
+
+    async def post(self, job_offer_id):
+        if self.multipart is not None:
+            if self.multipart.error:
+                raise tornado.web.HTTPError(400, reason=self.multipart.error)
+            pdf_files = self.multipart.files
+        else:
+            pdf_files = [(os.path.basename(self.get_query_argument("filename", "cv.pdf")), bytes(self.raw))]
+        if not pdf_files:
+            raise tornado.web.HTTPError(400, reason="Aucun fichier reçu")
+        invalid = [filename for filename, data in pdf_files if not data.startswith(b"%PDF")]
+        if invalid:
+            raise tornado.web.HTTPError(400, reason=f"Fichiers non PDF : {', '.join(invalid)}")
+
+        if await run_db(get_job_offer, job_offer_id) is None:
+            raise tornado.web.HTTPError(404, reason="Offre introuvable")
+        force = self.get_query_argument("force", "0") in ("1", "true")
+        job_id = await run_db(enqueue_job, job_offer_id, pdf_files, force)
+        if config.AUTOSTART_WORKER:
+            await run_db(ensure_worker)
+        self.set_status(202)
+        self.write({"job_id": job_id, "tasks": len(pdf_files), "status_url": f"/api/jobs/{job_id}"})
+
+
+def _parse_results(rows):
+    """
+    Analyses validées des tâches terminées (None pour les autres), décodées dans le pool
+    plutôt que dans la boucle d'événements ; un résultat enregistré qui ne correspond
+    plus au modèle est remplacé par une ValueError.
+    """
+    analyses = []
+    for *_, result in rows:
+        try:
+            analyses.append(parse_analysis(result["content"]) if result else None)
+        except ValueError as e:
+            analyses.append(e)
+    return analyses
+
+
+class JobHandler(BaseHandler):
+    async def get(self, job_id):
+        job = await run_db(get_job, int(job_id))
+        if job is None:
+            raise tornado.web.HTTPError(404, reason="Lot introuvable")
+        _, job_offer_id, _, _, created_at, finished_at = job
+        tasks = []
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        rows = await run_db(get_job_tasks, int(job_id))
+        analyses = await run_db(_parse_results, rows)
+        for (position, filename, status, attempts, error, _, result), analysis in zip(rows, analyses):
+            counts[status] += 1
+            task = {"position": position, "filename": filename, "status": status, "attempts": attempts}
+            if error:
+                task["error"] = error
+            if isinstance(analysis, ValueError):
+                task["error"] = "Réponse invalide"
+            elif result:
+                task["analysis"] = analysis
+                task["cached"] = result.get("cached", False)
+                task["tokens"] = result["tokens"]
+            tasks.append(task)
+        self.write({
+            "id": int(job_id),
+            "job_offer_id": job_offer_id,
+            "status": "finished" if finished_at is not None else "running",
+            "created_at": created_at,
+            "finished_at": finished_at,
+            "counts": counts,
+            "tasks": tasks,
+        })
+
+
+class MetricsHandler(BaseHandler):
+    async def get(self):
+        since = time.time() - METRICS_WINDOW_SECONDS
+        summary = timings.summarize(await run_db(get_stage_durations, since))
+        analyses = next((stats["count"] for stats in summary if stats["stage"] == "total"), 0)
+        workers = await run_db(count_live_workers, 3 * HEARTBEAT_SECONDS)
+        invalid, repaired, tokens_saved, _ = await run_db(get_parse_failure_stats, since)
+        if self.get_query_argument("format", "prometheus") == "json":
+            self.write({"window_seconds": METRICS_WINDOW_SECONDS, "analyses": analyses,
+                        "workers": workers, "stages": summary,
+                        "invalid_responses": {"count": invalid, "repaired": repaired, "tokens_saved": tokens_saved}})
+            return
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(timings.prometheus_text(summary, {
+            "cv_analyses_last_hour": analyses,
+            "cv_live_workers": workers,
+            "cv_invalid_responses_last_hour": invalid,
+            "cv_repaired_responses_last_hour": repaired,
+            "cv_repair_tokens_saved_last_hour": tokens_saved,
+        }))
+
+
+def make_app(max_upload_bytes=config.API_MAX_UPLOAD_MB * 1024 * 1024):
+    return tornado.web.Application([
+        (r"/api/health", HealthHandler),
+        (r"/api/offers", OffersHandler),
+        (r"/api/offers/([^/]+)/ranking", RankingHandler),
+        (r"/api/offers/([^/]+)/cvs", UploadHandler),
+        (r"/api/jobs/([0-9]+)", JobHandler),
+        (r"/api/metrics", MetricsHandler),
+    ], max_upload_bytes=max_upload_bytes)
+
+
+async def serve(port, max_upload_bytes):
+    init_db()
+    make_app(max_upload_bytes).listen(port, max_body_size=max_upload_bytes)
+    print(f"🌐 API à l'écoute sur http://127.0.0.1:{port}/api (Ctrl+C pour arrêter)")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-upload-mb", type=int, default=config.API_MAX_UPLOAD_MB,
+                        help="Taille maximale d'un envoi de CV (Mo)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port, args.max_upload_mb * 1024 * 1024))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,41 @@
 import streamlit as st
-from db import (init_db, insert_analysis, get_all_analyses, 
+from db import (init_db, query_analyses, get_analyses_summary,
                 save_job_offer, get_analyses_by_job_offer, 
-                get_all_job_offers, get_job_offer_stats)
-import openai
+                get_all_job_offers, get_job_offer_stats, get_score_distribution,
+                enqueue_job, get_job, get_job_tasks, requeue_failed_tasks, count_live_workers,
+                get_stage_durations, get_throughput, get_slowest_analyses, get_usage_rollup,
+                get_parse_failure_stats, search_analyses, get_skill_counts, get_skills,
+                HISTORY_PAGE_SIZE, HISTORY_SORTS)
 import json
+import time
 from datetime import datetime
-import base64
-from io import BytesIO
 from dotenv import load_dotenv
 import config
-from utils import pdf_to_images_from_bytes
-
-PRICE_INPUT  = 0.00025
-PRICE_OUTPUT = 0.00200
+from analysis import parse_analysis, estimate_cost, prompt_cache_summary, MODEL_NAME
+from worker import ensure_worker, HEARTBEAT_SECONDS
+from timings import summarize
+
+# Intervalle de rafraîchissement du suivi d'un lot en cours (secondes)
+JOB_POLL_SECONDS = 2
+
+# Page « Performance » : libellé des étapes mesurées (timings.py) et périodes affichées
+# (durée en secondes, None pour tout l'historique ; intervalle du graphique de débit)
+STAGE_LABELS = {
+    "cache": "Recherche en cache",
+    "text_layer": "Couche texte",
+    "render": "Rendu PDF",
+    "encode": "Encodage des images",
+    "llm": "Appel au modèle",
+    "parse": "Décodage et validation",
+    "db_write": "Écriture en base",
+    "total": "Total par CV",
+}
+PERFORMANCE_PERIODS = {
+    "Dernière heure": (3600, 60),
+    "24 dernières heures": (24 * 3600, 15 * 60),
+    "7 derniers jours": (7 * 24 * 3600, 3600),
+    "Tout l'historique": (None, 24 * 3600),
+}
 
 api_key = config.OPENAI_API_KEY
 load_dotenv()
@@ -24,109 +47,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def initialize_openai():
-    api_key = config.OPENAI_API_KEY
-    if not api_key:
-        st.error("⚠️ Clé API OpenAI non configurée.")
-        st.stop()
-    openai.api_key = api_key
-    return openai  
-
-def analyze_cv_with_vision(pdf_bytes, job_offer, client):
-    images = pdf_to_images_from_bytes(pdf_bytes)
-    if not images:
-        return None
-
-    prompt_text = f"""
-Vous êtes un expert RH très exigeant. 
-Votre mission : analyser le CV en fonction de l’offre d’emploi fournie.
-
-⚠️ Règles strictes :
-- Le JSON doit contenir **exactement et uniquement** les champs suivants, sans en ajouter d'autres.
-- Les champs numériques doivent rester des nombres (pas de texte).
-- Les détails et explications doivent être intégrés **uniquement** dans les champs texte comme "commentaires" ou "experience_pertinente".
-- N'utilisez pas de sous-objets ou de champs imbriqués.
-
-Champs attendus dans le JSON final :
-{{
-  "nom_prenom": "Nom et prénom du candidat (extrait du CV)",
-  "score_technique": [nombre sur 40],
-  "score_experience": [nombre sur 30],
-  "score_formation": [nombre sur 15],
-  "score_soft_skills": [nombre sur 15],
-  "score_global": [nombre sur 100],
-  "points_forts": ["liste des points forts du candidat"],
-  "points_faibles": ["liste des points faibles ou manques"],
-  "competences_matchees": ["compétences qui correspondent à l'offre"],
-  "competences_manquantes": ["compétences requises mais absentes"],
-  "experience_pertinente": "description détaillée de l'expérience pertinente",
-  "recommandation": "Recommandé / À considérer / Non recommandé",
-  "commentaires": "analyse détaillée du profil",
-  "pages_analysees": {len(images)},
-  "methode_analyse": "GPT-5 "
-}}
-
-Critères de notation :
-- Compétences techniques requises : 40 points max
-- Expérience pertinente : 30 points max
-- Formation et qualifications : 15 points max
-- Compétences soft skills : 15 points max
-
-Voici l'offre d'emploi à analyser :
-{job_offer}
-"""
-
-    content_parts = []
-    for img in images:
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-        content_parts.append({
-            "type": "input_image",
-            "image_url": f"data:image/png;base64,{img_base64}"
-        })
-
-    content_parts.append({
-        "type": "input_text",
-        "text": prompt_text
-    })
-
-    try:
-        response = client.responses.create(
-    model="gpt-5-mini",
-    reasoning={"effort": "minimal"},
-    input=[
-        {
-            "role": "user",
-            "content": content_parts
-        }
-    ]
-)
-
-
-        usage = response.usage
-        return {
-            "content": response.output_text,
-            "tokens": {
-                "prompt": usage.input_tokens,
-                "completion": usage.output_tokens,
-                "total": usage.total_tokens
-            }
-        }
-
-    except Exception as e:
-        st.error(f"❌ Erreur GPT-5 Vision : {e}")
-        return None
-
-def display_analysis(analysis_text, filename):
+def display_analysis(analysis_text, filename, methode=None):
     """Affiche l'analyse de manière structurée, avec tous les sous-scores."""
     try:
-        clean = analysis_text.strip()
-        if clean.startswith("```json"):
-            clean = clean[len("```json"):].strip()
-        if clean.endswith("```"):
-            clean = clean[:-3].strip()
-        analysis = json.loads(clean)
+        analysis = parse_analysis(analysis_text)
+        # La méthode réellement utilisée (texte ou vision) prime sur celle déclarée par le modèle
+        if methode:
+            analysis["methode_analyse"] = methode
 
         st.header(f"📊 Analyse de {filename}")
 
@@ -205,21 +132,225 @@ def display_analysis(analysis_text, filename):
 
         return analysis
 
-    except json.JSONDecodeError:
+    except ValueError:
         st.error("❌ Erreur lors du parsing de l'analyse JSON")
         st.text_area("Analyse brute :", analysis_text, height=300)
         return None
 
+def display_partial_analysis(fields, filename):
+    """Affiche une analyse en cours de génération avec les champs déjà reçus."""
+    st.header(f"⏳ Analyse de {filename} en cours...")
+
+    score_global = fields.get("score_global")
+    if isinstance(score_global, (int, float)):
+        st.subheader(f"🎯 Score Global : {score_global}/100")
+        st.progress(min(max(score_global / 100, 0.0), 1.0))
+
+    cols = st.columns(4)
+    for col, (key, label, maximum) in zip(cols, [
+        ("score_technique", "Technique", 40),
+        ("score_experience", "Expérience", 30),
+        ("score_formation", "Formation", 15),
+        ("score_soft_skills", "Soft skills", 15),
+    ]):
+        if key in fields:
+            col.metric(label, f"{fields[key]}/{maximum}")
+
+    if fields.get("recommandation"):
+        st.subheader("✅ Recommandation")
+        st.write(f"**{fields['recommandation']}**")
+
+    col1, col2 = st.columns(2)
+    for col, (key, title) in [
+        (col1, ("points_forts", "💪 Points Forts")),
+        (col1, ("competences_matchees", "✅ Compétences Matchées")),
+        (col2, ("points_faibles", "⚠️ Points Faibles")),
+        (col2, ("competences_manquantes", "❌ Compétences Manquantes")),
+    ]:
+        if fields.get(key):
+            with col:
+                st.subheader(title)
+                for item in fields[key]:
+                    st.write(f"• {item}")
+
+    if fields.get("experience_pertinente"):
+        st.subheader("💼 Expérience Pertinente")
+        st.write(fields["experience_pertinente"])
+    if fields.get("commentaires"):
+        st.subheader("📝 Commentaires Détaillés")
+        st.write(fields["commentaires"])
+
+def render_result(filename, result):
+    """Affiche le résultat d'un CV (déjà enregistré par le worker). Retourne l'entrée d'export."""
+
+    analysis_text = result["content"]
+    tokens_used   = result["tokens"]
+    from_cache    = result.get("cached", False)
+
+    # Un résultat en cache ne déclenche aucun appel facturé
+    cost_cv = 0.0 if from_cache else estimate_cost(tokens_used)
+
+    if from_cache:
+        st.success(f"✅ Analyse récupérée depuis le cache pour {filename}")
+    else:
+        st.success(f"✅ Analyse terminée pour {filename}")
+    parsed = display_analysis(analysis_text, filename, result.get("method"))
+
+    st.info(
+        f"🧮 **Tokens** : {tokens_used['total']}  "
+        f"(prompt {tokens_used['prompt']} dont {tokens_used.get('cached', 0)} en cache / "
+        f"completion {tokens_used['completion']})  "
+        f"— **Coût estimé : ${cost_cv:.4f}**"
+    )
+    timings = result.get("timings")
+    if timings:
+        if timings.get("first_field_ms") is not None:
+            st.caption(
+                f"⏱️ Premier champ affiché après {timings['first_field_ms']} ms, "
+                f"réponse complète en {timings['total_ms']} ms"
+            )
+        else:
+            st.caption(f"⏱️ Réponse complète en {timings['total_ms']} ms")
+    payload = result.get("payload")
+    if payload:
+        with st.expander("📦 Charge utile des images"):
+            st.table([{
+                "Page": page_no,
+                "Format": page["format"],
+                "Octets": page["bytes"],
+                "Tokens estimés": page["tokens"],
+                "Tokens sans optimisation": page["original_tokens"]
+            } for page_no, page in enumerate(payload, start=1)])
+    st.markdown("---")
+
+    return {
+        "filename": filename,
+        "analysis": parsed if parsed else analysis_text,
+        "tokens":   tokens_used,
+        "cost_usd": cost_cv,
+        "cached":   from_cache
+    }
+
+def usage_rows(rollup, key_label, format_key):
+    """Lignes d'affichage des agrégats de consommation (db.get_usage_rollup)."""
+    return [{
+        key_label: format_key(key, title),
+        "CV analysés": nb,
+        "Tokens prompt": prompt,
+        "Tokens completion": completion,
+        "Tokens en cache": cached,
+        "Cache de prompt (%)": round(100 * cached / prompt, 1) if prompt else None,
+        "Coût ($)": round(cost, 4),
+        "Coût / CV ($)": round(cost / nb, 4),
+        "Latence moyenne (s)": round(latency_ms / 1000, 2) if latency_ms is not None else None,
+        "Pages / CV": round(pages, 1) if pages is not None else None,
+    } for key, title, nb, prompt, completion, cached, cost, latency_ms, pages in rollup]
+
+def show_job(job_id):
+    """Suivi d'un lot mis en file : progression et résultats, rafraîchis tant qu'il n'est pas terminé."""
+    job = get_job(job_id)
+    if job is None:
+        st.warning(f"⚠️ Lot {job_id} introuvable")
+        return
+    _, job_offer_id, title, job_offer, _, finished_at = job
+    finished = finished_at is not None
+
+    @st.fragment(run_every=None if finished else JOB_POLL_SECONDS)
+    def job_view():
+        tasks = get_job_tasks(job_id)
+        counts = {}
+        for task in tasks:
+            counts[task[2]] = counts.get(task[2], 0) + 1
+        total = len(tasks)
+        done, failed = counts.get("done", 0), counts.get("failed", 0)
+        running, pending = counts.get("running", 0), counts.get("pending", 0)
+        if not finished and not running and not pending:
+            # Lot terminé depuis le dernier rafraîchissement : affichage définitif
+            st.rerun()
+
+        st.header(f"📊 Résultats de l'analyse — {title or 'offre'} (lot {job_id})")
+        st.progress((done + failed) / total if total else 1.0)
+        if finished:
+            st.success(f"✅ Analyse terminée : {done}/{total} CV analysé(s), {failed} échec(s)")
+        else:
+            st.info(f"⏳ {done + failed}/{total} terminé(s) — {running} en cours, {pending} en attente. "
+                    "Vous pouvez quitter la page : l'analyse continue en arrière-plan.")
+            if config.AUTOSTART_WORKER:
+                worker_available = ensure_worker()
+            else:
+                worker_available = count_live_workers(3 * HEARTBEAT_SECONDS) > 0
+            if not worker_available:
+                st.warning("⚠️ Aucun worker actif : lancez `python worker.py`")
+
+        analyses = []
+        results = []
+        for _, filename, status, attempts, error, partial, result in tasks:
+            if status == "done":
+                analyses.append(render_result(filename, result))
+                results.append(result)
+            elif status == "failed":
+                st.error(f"❌ Échec de l'analyse pour {filename} ({attempts} tentative(s)) : {error}")
+            elif status == "running" and partial:
+                display_partial_analysis(partial, filename)
+                st.markdown("---")
+            elif status == "running":
+                st.info(f"⏳ Analyse de {filename} en cours...")
+
+        if not finished:
+            return
+        if analyses:
+            cache_hits = sum(1 for a in analyses if a["cached"])
+            st.info(
+                f"🗃️ **Cache** : {cache_hits} résultat(s) réutilisé(s), "
+                f"{len(analyses) - cache_hits} analyse(s) GPT-5"
+            )
+            prompt_cache = prompt_cache_summary(results)
+            if prompt_cache["requests"]:
+                latency = ""
+                if prompt_cache["latency_hit_ms"] is not None and prompt_cache["latency_miss_ms"] is not None:
+                    latency = (f" — réponse en {prompt_cache['latency_hit_ms']:.0f} ms avec préfixe en cache, "
+                               f"{prompt_cache['latency_miss_ms']:.0f} ms sans")
+                st.info(
+                    f"🧠 **Cache de prompt** : {prompt_cache['hit_rate']:.0%} des tokens d'entrée lus dans le cache "
+                    f"({prompt_cache['cached_tokens']}/{prompt_cache['prompt_tokens']}), "
+                    f"{prompt_cache['hits']}/{prompt_cache['requests']} requête(s){latency}"
+                )
+            results_json = {
+                "metadata": {
+                    "date": datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+                    "nombre_cv_analyses": len(analyses),
+                    "modele_utilise": MODEL_NAME,
+                    "titre_offre": title,
+                    "id_offre": job_offer_id,
+                },
+                "job_offer": job_offer,
+                "analyses": analyses
+            }
+            st.download_button(
+                label="📥 Télécharger les résultats (JSON)",
+                data=json.dumps(results_json, ensure_ascii=False, indent=2),
+                file_name=f"analyse_cv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json"
+            )
+        if failed and st.button("🔁 Relancer les analyses en échec"):
+            requeue_failed_tasks(job_id)
+            st.rerun()
+
+    job_view()
+
 def main():
     """Fonction principale de l'application Streamlit"""
     
-    # Initialisation de la BDD
+    # Initialisation de la BDD (une seule fois par processus)
     init_db()
+    
+    if not config.OPENAI_API_KEY:
+        st.warning("⚠️ Clé API OpenAI non configurée. Veuillez ajouter OPENAI_API_KEY dans vos secrets Streamlit.")
 
     # Menu de navigation
     page = st.sidebar.radio(
         "Navigation",
-        ["Analyse de CV", "Gestion des offres", "Historique des analyses"]
+        ["Analyse de CV", "Gestion des offres", "Historique des analyses", "Performance"]
     )
 
     if page == "Analyse de CV":
@@ -235,6 +366,13 @@ def main():
                 st.error("❌ Clé API OpenAI non configurée")
                 st.info("Configurez OPENAI_API_KEY dans vos variables d'environnement")
             st.subheader("🎛️ Paramètres")
+            live_workers = count_live_workers(3 * HEARTBEAT_SECONDS)
+            st.caption(f"👷 Workers actifs : {live_workers}")
+            force_reanalysis = st.checkbox(
+                "Forcer la ré-analyse",
+                value=False,
+                help="Ignore les résultats en cache et relance l'analyse GPT-5 pour chaque CV"
+            )
             st.markdown("---")
             st.markdown("**💡 Instructions:**")
             st.markdown("1. Ajoutez l'offre d'emploi")
@@ -276,93 +414,36 @@ def main():
             if not uploaded_files:
                 st.error("⚠️ Veuillez uploader au moins un CV")
                 return
+            if not config.OPENAI_API_KEY:
+                st.error("⚠️ Clé API OpenAI non configurée.")
+                return
             
             # Sauvegarder l'offre d'emploi et récupérer son ID
             job_offer_id = save_job_offer(job_title, job_offer)
             st.info(f"💾 Offre d'emploi sauvegardée (ID: {job_offer_id[:8]}...)")
-            
-            st.markdown("---")
-            
-            client = initialize_openai()
-            st.markdown("---")
-            st.header("📊 Résultats de l'analyse")
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            analyses = []
-            
-            for i, uploaded_file in enumerate(uploaded_files, start=1):
-                status_text.text(f"Analyse en cours : {uploaded_file.name} ({i}/{len(uploaded_files)})")
-                progress_bar.progress((i - 1) / len(uploaded_files))
-
-                pdf_bytes = uploaded_file.read()
-
-                result = analyze_cv_with_vision(pdf_bytes, job_offer, client)
-
-                if result:  
-                    analysis_text = result["content"]        
-                    tokens_used   = result["tokens"]         
-
-                    cost_cv = (tokens_used["prompt"]     / 1000) * PRICE_INPUT \
-                            + (tokens_used["completion"] / 1000) * PRICE_OUTPUT
-
-                    st.success(f"✅ Analyse terminée pour {uploaded_file.name}")
-                    parsed = display_analysis(analysis_text, uploaded_file.name)
-
-                    # Enregistrement dans la BDD si le parsing a réussi
-                    if parsed:
-                        insert_analysis(uploaded_file.name, parsed, job_offer_id)
 
-                    st.info(
-                        f"🧮 **Tokens** : {tokens_used['total']}  "
-                        f"(prompt {tokens_used['prompt']} / completion {tokens_used['completion']})  "
-                        f"— **Coût estimé : ${cost_cv:.4f}**"
-                    )
+            # Les analyses sont confiées aux workers : elles continuent même si la page est fermée
+            pdf_files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+            job_id = enqueue_job(job_offer_id, pdf_files, force=force_reanalysis)
+            # Le lot suivi reste dans l'URL : il est retrouvé après un rechargement de la page
+            st.query_params["job"] = str(job_id)
 
-                    analyses.append({
-                        "filename": uploaded_file.name,
-                        "analysis": parsed if parsed else analysis_text,
-                        "tokens":   tokens_used,
-                        "cost_usd": cost_cv
-                    })
-                    st.markdown("---")
-
-                else:  
-                    st.error(f"❌ Échec de l'analyse pour {uploaded_file.name}")
-            
-            progress_bar.progress(1.0)
-            status_text.text("✅ Analyse terminée !")
-            
-            if analyses:
-                st.success(f"🎉 {len(analyses)}/{len(uploaded_files)} CV(s) analysé(s) avec succès")
-                if st.button("💾 Télécharger les résultats (JSON)"):
-                    results_json = {
-                        "metadata": {
-                            "date": datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                            "nombre_cv_analyses": len(analyses),
-                            "modele_utilise": "gpt-5-mini",
-                        },
-                        "job_offer": job_offer,
-                        "analyses": analyses
-                    }
-                    st.download_button(
-                        label="📥 Télécharger JSON",
-                        data=json.dumps(results_json, ensure_ascii=False, indent=2),
-                        file_name=f"analyse_cv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
+        job_id = st.query_params.get("job")
+        if job_id and job_id.isdigit():
+            st.markdown("---")
+            show_job(int(job_id))
 
     elif page == "Gestion des offres":
         st.title("📋 Gestion des offres d'emploi")
         st.markdown("---")
         
-        # Onglets pour organiser les fonctionnalités
+        # Onglets pour organiser les fonctionnalités (une seule lecture des offres pour les deux)
+        job_offers = get_all_job_offers()
         tab1, tab2 = st.tabs(["📊 Vue d'ensemble", "🔍 Détails par offre"])
         
         with tab1:
             st.subheader("📈 Statistiques des offres d'emploi")
             
-            job_offers = get_all_job_offers()
             if job_offers:
                 # Affichage sous forme de tableau
                 import pandas as pd
@@ -387,6 +468,23 @@ def main():
                     if total_cv > 0:
                         avg_cv_per_job = total_cv / len(job_offers)
                         st.metric("Moyenne CV/offre", f"{avg_cv_per_job:.1f}")
+
+                # Consommation lue dans les agrégats par jour, offre et modèle (usage_daily)
+                st.subheader("💰 Dépenses et débit")
+                by_offer = get_usage_rollup("offer")
+                st.dataframe(usage_rows(by_offer, "Offre d'emploi", lambda key, title: title or key[:8]),
+                             use_container_width=True)
+                by_day = get_usage_rollup("day")
+                if by_day:
+                    col_cost, col_volume = st.columns(2)
+                    with col_cost:
+                        st.bar_chart({"Coût ($)": {day: cost for day, _, _, _, _, _, cost, _, _ in by_day}},
+                                     x_label="Jour", y_label="Coût ($)")
+                    with col_volume:
+                        st.bar_chart({"CV analysés": {day: nb for day, _, nb, *_ in by_day}},
+                                     x_label="Jour", y_label="CV analysés")
+                st.dataframe(usage_rows(get_usage_rollup("model"), "Modèle", lambda key, _: key or "inconnu"),
+                             use_container_width=True)
                 
             else:
                 st.info("Aucune offre d'emploi trouvée. Analysez des CV pour commencer !")
@@ -394,7 +492,6 @@ def main():
         with tab2:
             st.subheader("🔍 Analyses par offre d'emploi")
             
-            job_offers = get_all_job_offers()
             if job_offers:
                 # Sélecteur d'offre
                 job_titles = {f"{job[1]} ({job[0][:8]}...)": job[0] for job in job_offers}
@@ -419,6 +516,48 @@ def main():
                             st.metric("Meilleur score", f"{stats[2]}/100")
                         with col4:
                             st.metric("Score minimum", f"{stats[3]}/100")
+
+                        usage = get_usage_rollup("offer", job_offer_id)
+                        if usage:
+                            _, _, nb, prompt, completion, cached, cost, latency_ms, _ = usage[0]
+                            col1, col2, col3, col4 = st.columns(4)
+                            with col1:
+                                st.metric("Coût total", f"${cost:.4f}")
+                            with col2:
+                                st.metric("Coût moyen / CV", f"${cost / nb:.4f}")
+                            with col3:
+                                st.metric("Tokens", f"{prompt + completion:,}".replace(",", " "),
+                                          help=f"dont {cached} tokens d'entrée lus dans le cache de prompt")
+                            with col4:
+                                st.metric("Latence moyenne",
+                                          f"{latency_ms / 1000:.1f} s" if latency_ms is not None else "N/A")
+                        
+                        # Répartition des scores, lue dans l'histogramme de job_offer_stats
+                        st.subheader("📊 Répartition des scores")
+                        distribution = get_score_distribution(job_offer_id)
+                        st.bar_chart(
+                            {"Nombre de CV": {f"{start}-{start + 9}" if start < 90 else "90-100": nb
+                                              for start, nb in distribution}},
+                            x_label="Score global",
+                            y_label="Nombre de CV"
+                        )
+                        
+                        # Compétences normalisées des analyses (tables skills et analysis_skills)
+                        st.subheader("🧩 Compétences")
+                        col_missing, col_matched = st.columns(2)
+                        for column, kind, label in ((col_missing, "missing", "Les plus souvent manquantes"),
+                                                    (col_matched, "matched", "Les plus souvent maîtrisées")):
+                            with column:
+                                st.write(f"**{label}**")
+                                counts = get_skill_counts(kind, job_offer_id)
+                                if counts:
+                                    st.dataframe(
+                                        [{"Compétence": skill_label, "CV": nb, "Part des CV": f"{nb / stats[0]:.0%}"}
+                                         for _, skill_label, nb in counts],
+                                        use_container_width=True
+                                    )
+                                else:
+                                    st.caption("Aucune compétence enregistrée pour cette offre.")
                         
                         st.markdown("---")
                         
@@ -451,56 +590,173 @@ def main():
     elif page == "Historique des analyses":
         st.title("📑 Historique des analyses (BDD)")
         st.markdown("---")
-        rows = get_all_analyses()
-        if rows:
-            # Filtre par offre d'emploi
-            job_offers = get_all_job_offers()
-            if job_offers and len(job_offers) > 1:
-                job_filter_options = ["Toutes les offres"] + [f"{job[1]} ({job[0][:8]}...)" for job in job_offers]
-                selected_filter = st.selectbox("Filtrer par offre d'emploi:", job_filter_options)
-                
-                if selected_filter != "Toutes les offres":
-                    # Extraire l'ID de l'offre sélectionnée
-                    selected_job_id = None
-                    for job in job_offers:
-                        if f"{job[1]} ({job[0][:8]}...)" == selected_filter:
-                            selected_job_id = job[0]
-                            break
-                    
-                    # Filtrer les analyses
-                    rows = [r for r in rows if r[9] == selected_job_id]
-            
-            if rows:
-                st.dataframe(
-                    [{
-                        "Nom/Prénom": r[0],
-                        "Score global /100": r[1],
-                        "Technique /40": r[2],
-                        "Expérience /30": r[3],
-                        "Formation /15": r[4],
-                        "Soft skills /15": r[5],
-                        "Offre d'emploi": r[8] if r[8] else "Non spécifiée",
-                        "Commentaire": r[6][:100] + "..." if len(str(r[6])) > 100 else r[6],
-                        "Date": r[7]
-                    } for r in rows],
-                    use_container_width=True
-                )
-                
-                # Statistiques rapides
-                col1, col2, col3 = st.columns(3)
-                scores = [r[1] for r in rows if r[1] is not None]
-                if scores:
-                    with col1:
-                        st.metric("Analyses totales", len(rows))
-                    with col2:
-                        st.metric("Score moyen", f"{sum(scores)/len(scores):.1f}/100")
-                    with col3:
-                        st.metric("Meilleur score", f"{max(scores)}/100")
+        # Filtres et tri appliqués en SQL
+        job_offers = get_all_job_offers()
+        job_filter_options = {"Toutes les offres": None}
+        job_filter_options.update({f"{job[1]} ({job[0][:8]}...)": job[0] for job in job_offers})
+        
+        search = st.text_input(
+            "🔎 Rechercher",
+            placeholder="Nom, compétence, entreprise, fichier...",
+            help="Recherche dans les noms, commentaires, fichiers et expériences ; résultats classés par pertinence"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            selected_filter = st.selectbox("Filtrer par offre d'emploi:", list(job_filter_options))
+            name_prefix = st.text_input("Nom commençant par:")
+        with col2:
+            min_score, max_score = st.slider("Score global", 0, 100, (0, 100))
+            period = st.date_input("Période", value=[])
+        skill_labels = dict(get_skills("matched"))
+        required_skills = st.multiselect(
+            "Compétences maîtrisées (toutes requises):",
+            list(skill_labels),
+            format_func=skill_labels.get,
+            help="Candidats de toutes les offres ayant chacune des compétences sélectionnées"
+        )
+        sort = st.radio(
+            "Trier par",
+            list(HISTORY_SORTS),
+            format_func=lambda s: "Plus récentes" if s == "date" else "Meilleur score",
+            horizontal=True
+        )
+        
+        filters = {
+            "job_offer_id": job_filter_options[selected_filter],
+            "min_score": min_score if min_score > 0 else None,
+            "max_score": max_score if max_score < 100 else None,
+            "date_from": period[0] if len(period) == 2 else None,
+            "date_to": period[1] if len(period) == 2 else None,
+            "name_prefix": name_prefix.strip() or None,
+            "skills": tuple(required_skills) or None
+        }
+        
+        if search.strip():
+            # Recherche plein texte : les meilleurs résultats, avec les filtres ci-dessus
+            results = search_analyses(search, **filters)
+            if not results:
+                st.info("Aucune analyse ne correspond à la recherche.")
             else:
-                st.info("Aucune analyse trouvée pour le filtre sélectionné.")
+                st.caption(f"{len(results)} résultat(s) les plus pertinents"
+                           if len(results) == HISTORY_PAGE_SIZE else f"{len(results)} résultat(s)")
+                for _, nom, score, filename, date, job_title, _, extrait in results:
+                    st.markdown(f"**{nom or 'Candidat inconnu'}** — {score}/100 · "
+                                f"{job_title or 'Offre non spécifiée'} · {filename or ''} · {date}")
+                    st.caption(extrait)
+            return
+        
+        # Pagination par clé : pile des curseurs des pages visitées, remise à zéro si les filtres changent
+        state_key = (sort, tuple(filters.items()))
+        if st.session_state.get("history_state") != state_key:
+            st.session_state.history_state = state_key
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+        
+        total, avg_score, best_score = get_analyses_summary(**filters)
+        if total:
+            rows, next_cursor = query_analyses(sort=sort, after=cursors[-1], **filters)
+            st.dataframe(
+                [{
+                    "Nom/Prénom": r[1],
+                    "Score global /100": r[2],
+                    "Technique /40": r[3],
+                    "Expérience /30": r[4],
+                    "Formation /15": r[5],
+                    "Soft skills /15": r[6],
+                    "Offre d'emploi": r[9] if r[9] else "Non spécifiée",
+                    "Commentaire": r[7],
+                    "Date": r[8]
+                } for r in rows],
+                use_container_width=True
+            )
+            
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                st.button("⬅️ Précédent", disabled=len(cursors) == 1, on_click=cursors.pop)
+            with col_page:
+                nb_pages = -(-total // HISTORY_PAGE_SIZE)
+                st.caption(f"Page {len(cursors)} sur {nb_pages}")
+            with col_next:
+                st.button("Suivant ➡️", disabled=next_cursor is None,
+                          on_click=cursors.append, args=(next_cursor,))
+            
+            # Statistiques rapides (agrégats SQL sur l'ensemble filtré)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Analyses totales", total)
+            if avg_score is not None:
+                with col2:
+                    st.metric("Score moyen", f"{avg_score:.1f}/100")
+                with col3:
+                    st.metric("Meilleur score", f"{best_score}/100")
+        elif any(value is not None for value in filters.values()):
+            st.info("Aucune analyse trouvée pour le filtre sélectionné.")
         else:
             st.info("Aucune analyse enregistrée dans la base de données.")
 
+    elif page == "Performance":
+        st.title("⏱️ Performance des analyses")
+        st.markdown("---")
+        period = st.selectbox("Période", list(PERFORMANCE_PERIODS))
+        window, bucket_seconds = PERFORMANCE_PERIODS[period]
+        since = time.time() - window if window else None
+
+        summary = summarize(get_stage_durations(since))
+        if not summary:
+            st.info("Aucune mesure sur cette période : les durées sont enregistrées à chaque analyse.")
+            return
+
+        st.subheader("📊 Durée par étape")
+        st.dataframe(
+            [{
+                "Étape": STAGE_LABELS.get(stats["stage"], stats["stage"]),
+                "CV": stats["count"],
+                "p50 (ms)": round(stats["p50"], 1),
+                "p95 (ms)": round(stats["p95"], 1),
+                "p99 (ms)": round(stats["p99"], 1),
+                "Moyenne (ms)": round(stats["sum"] / stats["count"], 1),
+            } for stats in summary],
+            use_container_width=True
+        )
+        st.caption("Le total inclut l'attente des limites de débit et les nouvelles tentatives ; "
+                   "les résultats servis par le cache n'ont ni rendu ni appel au modèle.")
+
+        st.subheader("📈 Débit")
+        throughput = get_throughput(since, bucket_seconds)
+        st.line_chart(
+            {"CV/min": {datetime.fromtimestamp(bucket): count * 60 / bucket_seconds
+                        for bucket, count in throughput}},
+            x_label="Heure",
+            y_label="CV/min"
+        )
+
+        st.subheader("🩹 Réponses invalides")
+        nb_invalid, nb_repaired, tokens_saved, repair_tokens = get_parse_failure_stats(since)
+        # Les réponses restées invalides n'ont pas d'analyse, donc pas de durées enregistrées
+        nb_calls = next((stats["count"] for stats in summary if stats["stage"] == "llm"), 0) + nb_invalid - nb_repaired
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Taux de réponses invalides", f"{nb_invalid / nb_calls:.1%}" if nb_calls else "N/A")
+        col2.metric("Réparées", f"{nb_repaired}/{nb_invalid}")
+        col3.metric("Tokens épargnés", f"{tokens_saved:,}".replace(",", " "))
+        col4.metric("Tokens de réparation", f"{repair_tokens:,}".replace(",", " "))
+        st.caption("Une réponse invalide (JSON ou schéma) est corrigée par un appel texte seul ; "
+                   "les tokens épargnés sont ceux des analyses qui auraient été perdues, moins "
+                   "le coût des réparations.")
+
+        st.subheader("🐢 CV les plus lents")
+        st.dataframe(
+            [{
+                "Fichier": filename,
+                "Nom/Prénom": nom,
+                "Offre d'emploi": title or "Non spécifiée",
+                "Méthode": methode,
+                "Total (ms)": round(total_ms),
+                **{f"{STAGE_LABELS[stage]} (ms)": round(stages[stage])
+                   for stage in STAGE_LABELS if stage != "total" and stage in stages},
+            } for filename, nom, title, methode, total_ms, stages in get_slowest_analyses(since)],
+            use_container_width=True
+        )
+
 
 if __name__ == "__main__":
     main()
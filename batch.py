@@ -0,0 +1,251 @@
+"""
+Mode hors ligne : analyse de nombreux CV via l'API Batch d'OpenAI (tarif réduit,
+résultats sous 24 h). L'état des lots est conservé en base, chaque commande peut
+donc être relancée après un arrêt du processus.
+
+Usage :
+    python batch.py submit --title "Développeur Python" --offer offre.txt cvs/*.pdf
+    python batch.py poll [--wait] [--interval 60]
+    python batch.py ingest
+    python batch.py status
+
+Pour tester sans coût, pointer OPENAI_BASE_URL vers benchmarks/fake_openai.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import config
+from analysis import MODEL_NAME, PROMPT_HASH, build_request, ensure_valid, get_client, parse_analysis, usage_record
+from db import (init_db, save_job_offer, make_cache_key, store_cached_analysis,
+                create_batch_job, update_batch_job, get_batch_jobs, get_batch_items,
+                insert_batch_analysis, mark_batch_item, mark_batch_ingested)
+
+BATCH_ENDPOINT = "/v1/responses"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# L'API limite le fichier d'entrée à 200 Mo ; au-delà, le lot est découpé
+MAX_BATCH_FILE_BYTES = 150 * 1024 * 1024
+
+
+def build_batch_lines(pdf_files, job_offer, job_offer_id):
+    """
+    Transforme des CV en lignes JSONL pour l'API Batch, avec la même requête que
+    l'analyse interactive. Retourne une liste de (ligne, item) ; les PDF vides sont ignorés.
+    """
+    lines = []
+    for index, (filename, pdf_bytes) in enumerate(pdf_files):
+        request = build_request(pdf_bytes, job_offer)
+        if request is None:
+            print(f"⚠️ {filename} : PDF vide, ignoré")
+            continue
+        body, details = request
+        custom_id = f"cv-{index:05d}"
+        line = json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": body
+        }, ensure_ascii=False)
+        lines.append((line, {
+            "custom_id": custom_id,
+            "filename": filename,
+            "method": details["method"],
+            "cache_key": make_cache_key(pdf_bytes, job_offer_id, MODEL_NAME, PROMPT_HASH)
+        }))
+    return lines
+
+
+def _split_lines(lines, max_bytes=MAX_BATCH_FILE_BYTES):
+    chunk, size = [], 0
+    for line, item in lines:
+        line_size = len(line.encode()) + 1
+        if chunk and size + line_size > max_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((line, item))
+        size += line_size
+    if chunk:
+        yield chunk
+
+
+def submit_batch(client, title, job_offer, pdf_files):
+    """Enregistre l'offre, soumet les CV en un ou plusieurs lots et retourne leurs IDs."""
+    job_offer_id = save_job_offer(title, job_offer)
+    batch_ids = []
+    for chunk in _split_lines(build_batch_lines(pdf_files, job_offer, job_offer_id)):
+        jsonl = "\n".join(line for line, _ in chunk) + "\n"
+        input_file = client.files.create(file=("batch_input.jsonl", jsonl.encode()), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata={"job_offer_id": job_offer_id}
+        )
+        create_batch_job(batch.id, job_offer_id, input_file.id, batch.status, [item for _, item in chunk])
+        print(f"📤 Lot {batch.id} soumis ({len(chunk)} CV)")
+        batch_ids.append(batch.id)
+    return batch_ids
+
+
+def poll_batches(client):
+    """Met à jour l'état des lots non terminés. Retourne le nombre de lots encore en cours."""
+    running = 0
+    for batch_id, _, status, *_ in get_batch_jobs(only_pending=True):
+        if status in TERMINAL_STATUSES:
+            continue
+        batch = client.batches.retrieve(batch_id)
+        update_batch_job(batch_id, batch.status, batch.output_file_id, batch.error_file_id)
+        print(f"🔄 Lot {batch_id} : {batch.status}")
+        if batch.status not in TERMINAL_STATUSES:
+            running += 1
+    return running
+
+
+def _output_text(body):
+    """Équivalent de `response.output_text` pour un corps de réponse brut."""
+    return "".join(
+        part.get("text", "")
+        for item in body.get("output", [])
+        if item.get("type") == "message"
+        for part in item.get("content", [])
+        if part.get("type") == "output_text"
+    )
+
+
+def ingest_batch(client, batch_id, job_offer_id, output_file_id, error_file_id):
+    """
+    Intègre les résultats d'un lot terminé : parsing, cache et `analyses`.
+    Les éléments déjà intégrés sont ignorés. Retourne (intégrés, échecs).
+    """
+    items = {row[0]: row for row in get_batch_items(batch_id, status="pending")}
+    ingested = failed = 0
+
+    errors = {}
+    if error_file_id and items:
+        for line in filter(None, client.files.content(error_file_id).text.splitlines()):
+            record = json.loads(line)
+            error = record.get("error") or (record.get("response") or {}).get("body", {}).get("error") or {}
+            errors[record["custom_id"]] = error.get("message", "erreur inconnue")
+
+    if output_file_id and items:
+        content = client.files.content(output_file_id).text
+        for line in filter(None, content.splitlines()):
+            record = json.loads(line)
+            custom_id = record["custom_id"]
+            if custom_id not in items:
+                continue
+            _, filename, method, cache_key, _ = items.pop(custom_id)
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") != 200:
+                mark_batch_item(batch_id, custom_id, "failed")
+                failed += 1
+                continue
+
+            usage = body.get("usage") or {}
+            result = {
+                "content": _output_text(body),
+                "tokens": {
+                    "prompt": usage.get("input_tokens", 0),
+                    "completion": usage.get("output_tokens", 0),
+                    "cached": (usage.get("input_tokens_details") or {}).get("cached_tokens", 0),
+                    "total": usage.get("total_tokens", 0)
+                },
+                "method": method
+            }
+            # Réponse invalide : réparée par un appel texte seul plutôt que resoumise
+            result = ensure_valid(result, client)
+            if result.get("repair", {}).get("repaired", True):
+                store_cached_analysis(cache_key, result)
+            try:
+                parsed = parse_analysis(result["content"])
+            except ValueError:
+                print(f"❌ {filename} : réponse invalide")
+                mark_batch_item(batch_id, custom_id, "failed")
+                failed += 1
+                continue
+            parsed["methode_analyse"] = method
+            insert_batch_analysis(batch_id, custom_id, filename, parsed, job_offer_id,
+                                  usage_record(result, price_factor=config.BATCH_PRICE_FACTOR))
+            ingested += 1
+
+    # Éléments restants : en erreur côté API ou absents du fichier de sortie
+    for custom_id, (_, filename, *_) in items.items():
+        print(f"❌ {filename} : {errors.get(custom_id, 'aucun résultat dans le lot')}")
+        mark_batch_item(batch_id, custom_id, "failed")
+        failed += 1
+
+    mark_batch_ingested(batch_id)
+    return ingested, failed
+
+
+def ingest_batches(client):
+    """Intègre tous les lots terminés et pas encore intégrés."""
+    for batch_id, job_offer_id, status, output_file_id, error_file_id, *_ in get_batch_jobs(only_pending=True):
+        if status not in TERMINAL_STATUSES:
+            continue
+        ingested, failed = ingest_batch(client, batch_id, job_offer_id, output_file_id, error_file_id)
+        print(f"📥 Lot {batch_id} ({status}) : {ingested} analyse(s) intégrée(s), {failed} échec(s)")
+
+
+def print_status():
+    jobs = get_batch_jobs()
+    if not jobs:
+        print("ℹ️ Aucun lot enregistré")
+        return
+    for batch_id, job_offer_id, status, _, _, created_at, ingested_at in jobs:
+        items = get_batch_items(batch_id)
+        done = sum(1 for item in items if item[4] == "ingested")
+        state = "intégré" if ingested_at else status
+        print(f"{batch_id}  offre {job_offer_id}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(created_at))}"
+              f"  {state:<12} {done}/{len(items)} CV")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="Soumettre des CV pour une offre")
+    submit.add_argument("--title", required=True, help="Titre de l'offre d'emploi")
+    submit.add_argument("--offer", required=True, help="Fichier texte de l'offre d'emploi")
+    submit.add_argument("pdfs", nargs="+", help="CV au format PDF")
+
+    poll = sub.add_parser("poll", help="Mettre à jour l'état des lots en cours")
+    poll.add_argument("--wait", action="store_true", help="Attendre la fin de tous les lots puis les intégrer")
+    poll.add_argument("--interval", type=float, default=60, help="Intervalle entre deux interrogations (s)")
+
+    sub.add_parser("ingest", help="Intégrer les résultats des lots terminés")
+    sub.add_parser("status", help="Afficher l'état des lots")
+
+    args = parser.parse_args()
+    init_db()
+
+    if args.command == "status":
+        print_status()
+        return
+
+    client = get_client(max_retries=0)  # les nouvelles tentatives sont gérées par scheduler.py
+    if args.command == "submit":
+        with open(args.offer, encoding="utf-8") as f:
+            job_offer = f.read()
+        pdf_files = []
+        for path in args.pdfs:
+            with open(path, "rb") as f:
+                pdf_files.append((os.path.basename(path), f.read()))
+        if not submit_batch(client, args.title, job_offer, pdf_files):
+            sys.exit("⚠️ Aucun CV exploitable")
+    elif args.command == "poll":
+        while poll_batches(client) and args.wait:
+            time.sleep(args.interval)
+        if args.wait:
+            ingest_batches(client)
+    elif args.command == "ingest":
+        poll_batches(client)
+        ingest_batches(client)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Test de charge du service HTTP (api.py) avec le faux serveur OpenAI : N clients
+simultanés envoient des CV et interrogent les lots et le classement pendant que
+les workers analysent. Affiche les latences p50/p99 par route, le débit soutenu en
+requêtes par seconde, puis le débit de bout en bout des analyses.
+
+Usage :
+    python benchmarks/bench_api.py [--clients 32] [--duration 20] [--latency 0.5] [--worker-threads 8]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_rasterization import make_sample_pdf
+
+# Proportion des requêtes par route pendant la charge
+ROUTE_WEIGHTS = {"POST /cvs": 0.2, "GET /jobs": 0.6, "GET /ranking": 0.2}
+
+
+def multipart_body(files):
+    """Corps multipart/form-data (champ « cv » répété) et son Content-Type."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, data in files:
+        parts.append(f"--{boundary}\r\nContent-Disposition: form-data; name=\"cv\"; filename=\"{filename}\"\r\n"
+                     f"Content-Type: application/pdf\r\n\r\n".encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def start_process(args, cwd, env, log_name):
+    log = open(os.path.join(cwd, log_name), "w")
+    return subprocess.Popen([sys.executable, "-u", *args], cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_for_workers(client, base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.fetch(f"{base_url}/health")
+            if json.loads(response.body)["workers"]:
+                return
+        except (OSError, HTTPClientError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Le service ou le worker n'a pas démarré (voir les journaux)")
+
+
+async def run_load(base_url, clients, duration, pdfs):
+    client = AsyncHTTPClient(max_clients=clients)
+    await wait_for_workers(client, base_url)
+    response = await client.fetch(f"{base_url}/offers", method="POST", body=json.dumps(
+        {"title": "Développeur Python (charge)", "content": "Python, Django, API REST, PostgreSQL, Docker."}))
+    job_offer_id = json.loads(response.body)["id"]
+
+    latencies = {route: [] for route in ROUTE_WEIGHTS}
+    errors = {route: 0 for route in ROUTE_WEIGHTS}
+    job_ids = []
+    rng = random.Random(0)
+    stop_at = time.monotonic() + duration
+
+    async def one_client():
+        while time.monotonic() < stop_at:
+            route = rng.choices(list(ROUTE_WEIGHTS), weights=list(ROUTE_WEIGHTS.values()))[0]
+            if route == "GET /jobs" and not job_ids:
+                route = "POST /cvs"
+            if route == "POST /cvs":
+                filename, data = rng.choice(pdfs)
+                # Commentaire final unique : chaque envoi est un nouveau CV pour le cache
+                body, content_type = multipart_body([(filename, data + f"\n% {uuid.uuid4()}\n".encode())])
+                request = dict(request=f"{base_url}/offers/{job_offer_id}/cvs", method="POST", body=body,
+                               headers={"Content-Type": content_type})
+            elif route == "GET /jobs":
+                request = dict(request=f"{base_url}/jobs/{rng.choice(job_ids)}")
+            else:
+                request = dict(request=f"{base_url}/offers/{job_offer_id}/ranking?limit=20")
+            start = time.perf_counter()
+            try:
+                response = await client.fetch(**request)
+            except (OSError, HTTPClientError):
+                errors[route] += 1
+                continue
+            latencies[route].append(time.perf_counter() - start)
+            if route == "POST /cvs":
+                job_ids.append(json.loads(response.body)["job_id"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n📈 Charge : {clients} clients pendant {elapsed:.1f} s")
+    print(f"{'Route':<14}{'Requêtes':>10}{'Erreurs':>9}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    for route, values in latencies.items():
+        if values:
+            print(f"{route:<14}{len(values):>10}{errors[route]:>9}"
+                  f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 99) * 1000:>10.1f}")
+    total = sum(len(values) for values in latencies.values())
+    everything = [value for values in latencies.values() for value in values]
+    print(f"{'Total':<14}{total:>10}{sum(errors.values()):>9}"
+          f"{percentile(everything, 50) * 1000:>10.1f}{percentile(everything, 99) * 1000:>10.1f}")
+    print(f"🚀 Débit soutenu : {total / elapsed:.0f} requêtes/s")
+
+    # Attente de la fin des analyses mises en file pendant la charge
+    pending = set(job_ids)
+    while pending:
+        for job_id in list(pending):
+            response = await client.fetch(f"{base_url}/jobs/{job_id}")
+            if json.loads(response.body)["status"] == "finished":
+                pending.discard(job_id)
+        await asyncio.sleep(0.5)
+    drained = time.perf_counter() - start
+    print(f"✅ {len(job_ids)} CV analysés en {drained:.1f} s ({len(job_ids) * 60 / drained:.0f} CV/min de bout en bout)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Latence simulée du modèle (s)")
+    parser.add_argument("--worker-threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+
+    # 20 CV modèles (1 à 3 pages), rendus uniques à chaque envoi
+    pdfs = [(f"cv_{i:02d}.pdf", make_sample_pdf(1 + i % 3)) for i in range(20)]
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    fake_port, api_port = args.port + 1, args.port
+    env = {**os.environ, "OPENAI_API_KEY": "test", "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1"}
+    env.pop("CV_API_TOKEN", None)
+    processes = [
+        start_process([os.path.join(ROOT, "benchmarks", "fake_openai.py"), "--port", str(fake_port),
+                       "--latency", str(args.latency)], workdir, env, "fake_openai.log"),
+        start_process([os.path.join(ROOT, "api.py"), "--port", str(api_port)], workdir, env, "api.log"),
+        start_process([os.path.join(ROOT, "worker.py"), "--threads", str(args.worker_threads),
+                       "--rpm", "100000", "--tpm", "100000000"], workdir, env, "worker.log"),
+    ]
+    print(f"📂 Base et journaux dans {workdir}")
+    try:
+        asyncio.run(run_load(f"http://127.0.0.1:{api_port}/api", args.clients, args.duration, pdfs))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
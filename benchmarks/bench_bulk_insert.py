@@ -0,0 +1,132 @@
+"""
+Benchmark des écritures en masse : débit (lignes/s) d'une insertion par appel
+(insert_analysis), d'insertions par lots (insert_analyses), de l'import dédupliqué
+(import_analyses, lignes nouvelles puis doublons) et d'import_results.py de bout en
+bout sur un export JSON généré.
+
+Usage :
+    python benchmarks/bench_bulk_insert.py [--rows 20000] [--batch-sizes 50 1000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import import_results
+
+JOB_OFFER = "Développeur Python senior : Django, PostgreSQL, Docker, AWS."
+SKILLS = ["Python", "Django", "PostgreSQL", "Docker", "AWS", "Kubernetes", "React", "Git", "Linux", "Kafka"]
+USAGE = {"prompt_tokens": 1800, "completion_tokens": 350, "cached_tokens": 0, "latency_ms": 4200,
+         "model": "gpt-5-mini", "nb_pages": 2, "cost_usd": 0.00115}
+
+
+def analysis(n):
+    return {
+        "nom_prenom": f"Candidat {n}",
+        "score_global": n % 101,
+        "score_technique": n % 41,
+        "score_experience": n % 31,
+        "score_formation": n % 16,
+        "score_soft_skills": n % 16,
+        "commentaires": "Profil solide, peu d'expérience cloud.",
+        "methode_analyse": "GPT-5 texte",
+        "pages_analysees": 2,
+        "competences_matchees": [SKILLS[(n + k) % len(SKILLS)] for k in range(4)],
+        "competences_manquantes": [SKILLS[(n * 7 + k) % len(SKILLS)] for k in range(2)],
+        "points_forts": ["Autonome", "Bonne culture technique"],
+        "points_faibles": ["Peu d'expérience cloud"],
+    }
+
+
+def timed_rate(fn, nb_rows):
+    start = time.perf_counter()
+    fn()
+    return round(nb_rows / (time.perf_counter() - start))
+
+
+def use_database(path):
+    db.DB_PATH = path
+    db.init_db()
+
+
+def bench_per_row(job_offer_id, nb_rows):
+    for n in range(nb_rows):
+        db.insert_analysis(f"cv_{n}.pdf", analysis(n), job_offer_id, USAGE)
+
+
+def bench_batches(job_offer_id, nb_rows, batch_size):
+    with db.BufferedWriter(db.insert_analyses, max_rows=batch_size, max_seconds=float("inf")) as writer:
+        for n in range(nb_rows):
+            writer.add((f"cv_{n}.pdf", analysis(n), job_offer_id, USAGE))
+
+
+def bench_import(job_offer_id, nb_rows, batch_size):
+    inserted = 0
+    rows = []
+    for n in range(nb_rows):
+        rows.append((job_offer_id, "Offre", JOB_OFFER, f"cv_{n}.pdf", analysis(n), USAGE, None))
+        if len(rows) == batch_size:
+            inserted += db.import_analyses(rows)
+            rows = []
+    if rows:
+        inserted += db.import_analyses(rows)
+    return inserted
+
+
+def write_export(path, nb_rows):
+    export = {
+        "metadata": {"date": "01/02/2025 10:00:00", "titre_offre": "Offre", "modele_utilise": "gpt-5-mini"},
+        "job_offer": JOB_OFFER,
+        "analyses": [{"filename": f"cv_{n}.pdf", "analysis": analysis(n), "tokens": {"prompt": 1800, "completion": 350},
+                      "cost_usd": 0.00115, "cached": False} for n in range(nb_rows)],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(export, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--per-row", type=int, default=2000, help="Lignes pour l'insertion une par une")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[50, 1000])
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        use_database(os.path.join(tmp, "per_row.db"))
+        job_offer_id = db.save_job_offer("Offre", JOB_OFFER)
+        results.append(("insert_analysis (1 par appel)",
+                        timed_rate(lambda: bench_per_row(job_offer_id, args.per_row), args.per_row)))
+        db.get_db().close()
+
+        for batch_size in args.batch_sizes:
+            use_database(os.path.join(tmp, f"batch_{batch_size}.db"))
+            job_offer_id = db.save_job_offer("Offre", JOB_OFFER)
+            results.append((f"insert_analyses (lots de {batch_size})",
+                            timed_rate(lambda: bench_batches(job_offer_id, args.rows, batch_size), args.rows)))
+            results.append((f"import_analyses (lots de {batch_size}, nouvelles)",
+                            timed_rate(lambda: bench_import("import", args.rows, batch_size), args.rows)))
+            results.append((f"import_analyses (lots de {batch_size}, doublons)",
+                            timed_rate(lambda: bench_import("import", args.rows, batch_size), args.rows)))
+            db.get_db().close()
+
+        export_path = os.path.join(tmp, "export.json")
+        write_export(export_path, args.rows)
+        use_database(os.path.join(tmp, "import.db"))
+        results.append(("import_results.py (export JSON)",
+                        timed_rate(lambda: import_results.import_file(export_path), args.rows)))
+        db.get_db().close()
+
+    print(f"{'écriture':<45}  {'lignes/s':>9}")
+    for label, rate in results:
+        print(f"{label:<45}  {rate:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark des accès concurrents à SQLite : insertions et lectures depuis N sessions
+simultanées (threads), avec l'ancien accès (une connexion par appel, journal par
+défaut) et le gestionnaire partagé de db.py (WAL, écrivain unique).
+
+Usage :
+    python benchmarks/bench_db.py [--sessions 1 8 32] [--ops 200]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+JOB_OFFER_ID = "bench_offer"
+ANALYSIS = {
+    "nom_prenom": "Jean Dupont",
+    "score_global": 72,
+    "score_technique": 30,
+    "score_experience": 22,
+    "score_formation": 10,
+    "score_soft_skills": 10,
+    "commentaires": "Profil solide, peu d'expérience cloud.",
+    "methode_analyse": "GPT-5 texte"
+}
+
+
+def legacy_insert(path, filename):
+    """Ancien insert_analysis : connexion ouverte et fermée à chaque appel."""
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    db._insert_analysis_row(c, filename, ANALYSIS, JOB_OFFER_ID)
+    conn.commit()
+    conn.close()
+
+
+def legacy_read(path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''
+        SELECT a.nom_prenom, a.score_global, a.score_technique, a.score_experience,
+               a.score_formation, a.score_soft_skills, a.commentaire, a.date, a.filename
+        FROM analyses a
+        WHERE a.job_offer_id = ?
+        ORDER BY a.score_global DESC
+        LIMIT 50
+    ''', (JOB_OFFER_ID,))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+
+def pooled_insert(path, filename):
+    db.insert_analysis(filename, ANALYSIS, JOB_OFFER_ID)
+
+
+def pooled_read(path):
+    with db.get_db().read() as c:
+        c.execute('''
+            SELECT a.nom_prenom, a.score_global, a.score_technique, a.score_experience,
+                   a.score_formation, a.score_soft_skills, a.commentaire, a.date, a.filename
+            FROM analyses a
+            WHERE a.job_offer_id = ?
+            ORDER BY a.score_global DESC
+            LIMIT 50
+        ''', (JOB_OFFER_ID,))
+        return c.fetchall()
+
+
+VARIANTS = {
+    "par appel": (legacy_insert, legacy_read),
+    "partagé": (pooled_insert, pooled_read),
+}
+
+
+def prepare(variant, path):
+    if variant == "partagé":
+        db.DB_PATH = path
+        db.init_db()
+        return
+    conn = sqlite3.connect(path)
+    db._create_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+def run(variant, nb_sessions, ops):
+    """Chaque session alterne une insertion et une lecture, `ops` fois."""
+    insert, read = VARIANTS[variant]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare(variant, path)
+        errors = []
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(nb_sessions)
+
+        def session(session_no):
+            barrier.wait()
+            local = []
+            for i in range(ops):
+                start = time.perf_counter()
+                try:
+                    insert(path, f"cv_{session_no}_{i}.pdf")
+                    read(path)
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=session, args=(n,)) for n in range(nb_sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if variant == "partagé":
+            db.get_db().close()
+
+    latencies.sort()
+    return {
+        "ops_per_s": round(2 * nb_sessions * ops / elapsed),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--ops", type=int, default=200, help="Couples insertion + lecture par session")
+    args = parser.parse_args()
+
+    print(f"{'sessions':>8}  {'accès':<10}  {'ops/s':>7}  {'p99 (ms)':>9}  {'erreurs':>7}")
+    for nb_sessions in args.sessions:
+        for variant in VARIANTS:
+            res = run(variant, nb_sessions, args.ops)
+            print(f"{nb_sessions:>8}  {variant:<10}  {res['ops_per_s']:>7}  {res['p99_ms']:>9}  {res['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
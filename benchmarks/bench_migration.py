@@ -0,0 +1,130 @@
+"""
+Benchmark des migrations de schéma sur une base volumineuse : génère une base
+non versionnée (dates 'JJ/MM/AAAA', sans index) puis mesure la durée de la migration
+et celle des requêtes de db.py, dans leur version d'origine puis actuelle.
+
+Usage :
+    python benchmarks/bench_migration.py [--rows 1000000] [--offers 200]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import migrate_db
+
+ANALYSES_BY_OFFER = '''
+    SELECT a.nom_prenom, a.score_global, a.score_technique, a.score_experience,
+           a.score_formation, a.score_soft_skills, a.commentaire, a.date, a.filename
+    FROM analyses a
+    WHERE a.job_offer_id = ?
+    ORDER BY a.score_global DESC
+'''
+
+# Nom -> (requête d'origine, requête actuelle de db.py, filtrée par offre)
+QUERIES = {
+    "analyses d'une offre": (ANALYSES_BY_OFFER, ANALYSES_BY_OFFER, True),
+    "statistiques d'une offre": ('''
+        SELECT COUNT(*), AVG(score_global), MAX(score_global), MIN(score_global)
+        FROM analyses
+        WHERE job_offer_id = ?
+    ''', '''
+        SELECT nb_analyses, CAST(score_sum AS REAL) / NULLIF(nb_scored, 0), score_max, score_min
+        FROM job_offer_stats
+        WHERE job_offer_id = ?
+    ''', True),
+    "liste des offres": ('''
+        SELECT j.id, j.title, j.created_date, COUNT(a.id) as nb_analyses
+        FROM job_offers j
+        LEFT JOIN analyses a ON j.id = a.job_offer_id
+        GROUP BY j.id, j.title, j.created_date
+        ORDER BY j.created_date DESC
+    ''', '''
+        SELECT j.id, j.title, j.created_date, COALESCE(s.nb_analyses, 0) as nb_analyses
+        FROM job_offers j
+        LEFT JOIN job_offer_stats s ON s.job_offer_id = j.id
+        ORDER BY j.created_date DESC
+    ''', False),
+}
+
+
+def build_legacy_db(path, nb_rows, nb_offers):
+    """Base au schéma actuel mais en version 0, avec l'ancien format de date."""
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    db._create_schema(c)
+    offers = [(f"offer{n:04d}", f"Offre {n}", "Contenu",
+               f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2023, 2026)} 10:00:00")
+              for n in range(nb_offers)]
+    c.executemany('INSERT INTO job_offers (id, title, content, created_date) VALUES (?, ?, ?, ?)', offers)
+
+    def rows():
+        for n in range(nb_rows):
+            yield (offers[n % nb_offers][0], f"Candidat {n}", f"cv_{n}.pdf", rng.randint(0, 100),
+                   "Commentaire", f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 14:30:00")
+
+    c.executemany('''
+        INSERT INTO analyses (job_offer_id, nom_prenom, filename, score_global, commentaire, date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows())
+    conn.commit()
+    conn.close()
+
+
+def time_queries(path, migrated):
+    """Durée (ms) et plan de chaque requête, dans sa version d'origine ou actuelle."""
+    conn = sqlite3.connect(path)
+    timings, plans = {}, {}
+    for name, (legacy_sql, current_sql, by_offer) in QUERIES.items():
+        sql = current_sql if migrated else legacy_sql
+        params = ("offer0007",) if by_offer else ()
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings[name] = (time.perf_counter() - start) * 1000
+        plans[name] = " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+    conn.close()
+    return timings, plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--offers", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        build_legacy_db(path, args.rows, args.offers)
+        print(f"🏗️ Base de {args.rows} analyses générée en {time.perf_counter() - start:.1f} s")
+
+        before, _ = time_queries(path, migrated=False)
+        start = time.perf_counter()
+        migrate_db.migrate_database(path)
+        elapsed = time.perf_counter() - start
+        after, plans = time_queries(path, migrated=True)
+
+        conn = sqlite3.connect(path)
+        dates = [row[0] for row in conn.execute('SELECT created_date FROM job_offers ORDER BY created_date DESC LIMIT 3')]
+        conn.close()
+
+    print(f"\n⏱️ Migration complète : {elapsed:.1f} s pour {args.rows} lignes")
+    print(f"{'requête':<26}  {'avant (ms)':>10}  {'après (ms)':>10}")
+    for name in QUERIES:
+        print(f"{name:<26}  {before[name]:>10.1f}  {after[name]:>10.1f}")
+    print("\nPlans après migration :")
+    for name, plan in plans.items():
+        print(f"  {name} : {plan}")
+    print(f"\nOffres les plus récentes : {dates}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark du rendu PDF -> images envoyées au modèle.
+
+Compare l'ancien chemin (fichier temporaire, aller-retour PNG -> PIL, puis
+ré-encodage PNG) au chemin de production : rendu en mémoire par
+utils.pdf_to_images_from_bytes puis encodage par utils.optimize_page_image.
+Chaque variante tourne dans un processus séparé pour mesurer son pic de RSS.
+
+Usage :
+    python benchmarks/bench_rasterization.py [--pages 1 3 6] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from utils import optimize_page_image, pdf_to_images_from_bytes
+
+VARIANTS = ("legacy", "in_memory")
+
+
+def make_sample_pdf(nb_pages):
+    """Génère un CV synthétique de `nb_pages` pages (texte + encadrés)."""
+    doc = fitz.open()
+    for page_no in range(nb_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Jean Dupont - Développeur Python Senior (page {page_no + 1})", fontsize=16)
+        y = 110
+        for line in range(40):
+            page.insert_text((72, y), f"Expérience {line} : Django, API REST, PostgreSQL, Docker, CI/CD", fontsize=10)
+            y += 16
+        page.draw_rect(fitz.Rect(400, 60, 540, 200), color=(0.2, 0.3, 0.6), fill=(0.85, 0.9, 1.0))
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
+def legacy_render(pdf_bytes):
+    """Ancien chemin : fichier temporaire + PNG -> PIL -> PNG."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp.write(pdf_bytes)
+        tmp_path = tmp.name
+    doc = fitz.open(tmp_path)
+    images = []
+    for page in doc:
+        pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
+        images.append(Image.open(BytesIO(pix.tobytes("png"))))
+    doc.close()
+    os.unlink(tmp_path)
+
+    encoded = []
+    for img in images:
+        buffered = BytesIO()
+        img.save(buffered, format="PNG")
+        encoded.append(buffered.getvalue())
+    return encoded
+
+
+def in_memory_render(pdf_bytes):
+    return [optimize_page_image(image)["data"] for image in pdf_to_images_from_bytes(pdf_bytes)]
+
+
+def run_variant(variant, nb_pages, repeat):
+    """Exécute une variante dans le processus courant et retourne ses mesures."""
+    render = legacy_render if variant == "legacy" else in_memory_render
+    pdf_bytes = make_sample_pdf(nb_pages)
+    render(pdf_bytes)  # échauffement
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(pdf_bytes)
+        durations.append(time.perf_counter() - start)
+
+    best = min(durations)
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return {
+        "variant": variant,
+        "pages": nb_pages,
+        "ms_per_page": round(best * 1000 / nb_pages, 2),
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 3, 6])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.pages[0], args.repeat)))
+        return
+
+    print(f"{'pages':>5}  {'variante':<10}  {'ms/page':>8}  {'pic RSS (Mo)':>12}")
+    for nb_pages in args.pages:
+        for variant in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant,
+                 "--pages", str(nb_pages), "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            res = json.loads(out)
+            print(f"{res['pages']:>5}  {res['variant']:<10}  {res['ms_per_page']:>8}  {res['peak_rss_mb']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Analyse d'un lot de CV contre le faux serveur OpenAI avec injection de 429/500,
+pour vérifier que l'ordonnanceur (scheduler.py) mène le lot à terme.
+
+Usage :
+    python benchmarks/bench_scheduler.py [--cvs 40] [--error-rate 0.3] [--rpm 600] [--max-in-flight 8]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai
+
+import scheduler
+from analysis import analyze_cvs_concurrently
+from bench_rasterization import make_sample_pdf
+from fake_openai import start_server
+
+JOB_OFFER = "Développeur Python senior : Django, API REST, PostgreSQL, Docker."
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cvs", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--rpm", type=int, default=600, help="Requêtes par minute admises")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args()
+
+    server, base_url = start_server(latency=args.latency, error_rate=args.error_rate, retry_after=args.retry_after)
+    client = openai.OpenAI(api_key="test", base_url=base_url, max_retries=0)
+    sched = scheduler.configure(requests_per_minute=args.rpm)
+
+    pdf_files = [(f"cv_{i:03d}.pdf", make_sample_pdf(1 + i % 3)) for i in range(args.cvs)]
+    start = time.perf_counter()
+    succeeded = failed = 0
+    for _, result, error in analyze_cvs_concurrently(pdf_files, JOB_OFFER, client, max_in_flight=args.max_in_flight):
+        if error:
+            failed += 1
+            print(f"❌ {type(error).__name__} : {error}")
+        else:
+            succeeded += 1
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    errors = server.RequestHandlerClass.state.errors
+    print(f"✅ {succeeded}/{args.cvs} CV analysés, {failed} échec(s) en {elapsed:.1f} s")
+    print(f"💥 Erreurs injectées : {errors[429]} × 429, {errors[500]} × 500")
+    print(f"🔁 Ordonnanceur : {sched.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark du démarrage à froid (conteneur) : durée d'import des modules cœur
+(db, utils, analysis) et modules lourds chargés au passage, puis durée du premier
+rendu de app.py et d'un rerun, chacun dans un processus neuf.
+
+Usage :
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("streamlit", "fitz", "openai", "pandas")
+STAGES = ("core", "app")
+
+
+def run_stage(stage):
+    """Exécuté dans le processus fils ; retourne les mesures de l'étape."""
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    if stage == "core":
+        import db, utils, analysis  # noqa: F401
+        return {"import_ms": (time.perf_counter() - start) * 1000,
+                "heavy": [name for name in HEAVY_MODULES if name in sys.modules]}
+
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.secrets["OPENAI_API_KEY"] = "sk-test"
+    at.run()
+    first = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return {"import_ms": (imported - start) * 1000,
+            "first_render_ms": (first - imported) * 1000,
+            "rerun_ms": (rerun - first) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        print(json.dumps(run_stage(args.stage)))
+        return
+
+    for stage in STAGES:
+        results = []
+        for _ in range(args.repeat):
+            # Base vide dans un répertoire neuf : le premier rendu crée le schéma
+            with tempfile.TemporaryDirectory() as tmp:
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--stage", stage],
+                                     cwd=tmp, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+        print(f"📦 {stage} :")
+        for key in results[0]:
+            if key == "heavy":
+                print(f"  modules lourds importés : {', '.join(results[0][key]) or 'aucun'}")
+            else:
+                print(f"  {key:<16} médiane {statistics.median(r[key] for r in results):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Suite de benchmarks reproductible du pipeline d'analyse, étape par étape, sur des CV
+synthétiques (texte seul ou scannés en images, 1 à 10 pages) :
+
+    render    rendu PDF -> images (utils.pdf_to_images_from_bytes), ms par page
+    encode    encodage base64 PNG / JPEG et encodage optimisé, ms par page
+    payload   taille de la requête envoyée au modèle (octets, tokens image estimés)
+    parse     décodage et validation de la réponse (analysis.parse_analysis), json.loads en référence
+    insert    débit de db.insert_analysis (lignes/s)
+    queries   latence de get_all_analyses / get_all_job_offers, de la recherche plein
+              texte (search_analyses) et des requêtes par compétence à 1k, 100k et 1M analyses
+    pipeline  lot complet (analyze_cvs_concurrently) avec un modèle simulé à latence fixe
+
+Les résultats (meilleure de --repeat mesures) sont écrits dans un fichier JSON, comparable d'un commit à
+l'autre : --compare signale toute métrique dégradée au-delà du seuil et termine avec
+le code 1.
+
+Usage :
+    python benchmarks/bench_suite.py --output bench_main.json
+    python benchmarks/bench_suite.py --output bench_branche.json --compare bench_main.json --threshold 0.25
+    python benchmarks/bench_suite.py --stages render encode parse --repeat 3
+    python benchmarks/bench_suite.py --stages queries --sizes 1000 100000
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fitz  # PyMuPDF
+
+import db
+from analysis import analyze_cvs_concurrently, build_request, parse_analysis, prompt_cache_summary
+from fake_openai import fake_analysis, start_server
+from skills import canonical_skill
+from utils import _encode, image_data_url, image_to_base64, optimize_page_image, pdf_to_images_from_bytes
+
+STAGES = ("render", "encode", "payload", "parse", "insert", "queries", "pipeline")
+KINDS = ("text", "scanned")
+PAGE_COUNTS = (1, 3, 10)
+QUERY_SIZES = (1_000, 100_000, 1_000_000)
+DEFAULT_THRESHOLD = 0.25
+JOB_OFFER = "Développeur Python senior : Django, API REST, PostgreSQL, Docker, CI/CD."
+# Offre de longueur réaliste pour le lot complet : avec les instructions, le préfixe commun
+# dépasse le minimum de 1024 tokens du cache de prompt de l'API
+FULL_JOB_OFFER = JOB_OFFER + """
+
+L'entreprise : éditeur français de logiciels RH fondé en 2012, 180 salariés répartis entre
+Lyon, Paris et Nantes, en croissance régulière et rentable. Nos produits couvrent la diffusion
+des offres, le suivi des candidatures, l'entretien vidéo et l'intégration des nouveaux
+collaborateurs. L'équipe technique compte quarante personnes organisées en équipes produit
+autonomes, avec des rituels partagés (revues d'architecture, journées d'innovation).
+
+Au sein d'une équipe produit de huit personnes, vous concevez et faites évoluer les services
+backend d'une plateforme de recrutement utilisée par plusieurs centaines d'entreprises.
+
+Missions :
+- Concevoir, développer et maintenir des API REST et des traitements asynchrones en Python.
+- Modéliser les données et optimiser les requêtes PostgreSQL (index, plans d'exécution).
+- Mettre en place les tests automatisés (unitaires, intégration) et l'intégration continue.
+- Conteneuriser les services avec Docker et participer au déploiement sur Kubernetes.
+- Superviser la production : métriques, journaux, alertes, analyse des incidents.
+- Participer aux revues de code et accompagner les développeurs moins expérimentés.
+- Travailler avec le produit et le design pour découper et estimer les fonctionnalités.
+
+Profil recherché :
+- Au moins cinq ans d'expérience en développement backend, dont trois avec Django.
+- Très bonne maîtrise de Python, de SQL et des principes de conception d'API.
+- Expérience des files de messages (RabbitMQ, Celery ou équivalent) et du cache (Redis).
+- Connaissance d'un fournisseur cloud (AWS ou GCP) et de l'infrastructure as code.
+- Pratique des méthodes agiles, du développement piloté par les tests et de Git.
+- Anglais technique lu et écrit ; sens de la communication et autonomie.
+
+Atouts appréciés :
+- Expérience des moteurs de recherche plein texte (Elasticsearch, PostgreSQL FTS).
+- Contributions open source, interventions en meetup ou articles techniques.
+- Connaissance du RGPD et des bonnes pratiques de sécurité applicative (OWASP).
+
+Conditions : CDI à Lyon, télétravail trois jours par semaine, 55 à 65 k€ selon expérience,
+budget formation annuel, participation aux conférences techniques.
+
+Processus de recrutement : un premier échange de trente minutes avec la responsable technique,
+un exercice pratique à réaliser chez vous (trois heures au maximum) puis sa restitution avec
+deux développeurs de l'équipe, et enfin une rencontre avec le directeur produit. Nous nous
+engageons à répondre à chaque candidature sous dix jours ouvrés.
+"""
+
+
+def make_cv_pdf(kind, nb_pages, seed=0):
+    """
+    CV synthétique de `nb_pages` pages. « text » : couche texte lisible (chemin texte) ;
+    « scanned » : pages rendues en image sans couche texte, avec une photo (chemin vision).
+    """
+    rng = random.Random(seed)
+    source = fitz.open()
+    for page_no in range(nb_pages):
+        page = source.new_page()
+        page.insert_text((72, 72), f"Candidat {seed} - Développeur Python Senior (page {page_no + 1})", fontsize=16)
+        y = 110
+        for line in range(40):
+            skills = ", ".join(rng.sample(["Django", "Flask", "API REST", "PostgreSQL", "Docker",
+                                           "Kubernetes", "CI/CD", "Celery", "Redis", "AWS"], 4))
+            page.insert_text((72, y), f"Expérience {line} : {skills}", fontsize=10)
+            y += 16
+        page.draw_rect(fitz.Rect(400, 60, 540, 200), color=(0.2, 0.3, 0.6), fill=(0.85, 0.9, 1.0))
+    if kind == "text":
+        pdf_bytes = source.tobytes()
+        source.close()
+        return pdf_bytes
+
+    scanned = fitz.open()
+    for page in source:
+        pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))
+        target = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        target.insert_image(target.rect, pixmap=pix)
+        # Photo d'identité : bruit coloré, peu compressible
+        photo = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 120, 150), False)
+        photo.set_rect(photo.irect, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        for _ in range(3000):
+            photo.set_pixel(rng.randrange(120), rng.randrange(150),
+                            (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        target.insert_image(fitz.Rect(420, 60, 540, 210), pixmap=photo)
+    pdf_bytes = scanned.tobytes(deflate=True)
+    scanned.close()
+    source.close()
+    return pdf_bytes
+
+
+def time_ms(fn, repeat):
+    """
+    Durée d'un appel (ms) : meilleure de `repeat` mesures, chacune répétant l'appel assez
+    de fois pour durer au moins 0,2 s (le minimum est le moins sensible à la charge de
+    la machine).
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+
+class Results:
+    """Métriques nommées avec leur unité et leur sens d'amélioration."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better="lower"):
+        self.metrics[name] = {"value": round(value, 4), "unit": unit, "better": better}
+        print(f"  {name:<52}{value:>14.3f} {unit}")
+
+
+def bench_render(results, documents, repeat):
+    for (kind, nb_pages), pdf_bytes in documents.items():
+        ms = time_ms(lambda: pdf_to_images_from_bytes(pdf_bytes), repeat)
+        results.add(f"render.{kind}.p{nb_pages}.ms_per_page", ms / nb_pages, "ms")
+
+
+def bench_encode(results, documents, repeat):
+    for kind in KINDS:
+        images = pdf_to_images_from_bytes(documents[(kind, 3)])
+        for label, encode in (
+            ("png_base64", lambda image: image_data_url({"mime": "image/png", "data": _encode(image, "PNG")})),
+            ("jpeg_base64", image_to_base64),
+            ("optimized", lambda image: image_data_url(optimize_page_image(image))),
+        ):
+            ms = time_ms(lambda: [encode(image) for image in images], repeat)
+            results.add(f"encode.{kind}.{label}.ms_per_page", ms / len(images), "ms")
+
+
+def bench_payload(results, documents):
+    for (kind, nb_pages), pdf_bytes in documents.items():
+        body, details = build_request(pdf_bytes, JOB_OFFER)
+        results.add(f"payload.{kind}.p{nb_pages}.bytes", len(json.dumps(body)), "octets")
+        if details.get("payload"):
+            results.add(f"payload.{kind}.p{nb_pages}.image_tokens",
+                        sum(page["tokens"] for page in details["payload"]), "tokens")
+
+
+def bench_parse(results, repeat):
+    response = fake_analysis("bench")
+    fenced = f"```json\n{response}\n```"
+    for label, text in (("plain", response), ("fenced", fenced)):
+        results.add(f"parse.{label}.us_per_call", time_ms(lambda: parse_analysis(text), repeat) * 1000, "µs")
+    # Référence : décodage seul, sans validation du schéma
+    results.add("parse.json_loads.us_per_call", time_ms(lambda: json.loads(response), repeat) * 1000, "µs")
+
+
+def _use_database(path):
+    """Fait pointer db.py vers `path` (base temporaire du benchmark)."""
+    db.DB_PATH = path
+    db.init_db()
+
+
+def bench_insert(results, workdir, repeat, rows=2000):
+    analysis = parse_analysis(fake_analysis("insert"))
+    rates = []
+    batch_rates = []
+    for run in range(repeat):
+        _use_database(os.path.join(workdir, f"insert_{run}.db"))
+        job_offer_id = db.save_job_offer("Offre", JOB_OFFER)
+        start = time.perf_counter()
+        for n in range(rows):
+            db.insert_analysis(f"cv_{n}.pdf", analysis, job_offer_id)
+        rates.append(rows / (time.perf_counter() - start))
+        start = time.perf_counter()
+        for first in range(0, rows, db.FLUSH_ROWS):
+            db.insert_analyses([(f"cv_{n}.pdf", analysis, job_offer_id)
+                                for n in range(first, min(rows, first + db.FLUSH_ROWS))])
+        batch_rates.append(rows / (time.perf_counter() - start))
+        db.get_db().close()
+    results.add("insert.rows_per_second", max(rates), "lignes/s", better="higher")
+    results.add("insert.batch_rows_per_second", max(batch_rates), "lignes/s", better="higher")
+
+
+# Vocabulaire des commentaires et expériences synthétiques (recherche plein texte)
+SKILLS = ["Python", "Django", "FastAPI", "PostgreSQL", "Docker", "Kubernetes", "AWS", "Azure",
+          "Terraform", "React", "TypeScript", "Java", "Spring", "Kafka", "Spark", "Airflow",
+          "Go", "Rust", "Linux", "Ansible", "GraphQL", "Redis", "MongoDB", "Elasticsearch",
+          "Scrum", "Jenkins", "GitLab", "Pandas", "PyTorch", "Figma"]
+FIRST_NAMES = ["Camille", "Léa", "Hugo", "Nora", "Lucas", "Inès", "Karim", "Manon", "Thomas", "Yasmine",
+               "Julien", "Chloé", "Mehdi", "Sarah", "Antoine", "Fatou", "Nicolas", "Emma", "Rayan", "Zoé"]
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy",
+              "Moreau", "Simon", "Laurent", "Lefebvre", "Michel", "Garcia", "David", "Bertrand", "Roux",
+              "Vincent", "Fournier", "Morel", "Girard", "André", "Mercier", "Dupont", "Lambert", "Bonnet",
+              "François", "Martinez", "Legrand", "Garnier", "Faure", "Rousseau", "Blanc", "Guerin", "Muller",
+              "Henry", "Roussel", "Nicolas", "Perrin"]
+COMPANIES = ["Capgemini", "Thales", "Orange", "Airbus", "Doctolib", "BlaBlaCar", "Criteo",
+             "Dassault Systèmes", "Société Générale", "Ubisoft", "OVHcloud", "Decathlon"]
+# Recherches mesurées : un nom, deux compétences, une entreprise (préfixe) filtrée par offre
+SEARCHES = [
+    ("name", "Yasmine Guérin", {}),
+    ("skills", "Kubernetes Kafka", {}),
+    ("company_offer", "Société Gén", {"job_offer_id": "offer0007"}),
+]
+# Requêtes par compétence : candidats de toutes les offres ayant deux compétences, par score
+SKILL_QUERY = ("Kubernetes", "Kafka")
+
+
+def build_database(path, nb_rows, nb_offers=200):
+    """Base de `nb_rows` analyses réparties sur `nb_offers` offres, remplie avant les migrations."""
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    db._create_schema(c)
+    start_date = datetime(2024, 1, 1)
+    offers = [(f"offer{n:04d}", f"Offre {n}", "Contenu",
+               (start_date + timedelta(days=n)).strftime(db.DATE_FORMAT)) for n in range(nb_offers)]
+    c.executemany('INSERT INTO job_offers (id, title, content, created_date) VALUES (?, ?, ?, ?)', offers)
+
+    # Compétences maîtrisées et manquante de chaque analyse, enregistrées après les migrations
+    skill_ids = {skill: n + 1 for n, skill in enumerate(SKILLS)}
+    links = []
+
+    def rows():
+        for n in range(nb_rows):
+            matched, missing = rng.sample(SKILLS, 3), rng.choice(SKILLS)
+            links.extend((skill_ids[skill], "matched", n + 1) for skill in matched)
+            links.append((skill_ids[missing], "missing", n + 1))
+            yield (offers[n % nb_offers][0], f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"cv_{n}.pdf", rng.randint(0, 100),
+                   rng.randint(0, 40), rng.randint(0, 30), rng.randint(0, 15), rng.randint(0, 15),
+                   f"Maîtrise {', '.join(matched)}, à approfondir : {missing}.",
+                   (start_date + timedelta(minutes=n)).strftime(db.DATE_FORMAT),
+                   f"{rng.randint(2, 12)} ans chez {rng.choice(COMPANIES)} en {rng.choice(SKILLS)}")
+
+    c.executemany('''
+        INSERT INTO analyses (job_offer_id, nom_prenom, filename, score_global, score_technique,
+                              score_experience, score_formation, score_soft_skills, commentaire, date,
+                              experience_pertinente)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows())
+    db.apply_migrations(c, verbose=False)
+    c.executemany('INSERT INTO skills (id, name, label) VALUES (?, ?, ?)',
+                  [(skill_ids[skill], *canonical_skill(skill)) for skill in SKILLS])
+    c.executemany('INSERT OR IGNORE INTO analysis_skills (skill_id, kind, analysis_id) VALUES (?, ?, ?)', links)
+    conn.commit()
+    conn.close()
+
+
+def bench_queries(results, workdir, sizes, repeat):
+    for size in sizes:
+        path = os.path.join(workdir, f"queries_{size}.db")
+        build_database(path, size)
+        _use_database(path)
+        # Lectures mesurées sans le cache de cached_read (première lecture après une écriture)
+        for name in ("get_all_analyses", "get_all_job_offers"):
+            fn = getattr(db, name).__wrapped__
+            results.add(f"queries.{name}.{size}.ms", time_ms(fn, repeat), "ms")
+        for name, text, filters in SEARCHES:
+            results.add(f"queries.search_analyses.{name}.{size}.ms",
+                        time_ms(lambda: db.search_analyses.__wrapped__(text, **filters), repeat), "ms")
+        results.add(f"queries.skills_candidates.{size}.ms",
+                    time_ms(lambda: db.query_analyses.__wrapped__(sort="score", skills=SKILL_QUERY), repeat), "ms")
+        results.add(f"queries.skill_counts_offer.{size}.ms",
+                    time_ms(lambda: db.get_skill_counts.__wrapped__("missing", "offer0007"), repeat), "ms")
+        db.get_db().close()
+
+
+def bench_pipeline(results, documents, llm_latency, max_in_flight, nb_cvs=24):
+    import openai
+
+    server, base_url = start_server(latency=llm_latency)
+    client = openai.OpenAI(api_key="test", base_url=base_url, max_retries=0)
+    # CV tous différents, comme dans un vrai lot : seul le préfixe commun peut être lu dans le cache
+    layouts = list(documents)
+    pdf_files = [(f"cv_{n:02d}.pdf", make_cv_pdf(*layouts[n % len(layouts)], seed=n)) for n in range(nb_cvs)]
+    start = time.perf_counter()
+    outcomes = list(analyze_cvs_concurrently(pdf_files, FULL_JOB_OFFER, client, max_in_flight))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    failures = sum(1 for _, _, error in outcomes if error is not None)
+    if failures:
+        print(f"  ⚠️ {failures} analyse(s) en échec")
+    prompt_cache = prompt_cache_summary([result for _, result, error in outcomes if error is None])
+    results.add("pipeline.cv_per_second", nb_cvs / elapsed, "CV/s", better="higher")
+    results.add("pipeline.ms_per_cv", elapsed * 1000 / nb_cvs, "ms")
+    results.add("pipeline.prompt_cache_hit_rate", prompt_cache["hit_rate"], "ratio", better="higher")
+
+
+def compare(current, baseline, threshold):
+    """Affiche l'évolution de chaque métrique ; retourne la liste des régressions."""
+    regressions = []
+    print(f"\n📊 Comparaison avec la référence (seuil {threshold:.0%})")
+    for name, metric in current["metrics"].items():
+        reference = baseline["metrics"].get(name)
+        if reference is None or not reference["value"]:
+            continue
+        change = (metric["value"] - reference["value"]) / reference["value"]
+        worse = change if metric["better"] == "lower" else -change
+        flag = "❌" if worse > threshold else "✅" if worse < -threshold else "  "
+        print(f"{flag} {name:<52}{reference['value']:>12.3f} -> {metric['value']:>12.3f} {metric['unit']:<9}{change:+.1%}")
+        if worse > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=5, help="Répétitions par mesure (médiane)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(QUERY_SIZES),
+                        help="Nombres d'analyses en base pour l'étape queries")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Latence simulée du modèle (s)")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--output", default="bench_results.json", help="Fichier JSON des résultats")
+    parser.add_argument("--compare", help="Fichier JSON de référence")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Dégradation relative tolérée avant d'échouer (0.25 = 25 %%)")
+    args = parser.parse_args()
+
+    documents = {(kind, nb_pages): make_cv_pdf(kind, nb_pages, seed=nb_pages)
+                 for kind in KINDS for nb_pages in PAGE_COUNTS}
+    results = Results()
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        for stage in args.stages:
+            print(f"⏱️ {stage}")
+            if stage == "render":
+                bench_render(results, documents, args.repeat)
+            elif stage == "encode":
+                bench_encode(results, documents, args.repeat)
+            elif stage == "payload":
+                bench_payload(results, documents)
+            elif stage == "parse":
+                bench_parse(results, args.repeat)
+            elif stage == "insert":
+                bench_insert(results, workdir, args.repeat)
+            elif stage == "queries":
+                bench_queries(results, workdir, args.sizes, args.repeat)
+            elif stage == "pipeline":
+                bench_pipeline(results, documents, args.llm_latency, args.max_in_flight)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "args": vars(args),
+        },
+        "metrics": results.metrics,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Résultats écrits dans {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} régression(s) au-delà de {args.threshold:.0%}")
+            sys.exit(1)
+        print("✅ Aucune régression")
+
+
+if __name__ == "__main__":
+    main()
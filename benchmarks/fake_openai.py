@@ -0,0 +1,364 @@
+"""
+Serveur local imitant les endpoints OpenAI utilisés par l'application
+(/v1/responses, /v1/files, /v1/batches), pour tester sans clé ni coût.
+
+Usage :
+    python benchmarks/fake_openai.py --port 8765 --latency 0.5 --batch-delay 5 [--error-rate 0.2] [--invalid-rate 0.1]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test python batch.py ...
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_analysis(seed):
+    """Analyse JSON déterministe dérivée d'une graine (le contenu de la requête)."""
+    digest = hashlib.sha256(seed.encode()).digest()
+    technique, experience, formation, soft = digest[0] % 41, digest[1] % 31, digest[2] % 16, digest[3] % 16
+    total = technique + experience + formation + soft
+    return json.dumps({
+        "nom_prenom": f"Candidat {digest[4:7].hex()}",
+        "score_technique": technique,
+        "score_experience": experience,
+        "score_formation": formation,
+        "score_soft_skills": soft,
+        "score_global": total,
+        "points_forts": ["Python", "Travail en équipe"],
+        "points_faibles": ["Peu d'expérience cloud"],
+        "competences_matchees": ["Python", "Django"],
+        "competences_manquantes": ["Kubernetes"],
+        "experience_pertinente": "Trois ans de développement backend.",
+        "recommandation": "Recommandé" if total >= 70 else "À considérer" if total >= 50 else "Non recommandé",
+        "commentaires": "Profil généré par le serveur de test.",
+        "pages_analysees": 1,
+        "methode_analyse": "GPT-5 "
+    }, ensure_ascii=False)
+
+
+# Tokens facturés par image (ordre de grandeur d'une page en détail « high »)
+IMAGE_INPUT_TOKENS = 765
+
+
+def input_token_count(body):
+    """Tokens d'entrée : texte ~4 caractères/token, forfait par image (pas la taille du base64)."""
+    tokens = 0
+    for message in body.get("input", []):
+        content = message.get("content", [])
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content:
+            if part.get("type") == "input_image":
+                tokens += IMAGE_INPUT_TOKENS
+            else:
+                tokens += len(part.get("text", "")) // 4
+    return max(1, tokens)
+
+
+# Cache de prompt simulé, comme celui de l'API : préfixe d'au moins 1024 tokens, compté
+# par tranches de 128, et temps de traitement réduit pour la part lue dans le cache
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+CACHED_LATENCY_SAVING = 0.5
+
+
+def prefix_boundaries(body):
+    """Empreinte et nombre de tokens de chaque préfixe de l'entrée, partie par partie."""
+    digest = hashlib.sha256(body.get("model", "").encode())
+    tokens = 0
+    for message in body.get("input", []):
+        content = message.get("content", [])
+        parts = [{"type": "input_text", "text": content}] if isinstance(content, str) else content
+        digest.update(message.get("role", "").encode())
+        for part in parts:
+            digest.update(json.dumps(part, sort_keys=True).encode())
+            tokens += IMAGE_INPUT_TOKENS if part.get("type") == "input_image" else len(part.get("text", "")) // 4
+            yield digest.hexdigest(), tokens
+
+
+def fake_response(body, cached_tokens=0, invalid=False):
+    """
+    Objet Response minimal compatible avec le SDK openai. Avec un schéma imposé
+    (structured outputs), seuls ses champs sont renvoyés ; `invalid` tronque la réponse.
+    """
+    seed = json.dumps(body, sort_keys=True)
+    text = fake_analysis(seed)
+    schema = ((body.get("text") or {}).get("format") or {}).get("schema")
+    if schema:
+        fields = json.loads(text)
+        text = json.dumps({name: fields[name] for name in schema["properties"] if name in fields}, ensure_ascii=False)
+    if invalid:
+        text = text[:len(text) // 2]
+    input_tokens = input_token_count(body)
+    output_tokens = max(1, len(text) // 4)
+    return {
+        "id": f"resp_{uuid.uuid4().hex[:24]}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "gpt-5-mini"),
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}]
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": min(cached_tokens, input_tokens)},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens
+        }
+    }
+
+
+class FakeOpenAIState:
+    def __init__(self, latency=0.0, batch_delay=0.0, error_rate=0.0, retry_after=1.0, seed=0, invalid_rate=0.0):
+        self.latency = latency
+        self.batch_delay = batch_delay
+        # Injection de pannes sur /v1/responses : moitié de 429 (avec Retry-After), moitié de 500
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        # Proportion de réponses au JSON tronqué (réparation des réponses invalides)
+        self.invalid_rate = invalid_rate
+        self.random = random.Random(seed)
+        self.errors = {429: 0, 500: 0}
+        self.files = {}
+        self.batches = {}
+        self.prompt_prefixes = set()
+        self.lock = threading.Lock()
+
+    def invalid_response(self):
+        """Vrai si cette réponse doit être invalide."""
+        if not self.invalid_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.invalid_rate
+
+    def cached_prefix_tokens(self, body):
+        """Tokens du plus long préfixe déjà vu (0 sous le minimum), puis mémorise ceux de la requête."""
+        boundaries = list(prefix_boundaries(body))
+        with self.lock:
+            cached = max((tokens for key, tokens in boundaries if key in self.prompt_prefixes), default=0)
+            self.prompt_prefixes.update(key for key, tokens in boundaries if tokens >= PROMPT_CACHE_MIN_TOKENS)
+        if cached < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        return cached - cached % PROMPT_CACHE_INCREMENT
+
+    def response_latency(self, response):
+        """Latence simulée, réduite pour la part de l'entrée lue dans le cache de prompt."""
+        usage = response["usage"]
+        cached_share = usage["input_tokens_details"]["cached_tokens"] / usage["input_tokens"]
+        return self.latency * (1 - CACHED_LATENCY_SAVING * cached_share)
+
+    def injected_error(self):
+        """Code d'erreur à renvoyer pour cette requête, ou None."""
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return None
+            status = 429 if self.random.random() < 0.5 else 500
+            self.errors[status] += 1
+            return status
+
+    def add_file(self, filename, data, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.files[file_id] = {"filename": filename, "data": data, "purpose": purpose,
+                                   "created_at": int(time.time())}
+        return self.file_object(file_id)
+
+    def file_object(self, file_id):
+        f = self.files[file_id]
+        return {"id": file_id, "object": "file", "bytes": len(f["data"]), "created_at": f["created_at"],
+                "filename": f["filename"], "purpose": f["purpose"], "status": "processed"}
+
+    def create_batch(self, params):
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": params["endpoint"],
+                "input_file_id": params["input_file_id"],
+                "completion_window": params.get("completion_window", "24h"),
+                "metadata": params.get("metadata"),
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}
+            }
+        return self.batches[batch_id]
+
+    def refresh_batch(self, batch_id):
+        """Termine le lot une fois le délai écoulé en produisant son fichier de sortie."""
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch["status"] in ("completed", "failed"):
+                return batch
+            if time.time() - batch["created_at"] < self.batch_delay:
+                batch["status"] = "in_progress"
+                return batch
+            lines = self.files[batch["input_file_id"]]["data"].decode().splitlines()
+
+        output = []
+        for line in filter(None, lines):
+            request = json.loads(line)
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:16]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                             "body": fake_response(request["body"])},
+                "error": None
+            }, ensure_ascii=False))
+        output_file = self.add_file("batch_output.jsonl", ("\n".join(output) + "\n").encode(), "batch_output")
+
+        with self.lock:
+            batch.update({
+                "status": "completed",
+                "output_file_id": output_file["id"],
+                "completed_at": int(time.time()),
+                "request_counts": {"total": len(output), "completed": len(output), "failed": 0}
+            })
+            return batch
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    state = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _stream_response(self, response, latency):
+        """Envoie la réponse en Server-Sent Events, par petits morceaux de texte."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        text = response["output"][0]["content"][0]["text"]
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        events = [{"type": "response.created", "response": {**response, "status": "in_progress", "output": []}}]
+        events += [{"type": "response.output_text.delta", "item_id": response["output"][0]["id"],
+                    "output_index": 0, "content_index": 0, "delta": chunk, "logprobs": []} for chunk in chunks]
+        events.append({"type": "response.completed", "response": response})
+
+        delay = latency / max(1, len(events))
+        for sequence_number, event in enumerate(events):
+            event["sequence_number"] = sequence_number
+            self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path == "/v1/responses":
+            params = json.loads(body)
+            status = self.state.injected_error()
+            if status == 429:
+                return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                                       "code": "rate_limit_exceeded"}},
+                                       headers={"retry-after": str(self.state.retry_after)})
+            if status == 500:
+                return self._send_json(500, {"error": {"message": "Internal server error", "type": "server_error"}})
+            response = fake_response(params, self.state.cached_prefix_tokens(params), self.state.invalid_response())
+            latency = self.state.response_latency(response)
+            if params.get("stream"):
+                return self._stream_response(response, latency)
+            if latency:
+                time.sleep(latency)
+            return self._send_json(200, response)
+        if self.path == "/v1/files":
+            message = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+            )
+            fields = {}
+            for part in message.iter_parts():
+                fields[part.get_param("name", header="content-disposition")] = (
+                    part.get_filename(), part.get_payload(decode=True)
+                )
+            filename, data = fields["file"]
+            purpose = fields.get("purpose", (None, b"batch"))[1].decode()
+            return self._send_json(200, self.state.add_file(filename, data, purpose))
+        if self.path == "/v1/batches":
+            return self._send_json(200, self.state.create_batch(json.loads(body)))
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        if match and match.group(1) in self.state.batches:
+            return self._send_json(200, self.state.refresh_batch(match.group(1)))
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+        if match and match.group(1) in self.state.files:
+            data = self.state.files[match.group(1)]["data"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+def start_server(port=0, **state_options):
+    """Démarre le serveur dans un thread ; retourne (server, base_url)."""
+    handler = type("Handler", (FakeOpenAIHandler,), {"state": FakeOpenAIState(**state_options)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latence simulée de /v1/responses (s)")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Durée avant qu'un lot soit terminé (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 429/500 injectées")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="En-tête Retry-After des 429 (s)")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Proportion de réponses au JSON tronqué")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, latency=args.latency, batch_delay=args.batch_delay,
+                                    error_rate=args.error_rate, retry_after=args.retry_after,
+                                    invalid_rate=args.invalid_rate)
+    print(f"🧪 Faux serveur OpenAI sur {base_url} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
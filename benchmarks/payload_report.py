@@ -0,0 +1,53 @@
+"""
+Rapport de charge utile des images envoyées au modèle vision.
+
+Affiche, pour chaque page, le poids et les tokens estimés de l'encodage PNG brut
+(rendu zoom 2.0) et de l'encodage produit par utils.optimize_page_image.
+
+Usage :
+    python benchmarks/payload_report.py cv1.pdf cv2.pdf
+    python benchmarks/payload_report.py            # CV synthétiques
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rasterization import make_sample_pdf
+from utils import pdf_to_images_from_bytes, payload_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="Fichiers PDF à analyser")
+    args = parser.parse_args()
+
+    if args.pdfs:
+        documents = []
+        for path in args.pdfs:
+            with open(path, "rb") as f:
+                documents.append((os.path.basename(path), f.read()))
+    else:
+        documents = [(f"synthetique_{n}p.pdf", make_sample_pdf(n)) for n in (1, 3)]
+
+    totals = {"bytes_before": 0, "bytes_after": 0, "tokens_before": 0, "tokens_after": 0}
+    print(f"{'fichier':<28} {'page':>4} {'octets avant':>13} {'octets après':>13} "
+          f"{'tokens avant':>13} {'tokens après':>13}  format      taille")
+    for name, pdf_bytes in documents:
+        for row in payload_report(pdf_to_images_from_bytes(pdf_bytes)):
+            for key in totals:
+                totals[key] += row[key]
+            print(f"{name[:28]:<28} {row['page']:>4} {row['bytes_before']:>13} {row['bytes_after']:>13} "
+                  f"{row['tokens_before']:>13} {row['tokens_after']:>13}  {row['format']:<11} {row['size_after']}")
+
+    print()
+    print(f"Octets : {totals['bytes_before']} -> {totals['bytes_after']} "
+          f"({100 * (1 - totals['bytes_after'] / max(1, totals['bytes_before'])):.0f} % de moins)")
+    print(f"Tokens estimés : {totals['tokens_before']} -> {totals['tokens_after']} "
+          f"({100 * (1 - totals['tokens_after'] / max(1, totals['tokens_before'])):.0f} % de moins)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,49 @@
 # Configuration pour l'analyse de CV avec IA
-# Utilise les secrets Streamlit pour la clé API OpenAI
+# Clé API OpenAI : secrets Streamlit, config_local.py ou variable d'environnement.
+# Streamlit n'est pas importé ici : les scripts en ligne de commande restent légers.
 
-import streamlit as st
+import os
+import sys
 
-try:
-    # Récupère la clé API depuis les secrets Streamlit
-    OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
-except (KeyError, FileNotFoundError):
+def _load_api_key():
+    # Secrets Streamlit, uniquement si l'application tourne sous Streamlit
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        try:
+            return st.secrets["OPENAI_API_KEY"]
+        except (KeyError, FileNotFoundError):
+            pass
     # Fallback pour le développement local
     try:
         from config_local import OPENAI_API_KEY
+        return OPENAI_API_KEY
     except ImportError:
-        OPENAI_API_KEY = "your_openai_api_key_here"
-        st.warning("⚠️ Clé API OpenAI non configurée. Veuillez ajouter OPENAI_API_KEY dans vos secrets Streamlit.")
+        return os.environ.get("OPENAI_API_KEY")
+
+# None si aucune clé n'est configurée (l'application affiche alors un avertissement)
+OPENAI_API_KEY = _load_api_key()
 
 GPT_MODEL = "gpt-4"  # Utiliser gpt-4 au lieu de gpt-5
 
-OUTPUT_FORMAT = "json"
\ No newline at end of file
+OUTPUT_FORMAT = "json"
+
+# Nombre maximal d'analyses envoyées simultanément au modèle
+MAX_CONCURRENT_ANALYSES = 4
+
+# Affichage progressif des analyses pendant la génération (streaming)
+STREAM_RESPONSES = True
+
+# Démarrage automatique d'un processus worker (worker.py) par l'interface si aucun n'est actif
+AUTOSTART_WORKER = True
+
+# Service HTTP (api.py) : jeton attendu dans l'en-tête « Authorization: Bearer ... »
+# (aucune authentification si None) et taille maximale d'un envoi de CV
+API_TOKEN = os.environ.get("CV_API_TOKEN")
+API_MAX_UPLOAD_MB = 50
+
+# Tarifs du modèle en USD pour 1000 tokens : entrée, entrée servie par le cache de prompt
+# d'OpenAI, sortie ; les lots de l'API Batch sont facturés BATCH_PRICE_FACTOR fois ce tarif
+PRICE_INPUT = 0.00025
+PRICE_CACHED_INPUT = 0.000025
+PRICE_OUTPUT = 0.00200
+BATCH_PRICE_FACTOR = 0.5
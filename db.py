@@ -1,14 +1,296 @@
 import sqlite3
-from datetime import datetime
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import functools
 import hashlib
 import json
+import os
+import queue
+import re
+import threading
+import time
+import weakref
+
+from migrate_db import (apply_migrations, get_schema_version, table_exists, insert_analysis_lists,
+                        SCHEMA_VERSION, USAGE_COLUMNS)
+from skills import canonical_skill
 
 DB_PATH = "cv_analyses.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# Cache des résultats d'analyse : durée de vie et nombre maximal d'entrées
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+CACHE_MAX_ENTRIES = 5000
+
+# Accès partagé à la base : attente sur verrou, cache de requêtes préparées par connexion,
+# nombre maximal d'écritures regroupées dans une même transaction
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+WRITE_BATCH_MAX = 64
+
+# Format des dates en base (ISO-8601, triable chronologiquement)
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Nombre de résultats de lecture conservés par fonction (voir cached_read)
+READ_CACHE_SIZE = 128
+
+# Historique : taille des pages et longueur de l'aperçu des commentaires
+HISTORY_PAGE_SIZE = 50
+COMMENT_PREVIEW_CHARS = 100
+# Recherche plein texte : longueur (en mots) des extraits affichés
+SNIPPET_TOKENS = 12
+# Tri de l'historique -> colonnes de la clé de pagination (ordre décroissant)
+HISTORY_SORTS = {
+    "date": ("a.id",),
+    "score": ("a.score_global", "a.id"),
+}
+
+
+class Database:
+    """
+    Connexions partagées à une base SQLite en mode WAL.
+
+    Les lectures utilisent une connexion par thread (lecture seule), conservée entre
+    les appels avec son cache de requêtes préparées. Les écritures passent par une file
+    consommée par un thread écrivain unique : les écritures en attente sont validées
+    ensemble dans une transaction, chacune dans son propre savepoint.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        self._writer_thread = None
+        self._writer_lock = threading.Lock()
+        self._local = threading.local()
+        self.schema_ready = False
+
+    def _connect(self, readonly=False):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _ensure_writer(self):
+        if self._writer_thread is not None:
+            return
+        with self._writer_lock:
+            if self._writer_thread is None:
+                # La connexion d'écriture passe la base en WAL avant toute lecture
+                self._writer = self._connect()
+                thread = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+                thread.start()
+                self._writer_thread = thread
+
+    def _reader(self):
+        self._ensure_writer()
+        thread = threading.current_thread()
+        with self._readers_lock:
+            entry = self._readers.get(thread.ident)
+            if entry is not None and entry[0]() is thread:
+                return entry[1]
+            # Les threads de script Streamlit sont éphémères : on ferme les connexions orphelines
+            for ident, (ref, conn) in list(self._readers.items()):
+                owner = ref()
+                if owner is None or not owner.is_alive() or ident == thread.ident:
+                    conn.close()
+                    del self._readers[ident]
+            conn = self._connect(readonly=True)
+            self._readers[thread.ident] = (weakref.ref(thread), conn)
+            return conn
+
+    @contextmanager
+    def read(self):
+        """Curseur de lecture (dans une transaction en cours, celui de la transaction)."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is not None:
+            yield cursor
+            return
+        cursor = self._reader().cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def write(self, fn, *args):
+        """
+        Exécute `fn(cursor, *args)` via la file d'écriture et retourne son résultat
+        une fois la transaction validée. Les exceptions de `fn` sont relancées ici.
+        """
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is not None:
+            return fn(cursor, *args)
+        self._ensure_writer()
+        future = Future()
+        self._queue.put(("write", fn, args, future))
+        return future.result()
+
+    @contextmanager
+    def transaction(self):
+        """Transaction d'écriture (BEGIN IMMEDIATE) validée en sortie de bloc, annulée sur exception."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is not None:
+            yield cursor
+            return
+        self._ensure_writer()
+        granted, released = threading.Event(), threading.Event()
+        self._queue.put(("lease", granted, released))
+        try:
+            granted.wait()
+        except BaseException:
+            # Interrompu (Ctrl+C) avant d'obtenir la connexion : le bail est rendu d'avance
+            released.set()
+            raise
+        conn = self._writer
+        cursor = conn.cursor()
+        self._local.cursor = cursor
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield cursor
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.cursor = None
+            cursor.close()
+            released.set()
+
+    def _write_loop(self):
+        while True:
+            jobs = [self._queue.get()]
+            while jobs[-1][0] == "write" and len(jobs) < WRITE_BATCH_MAX:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lease = jobs.pop() if jobs[-1][0] != "write" else None
+            if jobs:
+                self._run_writes(jobs)
+            if lease is None:
+                continue
+            if lease[0] == "close":
+                self._writer.close()
+                return
+            # Un appelant de transaction() utilise la connexion d'écriture jusqu'à sa sortie
+            _, granted, released = lease
+            granted.set()
+            released.wait()
+
+    def _run_writes(self, jobs):
+        conn = self._writer
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for _, fn, args, future in jobs:
+                cursor = conn.cursor()
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    value = fn(cursor, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    results.append((future, None, e))
+                else:
+                    results.append((future, value, None))
+                finally:
+                    conn.execute('RELEASE write_job')
+                    cursor.close()
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, _, _, future in jobs:
+                future.set_exception(e)
+            return
+        for future, value, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def close(self):
+        """Ferme les connexions (le thread écrivain termine les écritures en attente)."""
+        if self._writer_thread is not None:
+            self._queue.put(("close",))
+            self._writer_thread.join()
+            self._writer_thread = None
+        with self._readers_lock:
+            for _, conn in self._readers.values():
+                conn.close()
+            self._readers.clear()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+def get_db(path=None):
+    """Gestionnaire partagé pour `path` (DB_PATH par défaut), recréé après un fork."""
+    key = (path or DB_PATH, os.getpid())
+    with _databases_lock:
+        db = _databases.get(key)
+        if db is None:
+            db = _databases[key] = Database(key[0])
+        return db
+
+def get_data_version():
+    """Version des données (incrémentée par triggers à chaque écriture), None avant init_db"""
+    try:
+        with get_db().read() as c:
+            c.execute("SELECT value FROM db_meta WHERE key = 'data_version'")
+            row = c.fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def cached_read(fn):
+    """
+    Mémorise les résultats d'une fonction de lecture, par base, version des données et
+    arguments : toute écriture (de ce processus ou d'un autre) change la version et
+    rend les entrées précédentes inaccessibles. Les résultats sont partagés entre les
+    appelants et ne doivent pas être modifiés.
+    """
+    @functools.lru_cache(maxsize=READ_CACHE_SIZE)
+    def cached(path, version, *args, **kwargs):
+        return fn(*args, **kwargs)
     
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        version = get_data_version()
+        if version is None:
+            return fn(*args, **kwargs)
+        return cached(DB_PATH, version, *args, **kwargs)
+    
+    wrapper.cache_clear = cached.cache_clear
+    wrapper.cache_info = cached.cache_info
+    return wrapper
+
+def init_db():
+    """
+    Crée ou migre le schéma, une seule fois par processus : les appels suivants (un
+    par rerun Streamlit) ne font rien, et une base déjà à jour ne coûte qu'un PRAGMA.
+    """
+    db = get_db()
+    if db.schema_ready:
+        return
+    with db.read() as c:
+        version = get_schema_version(c)
+    if version < SCHEMA_VERSION:
+        with db.transaction() as c:
+            # Base neuve : les migrations s'appliquent sans journal
+            new_database = not table_exists(c, 'analyses')
+            _create_schema(c)
+            apply_migrations(c, verbose=not new_database)
+    db.schema_ready = True
+
+def _create_schema(c):
     # Table pour les offres d'emploi
     c.execute('''
         CREATE TABLE IF NOT EXISTS job_offers (
@@ -19,8 +301,10 @@ def init_db():
         )
     ''')
     
-    # Table pour les analyses de CV
-    c.execute('''
+    # Table pour les analyses de CV, avec toutes ses colonnes : une base neuve n'a pas
+    # besoin des ALTER TABLE des migrations
+    usage_columns = "".join(f"{name} {col_type},\n            " for name, col_type in USAGE_COLUMNS)
+    c.execute(f'''
         CREATE TABLE IF NOT EXISTS analyses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             job_offer_id TEXT,
@@ -33,39 +317,11 @@ def init_db():
             score_soft_skills INTEGER,
             commentaire TEXT,
             date TEXT,
+            methode_analyse TEXT,
+            {usage_columns}experience_pertinente TEXT,
             FOREIGN KEY (job_offer_id) REFERENCES job_offers (id)
         )
     ''')
-    
-    # Vérifier si la colonne job_offer_id existe, sinon l'ajouter (migration)
-    try:
-        c.execute("PRAGMA table_info(analyses)")
-        columns = [column[1] for column in c.fetchall()]
-        
-        if 'job_offer_id' not in columns:
-            print("🔄 Migration: Ajout de la colonne job_offer_id...")
-            c.execute('ALTER TABLE analyses ADD COLUMN job_offer_id TEXT')
-            
-            # Créer une offre par défaut pour les analyses existantes
-            default_job_id = "default_legacy"
-            c.execute('''
-                INSERT OR IGNORE INTO job_offers (id, title, content, created_date)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                default_job_id,
-                "Offre héritée (analyses antérieures)",
-                "Analyses réalisées avant l'implémentation du système d'offres d'emploi",
-                datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-            ))
-            
-            # Mettre à jour les analyses existantes
-            c.execute('UPDATE analyses SET job_offer_id = ? WHERE job_offer_id IS NULL', (default_job_id,))
-            print("✅ Migration terminée")
-    except Exception as e:
-        print(f"⚠️ Erreur de migration : {e}")
-    
-    conn.commit()
-    conn.close()
 
 def create_job_offer_id(job_offer_text):
     """Crée un ID unique basé sur le contenu de l'offre d'emploi"""
@@ -74,34 +330,49 @@ def create_job_offer_id(job_offer_text):
 def save_job_offer(title, content):
     """Sauvegarde une offre d'emploi et retourne son ID"""
     job_id = create_job_offer_id(content)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+    get_db().write(_insert_job_offer_row, job_id, title, content)
+    return job_id
+
+def _insert_job_offer_row(c, job_id, title, content):
     # Vérifier si l'offre existe déjà
     c.execute('SELECT id FROM job_offers WHERE id = ?', (job_id,))
     if not c.fetchone():
         c.execute('''
             INSERT INTO job_offers (id, title, content, created_date)
             VALUES (?, ?, ?, ?)
-        ''', (job_id, title, content, datetime.now().strftime('%d/%m/%Y %H:%M:%S')))
-        conn.commit()
-    
-    conn.close()
-    return job_id
+        ''', (job_id, title, content, datetime.now().strftime(DATE_FORMAT)))
 
-def insert_analysis(filename, analysis, job_offer_id):
-    """Insère une analyse de CV liée à une offre d'emploi"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    nom_prenom = analysis.get("nom_prenom", "")
-    c.execute('''
-        INSERT INTO analyses (
-            job_offer_id, nom_prenom, filename, score_global, score_technique, 
-            score_experience, score_formation, score_soft_skills, commentaire, date
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+# Colonnes renseignées à l'insertion d'une analyse (voir _analysis_params)
+ANALYSIS_COLUMNS = (
+    "job_offer_id", "nom_prenom", "filename", "score_global", "score_technique",
+    "score_experience", "score_formation", "score_soft_skills", "commentaire", "date",
+    "methode_analyse", "experience_pertinente", *(name for name, _ in USAGE_COLUMNS)
+)
+_INSERT_ANALYSIS = f'''
+    INSERT INTO analyses ({", ".join(ANALYSIS_COLUMNS)})
+    VALUES ({", ".join("?" * len(ANALYSIS_COLUMNS))})
+'''
+# Import : une analyse déjà présente pour la même offre (même fichier, candidat, score
+# et commentaire) n'est pas insérée une seconde fois
+_IMPORT_ANALYSIS = f'''
+    INSERT INTO analyses ({", ".join(ANALYSIS_COLUMNS)})
+    SELECT {", ".join("?" * len(ANALYSIS_COLUMNS))}
+    WHERE NOT EXISTS (
+        SELECT 1 FROM analyses
+        WHERE job_offer_id = ? AND filename IS ? AND nom_prenom IS ? AND score_global IS ? AND commentaire IS ?
+    )
+'''
+
+# Nombre de lignes et délai maximal entre deux écritures d'un BufferedWriter
+FLUSH_ROWS = 50
+FLUSH_SECONDS = 2.0
+
+def _analysis_params(filename, analysis, job_offer_id, usage=None, date=None):
+    """Valeurs de ANALYSIS_COLUMNS pour une analyse (date : maintenant par défaut)"""
+    usage = usage or {}
+    return (
         job_offer_id,
-        nom_prenom,
+        analysis.get("nom_prenom", ""),
         filename,
         analysis.get("score_global", 0),
         analysis.get("score_technique", 0),
@@ -109,23 +380,110 @@ def insert_analysis(filename, analysis, job_offer_id):
         analysis.get("score_formation", 0),
         analysis.get("score_soft_skills", 0),
         analysis.get("commentaires", ""),
-        datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    ))
-    conn.commit()
-    conn.close()
+        date or datetime.now().strftime(DATE_FORMAT),
+        analysis.get("methode_analyse"),
+        analysis.get("experience_pertinente", ""),
+        *(usage.get(name) for name, _ in USAGE_COLUMNS)
+    )
+
+def _insert_analysis_row(c, filename, analysis, job_offer_id, usage=None):
+    c.execute(_INSERT_ANALYSIS, _analysis_params(filename, analysis, job_offer_id, usage))
+    analysis_id = c.lastrowid
+    insert_analysis_lists(c, [(analysis_id, analysis)])
+    return analysis_id
+
+def _insert_analysis_rows(c, rows):
+    """
+    Insère des analyses (filename, analysis, job_offer_id, usage) en une seule requête
+    préparée et retourne leurs IDs, dans l'ordre. Les IDs sont consécutifs : l'écrivain
+    est seul dans sa transaction et la table est en AUTOINCREMENT.
+    """
+    if not rows:
+        return []
+    c.executemany(_INSERT_ANALYSIS, [_analysis_params(*row) for row in rows])
+    # last_insert_rowid() ignore les insertions faites par les triggers
+    c.execute('SELECT last_insert_rowid()')
+    last_id = c.fetchone()[0]
+    analysis_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+    insert_analysis_lists(c, [(analysis_id, row[1]) for analysis_id, row in zip(analysis_ids, rows)])
+    return analysis_ids
+
+def insert_analysis(filename, analysis, job_offer_id, usage=None):
+    """
+    Insère une analyse de CV liée à une offre d'emploi, avec sa consommation
+    (analysis.usage_record) si elle est connue
+    """
+    get_db().write(_insert_analysis_row, filename, analysis, job_offer_id, usage)
+
+def insert_analyses(rows):
+    """
+    Insère un lot d'analyses (filename, analysis, job_offer_id, usage) dans une seule
+    transaction et retourne leurs IDs
+    """
+    return get_db().write(_insert_analysis_rows, list(rows))
+
+def import_analyses(rows):
+    """
+    Importe un lot d'analyses exportées dans une seule transaction, offres comprises.
+    `rows` : (job_offer_id, titre, texte de l'offre, filename, analysis, usage, date).
+    Les offres existantes sont conservées et les analyses déjà présentes ignorées.
+    Retourne le nombre d'analyses insérées.
+    """
+    def import_rows(c, rows):
+        offers = {job_offer_id: (title, content) for job_offer_id, title, content, *_ in rows}
+        for job_offer_id, (title, content) in offers.items():
+            _insert_job_offer_row(c, job_offer_id, title, content)
+        # Une requête par analyse : l'ID des lignes insérées sert aux compétences
+        inserted = []
+        for job_offer_id, _, _, filename, analysis, usage, date in rows:
+            c.execute(_IMPORT_ANALYSIS, (
+                *_analysis_params(filename, analysis, job_offer_id, usage, date),
+                job_offer_id, filename, analysis.get("nom_prenom", ""), analysis.get("score_global", 0),
+                analysis.get("commentaires", "")
+            ))
+            if c.rowcount:
+                inserted.append((c.lastrowid, analysis))
+        insert_analysis_lists(c, inserted)
+        return len(inserted)
+    return get_db().write(import_rows, list(rows))
+
+class BufferedWriter:
+    """
+    Regroupe des écritures pour les valider par lots : `flush_fn(items)` est appelée
+    dès que `max_rows` éléments sont en attente ou que `max_seconds` se sont écoulées
+    depuis la dernière écriture, puis à la sortie du bloc `with` (y compris sur
+    interruption). Un arrêt brutal perd au plus `max_rows` éléments.
+    """
 
+    def __init__(self, flush_fn, max_rows=FLUSH_ROWS, max_seconds=FLUSH_SECONDS):
+        self.flush_fn = flush_fn
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def add(self, item):
+        self.pending.append(item)
+        if len(self.pending) >= self.max_rows or time.monotonic() - self.last_flush >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        items, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        if items:
+            self.flush_fn(items)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+@cached_read
 def get_all_analyses():
     """Récupère toutes les analyses avec les informations de l'offre d'emploi"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     try:
-        # Vérifier la structure de la table
-        c.execute("PRAGMA table_info(analyses)")
-        columns = [column[1] for column in c.fetchall()]
-        
-        if 'job_offer_id' in columns:
-            # Nouvelle structure avec job_offer_id
+        with get_db().read() as c:
             c.execute('''
                 SELECT a.nom_prenom, a.score_global, a.score_technique, a.score_experience, 
                        a.score_formation, a.score_soft_skills, a.commentaire, a.date,
@@ -134,81 +492,861 @@ def get_all_analyses():
                 LEFT JOIN job_offers j ON a.job_offer_id = j.id
                 ORDER BY a.id DESC
             ''')
-        else:
-            # Ancienne structure sans job_offer_id
-            c.execute('''
-                SELECT nom_prenom, score_global, score_technique, score_experience, 
-                       score_formation, score_soft_skills, commentaire, date,
-                       'Non spécifiée' as job_title, NULL as job_offer_id
-                FROM analyses 
-                ORDER BY id DESC
-            ''')
-        
-        rows = c.fetchall()
-        conn.close()
-        return rows
+            return c.fetchall()
         
     except Exception as e:
         print(f"Erreur dans get_all_analyses: {e}")
-        conn.close()
         return []
 
-def get_analyses_by_job_offer(job_offer_id):
-    """Récupère toutes les analyses pour une offre d'emploi spécifique"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        SELECT a.nom_prenom, a.score_global, a.score_technique, a.score_experience, 
-               a.score_formation, a.score_soft_skills, a.commentaire, a.date, a.filename
-        FROM analyses a
-        WHERE a.job_offer_id = ?
-        ORDER BY a.score_global DESC
-    ''', (job_offer_id,))
-    rows = c.fetchall()
-    conn.close()
-    return rows
+@cached_read
+def get_analyses_by_job_offer(job_offer_id, limit=None):
+    """Récupère les analyses d'une offre d'emploi, par score décroissant (les `limit` meilleures)"""
+    with get_db().read() as c:
+        c.execute('''
+            SELECT a.nom_prenom, a.score_global, a.score_technique, a.score_experience, 
+                   a.score_formation, a.score_soft_skills, a.commentaire, a.date, a.filename
+            FROM analyses a
+            WHERE a.job_offer_id = ?
+            ORDER BY a.score_global DESC
+            LIMIT ?
+        ''', (job_offer_id, -1 if limit is None else limit))
+        return c.fetchall()
 
+@cached_read
 def get_all_job_offers():
     """Récupère toutes les offres d'emploi avec le nombre d'analyses"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     try:
-        # Vérifier si la table job_offers existe
-        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='job_offers'")
-        if not c.fetchone():
-            conn.close()
-            return []
-        
-        c.execute('''
-            SELECT j.id, j.title, j.created_date, COUNT(a.id) as nb_analyses
-            FROM job_offers j
-            LEFT JOIN analyses a ON j.id = a.job_offer_id
-            GROUP BY j.id, j.title, j.created_date
-            ORDER BY j.created_date DESC
-        ''')
-        rows = c.fetchall()
-        conn.close()
-        return rows
+        with get_db().read() as c:
+            # Vérifier si la table job_offers existe
+            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='job_offers'")
+            if not c.fetchone():
+                return []
+            
+            # Compteurs lus dans job_offer_stats (tenue à jour par triggers)
+            c.execute('''
+                SELECT j.id, j.title, j.created_date, COALESCE(s.nb_analyses, 0) as nb_analyses
+                FROM job_offers j
+                LEFT JOIN job_offer_stats s ON s.job_offer_id = j.id
+                ORDER BY j.created_date DESC
+            ''')
+            return c.fetchall()
         
     except Exception as e:
         print(f"Erreur dans get_all_job_offers: {e}")
-        conn.close()
         return []
 
+@cached_read
+def get_job_offer(job_offer_id):
+    """Offre d'emploi (id, title, content, created_date) ou None"""
+    with get_db().read() as c:
+        c.execute('SELECT id, title, content, created_date FROM job_offers WHERE id = ?', (job_offer_id,))
+        return c.fetchone()
+
+@cached_read
 def get_job_offer_stats(job_offer_id):
-    """Récupère les statistiques d'une offre d'emploi"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """Récupère les statistiques d'une offre d'emploi (total_cv, score_moyen, meilleur_score, score_min)"""
+    with get_db().read() as c:
+        c.execute('''
+            SELECT 
+                nb_analyses as total_cv,
+                CAST(score_sum AS REAL) / NULLIF(nb_scored, 0) as score_moyen,
+                score_max as meilleur_score,
+                score_min as score_min
+            FROM job_offer_stats
+            WHERE job_offer_id = ?
+        ''', (job_offer_id,))
+        return c.fetchone() or (0, None, None, None)
+
+@cached_read
+def get_score_distribution(job_offer_id, bucket_size=10):
+    """Répartition des scores d'une offre : liste de (début de tranche, nombre de CV) ; 100 compte dans la dernière tranche"""
+    with get_db().read() as c:
+        c.execute('''
+            SELECT MIN(score, 99) / ? * ?, SUM(nb)
+            FROM job_offer_score_counts
+            WHERE job_offer_id = ?
+            GROUP BY 1
+        ''', (bucket_size, bucket_size, job_offer_id))
+        counts = dict(c.fetchall())
+    return [(start, counts.get(start, 0)) for start in range(0, 100, bucket_size)]
+
+# Types de compétences enregistrés dans analysis_skills -> compteur de la table skills
+SKILL_KINDS = {
+    "matched": "nb_matched",
+    "missing": "nb_missing",
+}
+
+@cached_read
+def get_skill_counts(kind="missing", job_offer_id=None, limit=10):
+    """
+    Compétences les plus fréquentes d'un type (SKILL_KINDS : maîtrisées ou manquantes),
+    pour une offre ou pour toutes : liste de (nom, libellé, nombre d'analyses), par
+    nombre décroissant. Sans offre, les compteurs de `skills` sont lus directement.
+    """
+    counter = SKILL_KINDS[kind]
+    with get_db().read() as c:
+        if job_offer_id is None:
+            c.execute(f'''
+                SELECT name, label, {counter} FROM skills
+                WHERE {counter} > 0
+                ORDER BY {counter} DESC, label
+                LIMIT ?
+            ''', (limit,))
+        else:
+            c.execute('''
+                SELECT k.name, k.label, COUNT(*) AS nb
+                FROM analyses a
+                JOIN analysis_skills s ON s.analysis_id = a.id AND s.kind = ?
+                JOIN skills k ON k.id = s.skill_id
+                WHERE a.job_offer_id = ?
+                GROUP BY s.skill_id
+                ORDER BY nb DESC, k.label
+                LIMIT ?
+            ''', (kind, job_offer_id, limit))
+        return c.fetchall()
+
+@cached_read
+def get_skills(kind="matched"):
+    """Compétences (nom, libellé) rencontrées au moins une fois pour ce type, les plus fréquentes d'abord"""
+    counter = SKILL_KINDS[kind]
+    with get_db().read() as c:
+        c.execute(f'SELECT name, label FROM skills WHERE {counter} > 0 ORDER BY {counter} DESC, label')
+        return c.fetchall()
+
+# Regroupements de la consommation (table usage_daily) -> colonne de regroupement
+USAGE_GROUPS = {
+    "offer": "u.job_offer_id",
+    "day": "u.day",
+    "model": "u.model",
+}
+
+@cached_read
+def get_usage_rollup(group_by, job_offer_id=None):
+    """
+    Consommation agrégée par offre, jour ou modèle (voir USAGE_GROUPS), lue dans usage_daily :
+    (clé, titre de l'offre ou None, nb d'analyses, tokens prompt, tokens completion, tokens
+    en cache, coût USD, latence moyenne en ms, pages moyennes). Par coût décroissant, sauf
+    par jour (chronologique).
+    """
+    column = USAGE_GROUPS[group_by]
+    order = "1" if group_by == "day" else "7 DESC"
+    where, params = ("WHERE u.job_offer_id = ?", [job_offer_id]) if job_offer_id is not None else ("", [])
+    with get_db().read() as c:
+        c.execute(f'''
+            SELECT {column}, {"MAX(j.title)" if group_by == "offer" else "NULL"}, SUM(u.nb_analyses),
+                   SUM(u.prompt_tokens), SUM(u.completion_tokens), SUM(u.cached_tokens), SUM(u.cost_usd),
+                   SUM(u.latency_ms_sum) / NULLIF(SUM(u.nb_timed), 0),
+                   CAST(SUM(u.nb_pages) AS REAL) / NULLIF(SUM(u.nb_paged), 0)
+            FROM usage_daily u
+            LEFT JOIN job_offers j ON j.id = u.job_offer_id
+            {where}
+            GROUP BY 1
+            ORDER BY {order}
+        ''', params)
+        return c.fetchall()
+
+def _analyses_filters(job_offer_id=None, min_score=None, max_score=None,
+                      date_from=None, date_to=None, name_prefix=None, skills=None):
+    """
+    Clause WHERE et paramètres des filtres de l'historique (dates : datetime.date, bornes
+    incluses ; skills : compétences que le candidat doit toutes maîtriser)
+    """
+    clauses, params = [], []
+    if job_offer_id is not None:
+        clauses.append('a.job_offer_id = ?')
+        params.append(job_offer_id)
+    if min_score is not None:
+        clauses.append('a.score_global >= ?')
+        params.append(min_score)
+    if max_score is not None:
+        clauses.append('a.score_global <= ?')
+        params.append(max_score)
+    if date_from is not None:
+        clauses.append('a.date >= ?')
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        clauses.append('a.date < ?')
+        params.append((date_to + timedelta(days=1)).isoformat())
+    if name_prefix:
+        escaped = name_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("a.nom_prenom LIKE ? ESCAPE '\\'")
+        params.append(escaped + '%')
+    # Intersection des analyses de chaque compétence, lues dans l'index de analysis_skills
+    names = list(dict.fromkeys(skill[0] for skill in map(canonical_skill, skills or ()) if skill))
+    if names:
+        clauses.append('a.id IN (' + ' INTERSECT '.join(
+            "SELECT analysis_id FROM analysis_skills"
+            " WHERE skill_id = (SELECT id FROM skills WHERE name = ?) AND kind = 'matched'"
+            for _ in names
+        ) + ')')
+        params.extend(names)
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    return where, params
+
+@cached_read
+def query_analyses(sort="date", after=None, limit=HISTORY_PAGE_SIZE, **filters):
+    """
+    Page de l'historique filtrée et triée en SQL, par ordre décroissant de `sort`
+    ("date" ou "score"). `after` est le curseur renvoyé pour la page précédente.
+    Retourne (lignes, curseur suivant ou None) ; chaque ligne contient
+    (id, nom_prenom, score_global, score_technique, score_experience, score_formation,
+    score_soft_skills, aperçu du commentaire, date, job_title, job_offer_id).
+    """
+    keys = HISTORY_SORTS[sort]
+    where, params = _analyses_filters(**filters)
+    if after is not None:
+        # Pagination par clé : reprise après la dernière ligne, sans OFFSET
+        where += (' AND ' if where else ' WHERE ') + f"({', '.join(keys)}) < ({', '.join('?' * len(keys))})"
+        params.extend(after)
+    order = ', '.join(f'{key} DESC' for key in keys)
+    with get_db().read() as c:
+        c.execute(f'''
+            SELECT a.id, a.nom_prenom, a.score_global, a.score_technique, a.score_experience,
+                   a.score_formation, a.score_soft_skills,
+                   CASE WHEN length(a.commentaire) > ? THEN substr(a.commentaire, 1, ?) || '...'
+                        ELSE a.commentaire END,
+                   a.date, j.title, a.job_offer_id
+            FROM analyses a
+            LEFT JOIN job_offers j ON a.job_offer_id = j.id
+            {where}
+            ORDER BY {order}
+            LIMIT ?
+        ''', [COMMENT_PREVIEW_CHARS, COMMENT_PREVIEW_CHARS] + params + [limit + 1])
+        rows = c.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    cursor = (last[0],) if sort == "date" else (last[2], last[0])
+    return rows, cursor
+
+# Mots d'une recherche plein texte, découpés comme par le tokenizer unicode61 de l'index
+_SEARCH_TERM = re.compile(r"\w+")
+
+def search_query(text, job_offer_id=None):
+    """
+    Requête FTS5 pour une saisie libre : chaque mot doit figurer dans l'analyse, le
+    dernier pouvant être un début de mot (« kube » trouve « Kubernetes »), et l'offre
+    est imposée par l'index si elle est donnée. None si la saisie ne contient aucun mot.
+    """
+    terms = _SEARCH_TERM.findall(text)
+    if not terms:
+        return None
+    query = " ".join(f'"{term}"' for term in terms) + "*"
+    if job_offer_id is not None:
+        escaped = job_offer_id.replace('"', '""')
+        query += f' job_offer_id : "{escaped}"'
+    return query
+
+@cached_read
+def search_analyses(text, limit=HISTORY_PAGE_SIZE, **filters):
+    """
+    Recherche plein texte (nom, commentaire, fichier, expérience) classée par pertinence
+    (bm25), avec les filtres de l'historique. Retourne des lignes
+    (id, nom_prenom, score_global, filename, date, job_title, job_offer_id, extrait) ;
+    l'extrait met les mots trouvés en **gras**.
+    """
+    query = search_query(text, filters.get("job_offer_id"))
+    if query is None:
+        return []
+    where, params = _analyses_filters(**filters)
+    where = (where + ' AND ' if where else ' WHERE ') + 'analyses_fts MATCH ?'
+    with get_db().read() as c:
+        c.execute(f'''
+            SELECT a.id, a.nom_prenom, a.score_global, a.filename, a.date, j.title, a.job_offer_id,
+                   snippet(analyses_fts, -1, '**', '**', ' … ', ?)
+            FROM analyses_fts
+            JOIN analyses a ON a.id = analyses_fts.rowid
+            LEFT JOIN job_offers j ON a.job_offer_id = j.id
+            {where}
+            ORDER BY analyses_fts.rank
+            LIMIT ?
+        ''', [SNIPPET_TOKENS] + params + [query, limit])
+        return c.fetchall()
+
+@cached_read
+def get_analyses_summary(**filters):
+    """Nombre d'analyses, score moyen et meilleur score pour les filtres de l'historique"""
+    where, params = _analyses_filters(**filters)
+    with get_db().read() as c:
+        c.execute(f'''
+            SELECT COUNT(*), AVG(a.score_global), MAX(a.score_global)
+            FROM analyses a
+            {where}
+        ''', params)
+        return c.fetchone()
+
+def make_cache_key(pdf_bytes, job_offer_id, model, prompt_hash):
+    """Construit la clé de cache d'une analyse à partir du contenu du PDF et du contexte"""
+    pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    return hashlib.sha256(f"{pdf_hash}|{job_offer_id}|{model}|{prompt_hash}".encode()).hexdigest()
+
+def get_cached_analysis(cache_key, ttl_seconds=CACHE_TTL_SECONDS):
+    """Retourne le résultat mis en cache (contenu + tokens) ou None si absent ou expiré"""
+    now = time.time()
+    with get_db().read() as c:
+        c.execute('''
+            SELECT content, prompt_tokens, completion_tokens, total_tokens, created_at, method, nb_pages
+            FROM analysis_cache
+            WHERE cache_key = ?
+        ''', (cache_key,))
+        row = c.fetchone()
+    if row is None:
+        return None
+    
+    if ttl_seconds is not None and now - row[4] > ttl_seconds:
+        get_db().write(_delete_cache_entry, cache_key)
+        return None
+    
+    get_db().write(_touch_cache_entry, cache_key, now)
+    return {
+        "content": row[0],
+        "tokens": {
+            "prompt": row[1],
+            "completion": row[2],
+            "total": row[3]
+        },
+        "method": row[5],
+        "pages": row[6]
+    }
+
+def _delete_cache_entry(c, cache_key):
+    c.execute('DELETE FROM analysis_cache WHERE cache_key = ?', (cache_key,))
+
+def _touch_cache_entry(c, cache_key, now):
+    c.execute('UPDATE analysis_cache SET last_used_at = ? WHERE cache_key = ?', (now, cache_key))
+
+def store_cached_analysis(cache_key, result, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+    """Enregistre un résultat dans le cache puis applique l'expiration et la limite de taille"""
+    get_db().write(_store_cache_entry, cache_key, result, ttl_seconds, max_entries)
+
+def _store_cache_entry(c, cache_key, result, ttl_seconds, max_entries):
+    now = time.time()
+    tokens = result["tokens"]
     c.execute('''
-        SELECT 
-            COUNT(*) as total_cv,
-            AVG(score_global) as score_moyen,
-            MAX(score_global) as meilleur_score,
-            MIN(score_global) as score_min
-        FROM analyses
-        WHERE job_offer_id = ?
-    ''', (job_offer_id,))
+        INSERT OR REPLACE INTO analysis_cache (
+            cache_key, content, prompt_tokens, completion_tokens, total_tokens, method,
+            nb_pages, created_at, last_used_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        cache_key,
+        result["content"],
+        tokens["prompt"],
+        tokens["completion"],
+        tokens["total"],
+        result.get("method"),
+        result.get("pages"),
+        now,
+        now
+    ))
+    
+    if ttl_seconds is not None:
+        c.execute('DELETE FROM analysis_cache WHERE created_at < ?', (now - ttl_seconds,))
+    
+    # Éviction LRU au-delà du nombre maximal d'entrées
+    if max_entries is not None:
+        c.execute('''
+            DELETE FROM analysis_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM analysis_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (max_entries,))
+
+def create_batch_job(batch_id, job_offer_id, input_file_id, status, items):
+    """
+    Enregistre un lot soumis à l'API Batch et ses éléments.
+    `items` est une liste de dicts (custom_id, filename, method, cache_key).
+    """
+    now = time.time()
+    with get_db().transaction() as c:
+        c.execute('''
+            INSERT INTO batch_jobs (id, job_offer_id, input_file_id, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (batch_id, job_offer_id, input_file_id, status, now, now))
+        c.executemany('''
+            INSERT INTO batch_items (batch_id, custom_id, filename, method, cache_key, status)
+            VALUES (?, ?, ?, ?, ?, 'pending')
+        ''', [(batch_id, item["custom_id"], item["filename"], item["method"], item["cache_key"]) for item in items])
+
+def update_batch_job(batch_id, status, output_file_id=None, error_file_id=None):
+    """Met à jour l'état d'un lot après interrogation de l'API"""
+    with get_db().transaction() as c:
+        c.execute('''
+            UPDATE batch_jobs
+            SET status = ?,
+                output_file_id = COALESCE(?, output_file_id),
+                error_file_id = COALESCE(?, error_file_id),
+                updated_at = ?
+            WHERE id = ?
+        ''', (status, output_file_id, error_file_id, time.time(), batch_id))
+
+def mark_batch_ingested(batch_id):
+    """Marque un lot comme entièrement intégré dans la table analyses"""
+    with get_db().transaction() as c:
+        c.execute('UPDATE batch_jobs SET ingested_at = ? WHERE id = ?', (time.time(), batch_id))
+
+def get_batch_jobs(only_pending=False):
+    """
+    Récupère les lots (id, job_offer_id, status, output_file_id, error_file_id, created_at, ingested_at).
+    `only_pending` limite aux lots non encore intégrés.
+    """
+    query = '''
+        SELECT id, job_offer_id, status, output_file_id, error_file_id, created_at, ingested_at
+        FROM batch_jobs
+    '''
+    if only_pending:
+        query += ' WHERE ingested_at IS NULL'
+    with get_db().read() as c:
+        c.execute(query + ' ORDER BY created_at')
+        return c.fetchall()
+
+def get_batch_items(batch_id, status=None):
+    """Récupère les éléments d'un lot (custom_id, filename, method, cache_key, status)"""
+    query = '''
+        SELECT custom_id, filename, method, cache_key, status
+        FROM batch_items
+        WHERE batch_id = ?
+    '''
+    params = [batch_id]
+    if status is not None:
+        query += ' AND status = ?'
+        params.append(status)
+    with get_db().read() as c:
+        c.execute(query + ' ORDER BY custom_id', params)
+        return c.fetchall()
+
+def insert_batch_analysis(batch_id, custom_id, filename, analysis, job_offer_id, usage=None):
+    """
+    Insère l'analyse d'un élément de lot et le marque comme intégré dans la même
+    transaction, pour qu'une reprise après interruption ne crée pas de doublon.
+    """
+    with get_db().transaction() as c:
+        c.execute('''
+            SELECT status FROM batch_items WHERE batch_id = ? AND custom_id = ?
+        ''', (batch_id, custom_id))
+        row = c.fetchone()
+        if row and row[0] != 'ingested':
+            _insert_analysis_row(c, filename, analysis, job_offer_id, usage)
+            c.execute('''
+                UPDATE batch_items SET status = 'ingested' WHERE batch_id = ? AND custom_id = ?
+            ''', (batch_id, custom_id))
+
+def mark_batch_item(batch_id, custom_id, status):
+    """Met à jour l'état d'un élément de lot (ingested, failed...)"""
+    with get_db().transaction() as c:
+        c.execute('''
+            UPDATE batch_items SET status = ? WHERE batch_id = ? AND custom_id = ?
+        ''', (status, batch_id, custom_id))
+
+def get_open_run(job_offer_id):
+    """ID de la dernière exécution non terminée d'analyze.py pour cette offre, ou None"""
+    with get_db().read() as c:
+        c.execute('''
+            SELECT id FROM analysis_runs
+            WHERE job_offer_id = ? AND finished_at IS NULL
+            ORDER BY id DESC LIMIT 1
+        ''', (job_offer_id,))
+        row = c.fetchone()
+    return row[0] if row else None
+
+def create_run(job_offer_id):
+    """Crée une exécution d'analyze.py et retourne son ID"""
+    with get_db().transaction() as c:
+        c.execute('''
+            INSERT INTO analysis_runs (job_offer_id, created_at) VALUES (?, ?)
+        ''', (job_offer_id, time.time()))
+        return c.lastrowid
+
+def add_run_items(run_id, paths):
+    """Ajoute les fichiers à traiter ; ceux déjà enregistrés pour l'exécution sont ignorés"""
+    now = time.time()
+    with get_db().transaction() as c:
+        c.executemany('''
+            INSERT OR IGNORE INTO analysis_run_items (run_id, path, status, updated_at)
+            VALUES (?, ?, 'pending', ?)
+        ''', [(run_id, path, now) for path in paths])
+
+def get_run_items(run_id, statuses=None):
+    """Éléments d'une exécution (path, status, tokens, error), éventuellement filtrés par statut"""
+    query = 'SELECT path, status, tokens, error FROM analysis_run_items WHERE run_id = ?'
+    params = [run_id]
+    if statuses:
+        query += f" AND status IN ({', '.join('?' * len(statuses))})"
+        params.extend(statuses)
+    with get_db().read() as c:
+        c.execute(query + ' ORDER BY path', params)
+        return c.fetchall()
+
+def insert_run_analyses(run_id, items):
+    """
+    Insère les analyses de plusieurs fichiers d'une exécution et les marque comme traités
+    dans une seule transaction : une exécution interrompue puis reprise ne crée pas de
+    doublon. `items` : (path, filename, analysis, job_offer_id, tokens, usage).
+    Retourne les IDs des analyses, dans l'ordre de `items` (None pour un fichier déjà traité).
+    """
+    with get_db().transaction() as c:
+        c.execute(f'''
+            SELECT path FROM analysis_run_items
+            WHERE run_id = ? AND status != 'done' AND path IN ({", ".join("?" * len(items))})
+        ''', (run_id, *(item[0] for item in items)))
+        todo = {row[0] for row in c.fetchall()}
+        todo_items = [item for item in items if item[0] in todo]
+        analysis_ids = _insert_analysis_rows(c, [
+            (filename, analysis, job_offer_id, usage)
+            for _, filename, analysis, job_offer_id, _, usage in todo_items
+        ])
+        now = time.time()
+        c.executemany('''
+            UPDATE analysis_run_items SET status = 'done', tokens = ?, error = NULL, updated_at = ?
+            WHERE run_id = ? AND path = ?
+        ''', [(tokens, now, run_id, path) for path, _, _, _, tokens, _ in todo_items])
+    ids_by_path = {item[0]: analysis_id for item, analysis_id in zip(todo_items, analysis_ids)}
+    return [ids_by_path.get(item[0]) for item in items]
+
+def mark_run_item_failed(run_id, path, error):
+    """Marque un fichier en échec (il sera retenté à la reprise)"""
+    with get_db().transaction() as c:
+        c.execute('''
+            UPDATE analysis_run_items SET status = 'failed', error = ?, updated_at = ?
+            WHERE run_id = ? AND path = ?
+        ''', (error, time.time(), run_id, path))
+
+def finish_run(run_id):
+    """Clôt une exécution dont tous les fichiers ont été analysés"""
+    with get_db().transaction() as c:
+        c.execute('UPDATE analysis_runs SET finished_at = ? WHERE id = ?', (time.time(), run_id))
+
+# --- File de travaux (worker.py) ---
+
+def enqueue_job(job_offer_id, pdf_files, force=False):
+    """
+    Crée un lot d'analyses pour l'offre, avec une tâche par fichier (filename, pdf_bytes),
+    et retourne son ID. Les fichiers sont conservés en base jusqu'à leur analyse.
+    """
+    now = time.time()
+    with get_db().transaction() as c:
+        c.execute('''
+            INSERT INTO jobs (job_offer_id, force, created_at) VALUES (?, ?, ?)
+        ''', (job_offer_id, int(force), now))
+        job_id = c.lastrowid
+        c.executemany('''
+            INSERT INTO job_tasks (job_id, position, filename, pdf, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(job_id, position, filename, pdf_bytes, now)
+              for position, (filename, pdf_bytes) in enumerate(pdf_files)])
+    return job_id
+
+def claim_task(worker_id, lease_seconds, max_attempts):
+    """
+    Attribue au worker la prochaine tâche disponible, avec un bail de `lease_seconds`,
+    ou retourne None. Les tâches dont le bail a expiré (worker arrêté) sont d'abord
+    remises en file, ou passées en échec après `max_attempts` tentatives.
+
+    Équité entre offres : la tâche vient de l'offre qui a le moins de tâches en cours,
+    puis du lot servi le moins récemment, dans l'ordre des fichiers du lot.
+    """
+    now = time.time()
+    with get_db().transaction() as c:
+        c.execute('''
+            UPDATE job_tasks SET
+                status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                error = CASE WHEN attempts >= ? THEN 'Bail expiré : worker arrêté pendant l''analyse' ELSE error END,
+                lease_owner = NULL, lease_expires = NULL, partial = NULL, updated_at = ?
+            WHERE status = 'running' AND lease_expires < ?
+        ''', (max_attempts, max_attempts, now, now))
+        if c.rowcount:
+            _finish_jobs(c, now)
+
+        c.execute('''
+            WITH running AS (
+                SELECT j.job_offer_id, COUNT(*) AS n
+                FROM job_tasks t JOIN jobs j ON j.id = t.job_id
+                WHERE t.status = 'running'
+                GROUP BY j.job_offer_id
+            ),
+            candidates AS (
+                SELECT DISTINCT job_id FROM job_tasks
+                WHERE status = 'pending' AND available_at <= ?
+            )
+            SELECT j.id FROM candidates
+            JOIN jobs j ON j.id = candidates.job_id
+            LEFT JOIN running r ON r.job_offer_id IS j.job_offer_id
+            ORDER BY COALESCE(r.n, 0), j.last_claimed_at, j.id
+            LIMIT 1
+        ''', (now,))
+        row = c.fetchone()
+        if row is None:
+            return None
+        job_id = row[0]
+
+        c.execute('''
+            SELECT t.id, t.filename, t.pdf, t.attempts, j.job_offer_id, j.force, o.content
+            FROM job_tasks t
+            JOIN jobs j ON j.id = t.job_id
+            LEFT JOIN job_offers o ON o.id = j.job_offer_id
+            WHERE t.job_id = ? AND t.status = 'pending' AND t.available_at <= ?
+            ORDER BY t.position LIMIT 1
+        ''', (job_id, now))
+        task_id, filename, pdf_bytes, attempts, job_offer_id, force, job_offer = c.fetchone()
+        c.execute('''
+            UPDATE job_tasks SET status = 'running', attempts = attempts + 1,
+                lease_owner = ?, lease_expires = ?, updated_at = ?
+            WHERE id = ?
+        ''', (worker_id, now + lease_seconds, now, task_id))
+        c.execute('UPDATE jobs SET last_claimed_at = ? WHERE id = ?', (now, job_id))
+    return {
+        "id": task_id,
+        "job_id": job_id,
+        "filename": filename,
+        "pdf_bytes": pdf_bytes,
+        "attempt": attempts + 1,
+        "job_offer_id": job_offer_id,
+        "job_offer": job_offer,
+        "force": bool(force),
+    }
+
+def _finish_jobs(c, now, job_id=None):
+    """Marque comme terminés les lots sans tâche en attente ni en cours"""
+    query = '''
+        UPDATE jobs SET finished_at = ?
+        WHERE finished_at IS NULL AND NOT EXISTS (
+            SELECT 1 FROM job_tasks t
+            WHERE t.job_id = jobs.id AND t.status IN ('pending', 'running')
+        )
+    '''
+    params = [now]
+    if job_id is not None:
+        query += ' AND id = ?'
+        params.append(job_id)
+    c.execute(query, params)
+
+def _release_task(c, task_id, worker_id, status, now, **fields):
+    """
+    Clôt le bail d'une tâche encore détenue par le worker et passe la tâche à `status`.
+    Retourne False si le bail a été perdu (expiré et repris par un autre worker).
+    """
+    c.execute('SELECT job_id FROM job_tasks WHERE id = ? AND status = ? AND lease_owner = ?',
+              (task_id, 'running', worker_id))
     row = c.fetchone()
-    conn.close()
-    return row
+    if row is None:
+        return False
+    assignments = ''.join(f', {column} = ?' for column in fields)
+    c.execute(f'''
+        UPDATE job_tasks SET status = ?, lease_owner = NULL, lease_expires = NULL,
+            partial = NULL, updated_at = ?{assignments}
+        WHERE id = ?
+    ''', (status, now, *fields.values(), task_id))
+    if status in ('done', 'failed'):
+        _finish_jobs(c, now, row[0])
+    return True
+
+def complete_task(task_id, worker_id, filename, analysis, job_offer_id, result, usage=None):
+    """
+    Enregistre l'analyse d'une tâche et la marque terminée dans la même transaction
+    (regroupée avec les autres écritures en attente, par exemple celles des autres threads
+    du worker). Le PDF n'est plus conservé. Retourne l'ID de l'analyse, ou None si le bail
+    avait été perdu.
+    """
+    now = time.time()
+    def complete(c):
+        c.execute('SELECT 1 FROM job_tasks WHERE id = ? AND status = ? AND lease_owner = ?',
+                  (task_id, 'running', worker_id))
+        if c.fetchone() is None:
+            return None
+        analysis_id = _insert_analysis_row(c, filename, analysis, job_offer_id, usage)
+        _release_task(c, task_id, worker_id, 'done', now, pdf=None, analysis_id=analysis_id,
+                      error=None, result=json.dumps(result, ensure_ascii=False))
+        return analysis_id
+    return get_db().write(complete)
+
+def fail_task(task_id, worker_id, error, retry_after=None, max_attempts=None):
+    """
+    Enregistre l'échec d'une tâche. Avec `retry_after` (secondes), la tâche est remise
+    en file si elle n'a pas atteint `max_attempts` tentatives ; sinon elle est en échec.
+    """
+    now = time.time()
+    with get_db().transaction() as c:
+        if retry_after is not None:
+            c.execute('SELECT attempts FROM job_tasks WHERE id = ?', (task_id,))
+            row = c.fetchone()
+            if row and row[0] < max_attempts:
+                return _release_task(c, task_id, worker_id, 'pending', now,
+                                     available_at=now + retry_after, error=error)
+        return _release_task(c, task_id, worker_id, 'failed', now, error=error)
+
+def release_worker_tasks(worker_id):
+    """Remet en file les tâches d'un worker qui s'arrête avant de les avoir terminées"""
+    now = time.time()
+    with get_db().transaction() as c:
+        c.execute('''
+            UPDATE job_tasks SET status = 'pending', attempts = MAX(attempts - 1, 0),
+                lease_owner = NULL, lease_expires = NULL, partial = NULL, updated_at = ?
+            WHERE status = 'running' AND lease_owner = ?
+        ''', (now, worker_id))
+
+def renew_leases(worker_id, task_ids, lease_seconds):
+    """Prolonge les baux des tâches en cours et signale que le worker est vivant"""
+    now = time.time()
+    def renew(c):
+        c.executemany('''
+            UPDATE job_tasks SET lease_expires = ?
+            WHERE id = ? AND status = 'running' AND lease_owner = ?
+        ''', [(now + lease_seconds, task_id, worker_id) for task_id in task_ids])
+        c.execute('UPDATE job_workers SET heartbeat_at = ? WHERE id = ?', (now, worker_id))
+    get_db().write(renew)
+
+def save_task_partial(task_id, worker_id, fields):
+    """Enregistre les champs déjà générés d'une tâche en cours (aperçu dans l'interface)"""
+    def save(c):
+        c.execute('''
+            UPDATE job_tasks SET partial = ? WHERE id = ? AND status = 'running' AND lease_owner = ?
+        ''', (json.dumps(fields, ensure_ascii=False), task_id, worker_id))
+    get_db().write(save)
+
+def requeue_failed_tasks(job_id):
+    """Remet en file les tâches en échec d'un lot (nouvelles tentatives) ; retourne leur nombre"""
+    now = time.time()
+    with get_db().transaction() as c:
+        c.execute('''
+            UPDATE job_tasks SET status = 'pending', attempts = 0, available_at = 0,
+                error = NULL, updated_at = ?
+            WHERE job_id = ? AND status = 'failed' AND pdf IS NOT NULL
+        ''', (now, job_id))
+        count = c.rowcount
+        if count:
+            c.execute('UPDATE jobs SET finished_at = NULL WHERE id = ?', (job_id,))
+        return count
+
+def register_worker(worker_id, pid, hostname):
+    """Enregistre un worker ; ceux arrêtés sans se désinscrire depuis plus d'une heure sont oubliés"""
+    now = time.time()
+    with get_db().transaction() as c:
+        c.execute('DELETE FROM job_workers WHERE heartbeat_at < ?', (now - 3600,))
+        c.execute('''
+            INSERT OR REPLACE INTO job_workers (id, pid, hostname, started_at, heartbeat_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (worker_id, pid, hostname, now, now))
+
+def unregister_worker(worker_id):
+    """Désinscrit un worker à son arrêt"""
+    with get_db().transaction() as c:
+        c.execute('DELETE FROM job_workers WHERE id = ?', (worker_id,))
+
+def count_live_workers(max_age_seconds):
+    """Nombre de workers dont le dernier signal de vie date de moins de `max_age_seconds`"""
+    with get_db().read() as c:
+        c.execute('SELECT COUNT(*) FROM job_workers WHERE heartbeat_at >= ?',
+                  (time.time() - max_age_seconds,))
+        return c.fetchone()[0]
+
+def get_job(job_id):
+    """Lot (id, job_offer_id, titre et texte de l'offre, created_at, finished_at) ou None"""
+    with get_db().read() as c:
+        c.execute('''
+            SELECT j.id, j.job_offer_id, o.title, o.content, j.created_at, j.finished_at
+            FROM jobs j LEFT JOIN job_offers o ON o.id = j.job_offer_id
+            WHERE j.id = ?
+        ''', (job_id,))
+        return c.fetchone()
+
+def get_job_tasks(job_id):
+    """
+    Tâches d'un lot dans l'ordre des fichiers :
+    (position, filename, status, attempts, error, partial, result), JSON décodés
+    """
+    with get_db().read() as c:
+        c.execute('''
+            SELECT position, filename, status, attempts, error, partial, result
+            FROM job_tasks WHERE job_id = ? ORDER BY position
+        ''', (job_id,))
+        rows = c.fetchall()
+    return [(position, filename, status, attempts, error,
+             json.loads(partial) if partial else None, json.loads(result) if result else None)
+            for position, filename, status, attempts, error, partial, result in rows]
+
+# --- Durée des étapes des analyses (timings.py) ---
+
+def insert_timings(rows):
+    """Enregistre la durée (ms) des étapes d'analyses : liste de (analysis_id, {étape: durée})"""
+    now = time.time()
+    def insert(c):
+        c.executemany('''
+            INSERT INTO timings (analysis_id, stage, duration_ms, recorded_at) VALUES (?, ?, ?, ?)
+        ''', [(analysis_id, stage, duration_ms, now)
+              for analysis_id, stages in rows for stage, duration_ms in stages.items()])
+    get_db().write(insert)
+
+def get_stage_durations(since=None):
+    """Durées (étape, ms) enregistrées depuis le timestamp `since` (toutes si None)"""
+    with get_db().read() as c:
+        c.execute('SELECT stage, duration_ms FROM timings WHERE recorded_at >= ?', (since or 0,))
+        return c.fetchall()
+
+def get_throughput(since, bucket_seconds):
+    """Nombre d'analyses terminées par intervalle de `bucket_seconds` : (début de l'intervalle, nombre)"""
+    with get_db().read() as c:
+        c.execute('''
+            SELECT CAST(recorded_at / ? AS INTEGER) * ? AS bucket, COUNT(*)
+            FROM timings
+            WHERE recorded_at >= ? AND stage = 'total'
+            GROUP BY bucket ORDER BY bucket
+        ''', (bucket_seconds, bucket_seconds, since or 0))
+        return c.fetchall()
+
+def get_slowest_analyses(since=None, limit=10):
+    """
+    Analyses les plus lentes depuis `since` :
+    (filename, nom_prenom, titre de l'offre, méthode, durée totale en ms, {étape: ms})
+    """
+    with get_db().read() as c:
+        c.execute('''
+            SELECT t.analysis_id, a.filename, a.nom_prenom, j.title, a.methode_analyse, t.duration_ms
+            FROM timings t
+            JOIN analyses a ON a.id = t.analysis_id
+            LEFT JOIN job_offers j ON j.id = a.job_offer_id
+            WHERE t.recorded_at >= ? AND t.stage = 'total'
+            ORDER BY t.duration_ms DESC
+            LIMIT ?
+        ''', (since or 0, limit))
+        rows = c.fetchall()
+        stages = {row[0]: {} for row in rows}
+        if rows:
+            c.execute(f'''
+                SELECT analysis_id, stage, duration_ms FROM timings
+                WHERE analysis_id IN ({', '.join('?' * len(stages))})
+            ''', list(stages))
+            for analysis_id, stage, duration_ms in c.fetchall():
+                stages[analysis_id][stage] = duration_ms
+    return [(*row[1:], stages[row[0]]) for row in rows]
+
+# --- Réponses invalides du modèle (analysis.ensure_valid) ---
+
+def record_parse_failure(method, error, repaired, wasted_tokens, repair_tokens):
+    """
+    Enregistre une réponse invalide : méthode d'analyse, erreur de validation, succès de
+    la réparation, tokens de l'appel initial et de la réparation
+    """
+    now = time.time()
+    def insert(c):
+        c.execute('''
+            INSERT INTO parse_failures (recorded_at, method, error, repaired, wasted_tokens, repair_tokens)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (now, method, error, int(repaired), wasted_tokens or 0, repair_tokens or 0))
+    get_db().write(insert)
+
+def get_parse_failure_stats(since=None):
+    """
+    Réponses invalides depuis `since` : (nombre, réparées, tokens épargnés, tokens de
+    réparation). Les tokens épargnés sont ceux des appels initiaux réparés, qui auraient
+    été perdus sans réparation, moins le coût des réparations.
+    """
+    with get_db().read() as c:
+        c.execute('''
+            SELECT COUNT(*), COALESCE(SUM(repaired), 0),
+                   COALESCE(SUM(CASE WHEN repaired THEN wasted_tokens - repair_tokens ELSE 0 END), 0),
+                   COALESCE(SUM(repair_tokens), 0)
+            FROM parse_failures WHERE recorded_at >= ?
+        ''', (since or 0,))
+        return c.fetchone()
@@ -0,0 +1,234 @@
+"""
+Import dans la base des résultats exportés par l'interface (bouton « Télécharger les
+résultats (JSON) »), ou d'un fichier JSONL avec une analyse exportée par ligne.
+Les fichiers sont lus au fil de l'eau (quelle que soit leur taille) et enregistrés par
+lots ; les offres sont créées si besoin et les analyses déjà présentes sont ignorées :
+relancer un import interrompu ne crée pas de doublon.
+
+Usage :
+    python import_results.py analyse_cv_20250101_120000.json [autres.json ...]
+    python import_results.py resultats.jsonl --offer offre.txt --title "Développeur Python"
+
+Une ligne JSONL est une entrée du tableau "analyses" de l'export (filename, analysis,
+tokens, cost_usd, cached), éventuellement complétée de "job_offer" et "titre_offre" ;
+à défaut, l'offre est celle de --offer.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import datetime
+
+from analysis import parse_analysis, MODEL_NAME
+from analysis_schema import validate_analysis
+from db import init_db, create_job_offer_id, import_analyses, BufferedWriter, DATE_FORMAT
+
+# Taille des morceaux lus et nombre d'analyses enregistrées par transaction
+CHUNK_CHARS = 1 << 20
+IMPORT_BATCH_ROWS = 1000
+# Format des dates de l'export (metadata.date)
+EXPORT_DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+DEFAULT_TITLE = "Offre importée"
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class JsonStream:
+    """
+    Lecture incrémentale d'un texte JSON : les valeurs sont décodées une à une dans un
+    tampon rechargé par morceaux, sans charger le fichier entier.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(CHUNK_CHARS)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Prochain caractère significatif ("" en fin de fichier), sans le consommer."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"« {char} » attendu, « {found or 'fin du fichier'} » trouvé")
+        self.pos += 1
+
+    def skip(self, char):
+        """Consomme `char` s'il est le prochain caractère significatif."""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        """Décode la valeur JSON suivante."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Un nombre en fin de tampon peut se poursuivre dans le morceau suivant
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def read_export(f):
+    """
+    Parcourt un export JSON : produit (en-tête, entrée) pour chaque élément de "analyses",
+    l'en-tête contenant les autres membres lus jusque-là (metadata, job_offer).
+    """
+    stream = JsonStream(f)
+    header = {}
+    stream.expect("{")
+    while not stream.skip("}"):
+        key = stream.value()
+        stream.expect(":")
+        if key == "analyses":
+            stream.expect("[")
+            while not stream.skip("]"):
+                yield header, stream.value()
+                stream.skip(",")
+        else:
+            header[key] = stream.value()
+        stream.skip(",")
+
+
+def read_jsonl(f):
+    """Parcourt un fichier JSONL : produit (en-tête, entrée), un export complet par ligne étant accepté."""
+    for line_no, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"ligne {line_no} : {e}") from None
+        if "analyses" in record:
+            header = {key: value for key, value in record.items() if key != "analyses"}
+            for entry in record["analyses"]:
+                yield header, entry
+        else:
+            yield {}, record
+
+
+def export_date(header, entry):
+    """Date ISO de l'analyse : celle de l'entrée, sinon celle de l'export, sinon None (maintenant)."""
+    raw = entry.get("date") or (header.get("metadata") or {}).get("date")
+    for date_format in (DATE_FORMAT, EXPORT_DATE_FORMAT):
+        try:
+            return datetime.strptime(raw, date_format).strftime(DATE_FORMAT)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def import_row(header, entry, default_offer, default_title):
+    """Ligne de db.import_analyses pour une entrée exportée, ou None si l'analyse est illisible."""
+    metadata = header.get("metadata") or {}
+    job_offer = entry.get("job_offer") or header.get("job_offer") or default_offer
+    if not job_offer:
+        raise ValueError("offre d'emploi absente de l'export : précisez --offer")
+    title = entry.get("titre_offre") or metadata.get("titre_offre") or default_title or DEFAULT_TITLE
+
+    # Analyses validées comme les réponses du modèle (scores ramenés dans leur barème), la
+    # recommandation en texte libre des exports antérieurs au schéma strict étant acceptée
+    analysis = entry.get("analysis")
+    raw = analysis if isinstance(analysis, dict) else {}
+    method = raw.get("methode_analyse")
+    # Lu avant la validation, qui remplacerait un nombre de pages absent par 0
+    pages = raw.get("pages_analysees")
+    try:
+        if isinstance(analysis, str):
+            analysis = parse_analysis(analysis, lenient=True)
+        else:
+            analysis = validate_analysis(analysis, lenient=True)
+    except ValueError:
+        return None
+    if method:
+        analysis["methode_analyse"] = method
+
+    # Un résultat servi par le cache n'a rien coûté lors de l'analyse exportée
+    tokens = {} if entry.get("cached") else entry.get("tokens") or {}
+    usage = {
+        "prompt_tokens": tokens.get("prompt"),
+        "completion_tokens": tokens.get("completion"),
+        "cached_tokens": tokens.get("cached"),
+        "model": metadata.get("modele_utilise") or MODEL_NAME,
+        "nb_pages": pages if isinstance(pages, int) else None,
+        "cost_usd": entry.get("cost_usd"),
+    }
+    return (create_job_offer_id(job_offer), title, job_offer, entry.get("filename"), analysis, usage,
+            export_date(header, entry))
+
+
+def import_file(path, default_offer=None, default_title=None, batch_rows=IMPORT_BATCH_ROWS):
+    """Importe un fichier exporté (JSON ou JSONL). Retourne (lues, insérées, illisibles)."""
+    stats = {"read": 0, "inserted": 0, "invalid": 0}
+
+    def save(rows):
+        stats["inserted"] += import_analyses(rows)
+
+    with open(path, encoding="utf-8") as f:
+        first = JsonStream(f).peek()
+        f.seek(0)
+        records = read_export(f) if first == "{" and not path.lower().endswith(".jsonl") else read_jsonl(f)
+        with BufferedWriter(save, max_rows=batch_rows, max_seconds=float("inf")) as writer:
+            for header, entry in records:
+                stats["read"] += 1
+                row = import_row(header, entry, default_offer, default_title)
+                if row is None:
+                    stats["invalid"] += 1
+                    continue
+                writer.add(row)
+    return stats["read"], stats["inserted"], stats["invalid"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Fichiers JSON exportés ou JSONL")
+    parser.add_argument("--offer", help="Fichier texte de l'offre, si elle est absente des fichiers")
+    parser.add_argument("--title", help="Titre de l'offre, si absent des fichiers")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_ROWS,
+                        help="Nombre d'analyses enregistrées par transaction")
+    args = parser.parse_args()
+
+    default_offer = None
+    if args.offer:
+        with open(args.offer, encoding="utf-8") as f:
+            default_offer = f.read()
+
+    init_db()
+    for path in args.files:
+        start = time.perf_counter()
+        try:
+            read, inserted, invalid = import_file(path, default_offer, args.title, max(1, args.batch_size))
+        except (OSError, ValueError) as e:
+            sys.exit(f"❌ {path} : {e}")
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"📥 {path} : {inserted} analyse(s) importée(s), {read - inserted - invalid} doublon(s), "
+              f"{invalid} illisible(s) en {elapsed:.1f} s ({read / elapsed:.0f} lignes/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,51 @@
 """
 Script de migration de la base de données
-Ajoute les nouvelles colonnes et tables nécessaires pour le système d'offres d'emploi
+Migrations versionnées (PRAGMA user_version) : chaque migration est appliquée une
+seule fois, dans l'ordre, et la version est enregistrée dans la même transaction.
 """
 
+import argparse
+import json
 import sqlite3
 import os
-from datetime import datetime
+import sys
+import time
+
+from skills import canonical_skills
 
 DB_PATH = "cv_analyses.db"
 
-def migrate_database():
-    """Migre la base de données vers la nouvelle structure"""
-    print("🔄 Début de la migration de la base de données...")
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def table_exists(c, table):
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    return c.fetchone() is not None
+
+def add_missing_columns(c, table, columns, verbose=True):
+    """Ajoute à `table` les colonnes (nom, type) absentes"""
+    c.execute(f"PRAGMA table_info({table})")
+    existing = {column[1] for column in c.fetchall()}
+    for name, col_type in columns:
+        if name not in existing:
+            if verbose:
+                print(f"🔗 Ajout de la colonne {table}.{name}...")
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {col_type}')
+
+def _legacy_columns(c, verbose=True):
+    """Table job_offers et colonnes ajoutées après la création initiale des tables"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_offers (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            content TEXT,
+            created_date TEXT
+        )
+    ''')
     
-    try:
-        # Vérifier si la table job_offers existe
-        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='job_offers'")
-        job_offers_exists = c.fetchone() is not None
-        
-        if not job_offers_exists:
-            print("📋 Création de la table job_offers...")
-            c.execute('''
-                CREATE TABLE job_offers (
-                    id TEXT PRIMARY KEY,
-                    title TEXT,
-                    content TEXT,
-                    created_date TEXT
-                )
-            ''')
-            print("✅ Table job_offers créée")
-        
-        # Vérifier si la colonne job_offer_id existe dans analyses
+    if table_exists(c, 'analyses'):
         c.execute("PRAGMA table_info(analyses)")
         columns = [column[1] for column in c.fetchall()]
         
         if 'job_offer_id' not in columns:
-            print("🔗 Ajout de la colonne job_offer_id à la table analyses...")
             c.execute('ALTER TABLE analyses ADD COLUMN job_offer_id TEXT')
-            print("✅ Colonne job_offer_id ajoutée")
             
             # Créer une offre d'emploi par défaut pour les analyses existantes
             default_job_id = "default_legacy"
@@ -51,33 +56,699 @@ def migrate_database():
                 default_job_id,
                 "Offre héritée (analyses antérieures)",
                 "Analyses réalisées avant l'implémentation du système d'offres d'emploi",
-                datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+                time.strftime('%Y-%m-%d %H:%M:%S')
             ))
             
             # Mettre à jour toutes les analyses existantes avec l'ID par défaut
             c.execute('UPDATE analyses SET job_offer_id = ? WHERE job_offer_id IS NULL', (default_job_id,))
-            print("🔄 Analyses existantes migrées vers l'offre par défaut")
+            if verbose:
+                print("🔄 Analyses existantes migrées vers l'offre par défaut")
         
-        conn.commit()
-        print("✅ Migration terminée avec succès !")
+        add_missing_columns(c, 'analyses', [('methode_analyse', 'TEXT')], verbose)
+    
+    if table_exists(c, 'analysis_cache'):
+        add_missing_columns(c, 'analysis_cache', [('method', 'TEXT')], verbose)
+
+def _iso_dates(c, verbose=True):
+    """Dates 'JJ/MM/AAAA HH:MM:SS' réécrites en 'AAAA-MM-JJ HH:MM:SS', triables chronologiquement"""
+    for table, column in (('analyses', 'date'), ('job_offers', 'created_date')):
+        if not table_exists(c, table):
+            continue
+        # Un seul UPDATE en SQL : pas d'aller-retour Python par ligne
+        c.execute(f'''
+            UPDATE {table}
+            SET {column} = substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-'
+                           || substr({column}, 1, 2) || substr({column}, 11)
+            WHERE {column} GLOB '[0-3][0-9]/[01][0-9]/[0-9][0-9][0-9][0-9]*'
+        ''')
+        if c.rowcount:
+            if verbose:
+                print(f"📅 {table}.{column} : {c.rowcount} date(s) converties")
+
+def _indexes(c, verbose=True):
+    """Index couvrants pour les requêtes par offre et le tri des offres par date"""
+    if table_exists(c, 'analyses'):
+        # Couvre le filtre par offre, le tri par score et COUNT/AVG/MIN/MAX(score_global)
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_analyses_offer_score
+            ON analyses (job_offer_id, score_global DESC)
+        ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_job_offers_created ON job_offers (created_date)')
+
+def _history_indexes(c, verbose=True):
+    """Index des filtres de l'historique : préfixe du nom (insensible à la casse) et date"""
+    if not table_exists(c, 'analyses'):
+        return
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analyses_name ON analyses (nom_prenom COLLATE NOCASE)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses (date)')
+
+# Score ramené dans 0-100 pour l'histogramme
+_CLAMPED = "MAX(0, MIN(100, {row}.score_global))"
+
+def _stats_add(row):
+    """Instructions de trigger ajoutant la ligne `row` (NEW) aux agrégats de son offre"""
+    score = _CLAMPED.format(row=row)
+    return f'''
+        INSERT INTO job_offer_score_counts (job_offer_id, score, nb)
+        SELECT {row}.job_offer_id, {score}, 1
+        WHERE {row}.job_offer_id IS NOT NULL AND {row}.score_global IS NOT NULL
+        ON CONFLICT (job_offer_id, score) DO UPDATE SET nb = nb + 1;
+        INSERT INTO job_offer_stats (job_offer_id, nb_analyses, nb_scored, score_sum, score_min, score_max)
+        SELECT {row}.job_offer_id, 1, {row}.score_global IS NOT NULL, COALESCE({row}.score_global, 0),
+               {score}, {score}
+        WHERE {row}.job_offer_id IS NOT NULL
+        ON CONFLICT (job_offer_id) DO UPDATE SET
+            nb_analyses = nb_analyses + 1,
+            nb_scored = nb_scored + excluded.nb_scored,
+            score_sum = score_sum + excluded.score_sum,
+            score_min = COALESCE(MIN(score_min, excluded.score_min), score_min, excluded.score_min),
+            score_max = COALESCE(MAX(score_max, excluded.score_max), score_max, excluded.score_max);
+    '''
+
+def _stats_remove(row):
+    """Instructions de trigger retirant la ligne `row` (OLD) ; min et max relus dans l'histogramme"""
+    return f'''
+        UPDATE job_offer_score_counts SET nb = nb - 1
+        WHERE job_offer_id = {row}.job_offer_id AND score = {_CLAMPED.format(row=row)};
+        DELETE FROM job_offer_score_counts WHERE job_offer_id = {row}.job_offer_id AND nb <= 0;
+        UPDATE job_offer_stats SET
+            nb_analyses = nb_analyses - 1,
+            nb_scored = nb_scored - ({row}.score_global IS NOT NULL),
+            score_sum = score_sum - COALESCE({row}.score_global, 0),
+            score_min = (SELECT MIN(score) FROM job_offer_score_counts WHERE job_offer_id = {row}.job_offer_id),
+            score_max = (SELECT MAX(score) FROM job_offer_score_counts WHERE job_offer_id = {row}.job_offer_id)
+        WHERE job_offer_id = {row}.job_offer_id;
+    '''
+
+def _job_offer_stats(c, verbose=True):
+    """Agrégats par offre (nombre, somme, min, max, histogramme des scores) tenus à jour par triggers"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_offer_stats (
+            job_offer_id TEXT PRIMARY KEY,
+            nb_analyses INTEGER NOT NULL DEFAULT 0,
+            nb_scored INTEGER NOT NULL DEFAULT 0,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            score_min INTEGER,
+            score_max INTEGER
+        )
+    ''')
+    # Un compteur par score exact (0 à 100) : permet de retrouver min et max après une suppression
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_offer_score_counts (
+            job_offer_id TEXT,
+            score INTEGER,
+            nb INTEGER NOT NULL,
+            PRIMARY KEY (job_offer_id, score)
+        ) WITHOUT ROWID
+    ''')
+    if not table_exists(c, 'analyses'):
+        return
+    
+    # Reprise de l'existant en une passe
+    c.execute('DELETE FROM job_offer_score_counts')
+    c.execute('DELETE FROM job_offer_stats')
+    c.execute(f'''
+        INSERT INTO job_offer_score_counts (job_offer_id, score, nb)
+        SELECT job_offer_id, {_CLAMPED.format(row="analyses")}, COUNT(*)
+        FROM analyses
+        WHERE job_offer_id IS NOT NULL AND score_global IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+    c.execute(f'''
+        INSERT INTO job_offer_stats (job_offer_id, nb_analyses, nb_scored, score_sum, score_min, score_max)
+        SELECT job_offer_id, COUNT(*), COUNT(score_global), COALESCE(SUM(score_global), 0),
+               MIN({_CLAMPED.format(row="analyses")}), MAX({_CLAMPED.format(row="analyses")})
+        FROM analyses
+        WHERE job_offer_id IS NOT NULL
+        GROUP BY job_offer_id
+    ''')
+    
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_stats_insert AFTER INSERT ON analyses
+        WHEN NEW.job_offer_id IS NOT NULL
+        BEGIN {_stats_add("NEW")} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_stats_delete AFTER DELETE ON analyses
+        WHEN OLD.job_offer_id IS NOT NULL
+        BEGIN {_stats_remove("OLD")} END
+    ''')
+    # Changement d'offre ou de score : retrait de l'ancienne ligne puis ajout de la nouvelle
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_stats_update AFTER UPDATE OF job_offer_id, score_global ON analyses
+        BEGIN
+            {_stats_remove("OLD")}
+            {_stats_add("NEW")}
+        END
+    ''')
+
+def _data_version(c, verbose=True):
+    """Compteur de version des données, incrémenté par triggers à chaque écriture (cache des lectures)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    c.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('data_version', 0)")
+    for table in ('analyses', 'job_offers'):
+        if not table_exists(c, table):
+            continue
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{operation.lower()} AFTER {operation} ON {table}
+                BEGIN
+                    UPDATE db_meta SET value = value + 1 WHERE key = 'data_version';
+                END
+            ''')
+
+def _analysis_runs(c, verbose=True):
+    """Points de reprise des analyses en ligne de commande (analyze.py)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_offer_id TEXT,
+            created_at REAL,
+            finished_at REAL,
+            FOREIGN KEY (job_offer_id) REFERENCES job_offers (id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_runs_offer ON analysis_runs (job_offer_id, finished_at)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_run_items (
+            run_id INTEGER,
+            path TEXT,
+            status TEXT,
+            tokens INTEGER,
+            error TEXT,
+            updated_at REAL,
+            PRIMARY KEY (run_id, path),
+            FOREIGN KEY (run_id) REFERENCES analysis_runs (id)
+        )
+    ''')
+
+def _job_queue(c, verbose=True):
+    """File de travaux persistante : lots, une tâche par fichier avec bail, processus worker"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_offer_id TEXT,
+            force INTEGER NOT NULL DEFAULT 0,
+            created_at REAL,
+            last_claimed_at REAL,
+            finished_at REAL,
+            FOREIGN KEY (job_offer_id) REFERENCES job_offers (id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            filename TEXT,
+            pdf BLOB,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            partial TEXT,
+            result TEXT,
+            analysis_id INTEGER,
+            error TEXT,
+            updated_at REAL,
+            FOREIGN KEY (job_id) REFERENCES jobs (id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_job_tasks_status ON job_tasks (status, job_id, position)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_job_tasks_job ON job_tasks (job_id, position)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_workers (
+            id TEXT PRIMARY KEY,
+            pid INTEGER,
+            hostname TEXT,
+            started_at REAL,
+            heartbeat_at REAL
+        )
+    ''')
+
+def _timings(c, verbose=True):
+    """Durée de chaque étape des analyses (voir timings.py)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS timings (
+            id INTEGER PRIMARY KEY,
+            analysis_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            recorded_at REAL NOT NULL,
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_timings_recorded ON timings (recorded_at, stage)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_timings_analysis ON timings (analysis_id)')
+
+# Colonnes de consommation des analyses et leur agrégat dans usage_daily
+USAGE_COLUMNS = [
+    ('prompt_tokens', 'INTEGER'),
+    ('completion_tokens', 'INTEGER'),
+    ('cached_tokens', 'INTEGER'),
+    ('latency_ms', 'REAL'),
+    ('model', 'TEXT'),
+    ('nb_pages', 'INTEGER'),
+    ('cost_usd', 'REAL'),
+]
+# Clé d'agrégation : jour (dates ISO-8601), offre et modèle ('' si inconnus)
+_USAGE_KEY = "substr({row}.date, 1, 10), COALESCE({row}.job_offer_id, ''), COALESCE({row}.model, '')"
+
+def _usage_add(row):
+    """Instructions de trigger ajoutant la consommation de la ligne `row` (NEW) à son jour, son offre et son modèle"""
+    return f'''
+        INSERT INTO usage_daily (day, job_offer_id, model, nb_analyses, prompt_tokens, completion_tokens,
+                                 cached_tokens, cost_usd, nb_timed, latency_ms_sum, nb_paged, nb_pages)
+        SELECT {_USAGE_KEY.format(row=row)}, 1, COALESCE({row}.prompt_tokens, 0),
+               COALESCE({row}.completion_tokens, 0), COALESCE({row}.cached_tokens, 0),
+               COALESCE({row}.cost_usd, 0), {row}.latency_ms IS NOT NULL, COALESCE({row}.latency_ms, 0),
+               {row}.nb_pages IS NOT NULL, COALESCE({row}.nb_pages, 0)
+        WHERE {row}.date IS NOT NULL
+        ON CONFLICT (day, job_offer_id, model) DO UPDATE SET
+            nb_analyses = nb_analyses + 1,
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = completion_tokens + excluded.completion_tokens,
+            cached_tokens = cached_tokens + excluded.cached_tokens,
+            cost_usd = cost_usd + excluded.cost_usd,
+            nb_timed = nb_timed + excluded.nb_timed,
+            latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+            nb_paged = nb_paged + excluded.nb_paged,
+            nb_pages = nb_pages + excluded.nb_pages;
+    '''
+
+def _usage_remove(row):
+    """Instructions de trigger retirant la consommation de la ligne `row` (OLD)"""
+    return f'''
+        UPDATE usage_daily SET
+            nb_analyses = nb_analyses - 1,
+            prompt_tokens = prompt_tokens - COALESCE({row}.prompt_tokens, 0),
+            completion_tokens = completion_tokens - COALESCE({row}.completion_tokens, 0),
+            cached_tokens = cached_tokens - COALESCE({row}.cached_tokens, 0),
+            cost_usd = cost_usd - COALESCE({row}.cost_usd, 0),
+            nb_timed = nb_timed - ({row}.latency_ms IS NOT NULL),
+            latency_ms_sum = latency_ms_sum - COALESCE({row}.latency_ms, 0),
+            nb_paged = nb_paged - ({row}.nb_pages IS NOT NULL),
+            nb_pages = nb_pages - COALESCE({row}.nb_pages, 0)
+        WHERE (day, job_offer_id, model) = ({_USAGE_KEY.format(row=row)});
+        DELETE FROM usage_daily WHERE (day, job_offer_id, model) = ({_USAGE_KEY.format(row=row)}) AND nb_analyses <= 0;
+    '''
+
+def _usage_accounting(c, verbose=True):
+    """Tokens, latence, modèle, pages et coût de chaque analyse, agrégés par jour, offre et modèle"""
+    if table_exists(c, 'analyses'):
+        add_missing_columns(c, 'analyses', USAGE_COLUMNS, verbose)
+    if table_exists(c, 'analysis_cache'):
+        add_missing_columns(c, 'analysis_cache', [('nb_pages', 'INTEGER')], verbose)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            day TEXT NOT NULL,
+            job_offer_id TEXT NOT NULL,
+            model TEXT NOT NULL,
+            nb_analyses INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            cached_tokens INTEGER NOT NULL DEFAULT 0,
+            cost_usd REAL NOT NULL DEFAULT 0,
+            nb_timed INTEGER NOT NULL DEFAULT 0,
+            latency_ms_sum REAL NOT NULL DEFAULT 0,
+            nb_paged INTEGER NOT NULL DEFAULT 0,
+            nb_pages INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, job_offer_id, model)
+        ) WITHOUT ROWID
+    ''')
+    if not table_exists(c, 'analyses'):
+        return
+
+    # Reprise de l'existant en une passe (analyses antérieures : nombre seulement)
+    c.execute('DELETE FROM usage_daily')
+    c.execute(f'''
+        INSERT INTO usage_daily (day, job_offer_id, model, nb_analyses, prompt_tokens, completion_tokens,
+                                 cached_tokens, cost_usd, nb_timed, latency_ms_sum, nb_paged, nb_pages)
+        SELECT {_USAGE_KEY.format(row="analyses")}, COUNT(*), COALESCE(SUM(prompt_tokens), 0),
+               COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(cached_tokens), 0),
+               COALESCE(SUM(cost_usd), 0), COUNT(latency_ms), COALESCE(SUM(latency_ms), 0),
+               COUNT(nb_pages), COALESCE(SUM(nb_pages), 0)
+        FROM analyses
+        WHERE date IS NOT NULL
+        GROUP BY 1, 2, 3
+    ''')
+
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_usage_insert AFTER INSERT ON analyses
+        BEGIN {_usage_add("NEW")} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_usage_delete AFTER DELETE ON analyses
+        BEGIN {_usage_remove("OLD")} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_usage_update AFTER UPDATE OF
+            date, job_offer_id, model, prompt_tokens, completion_tokens, cached_tokens, cost_usd,
+            latency_ms, nb_pages ON analyses
+        BEGIN
+            {_usage_remove("OLD")}
+            {_usage_add("NEW")}
+        END
+    ''')
+
+def _import_index(c, verbose=True):
+    """Index de la détection des doublons à l'import des résultats exportés"""
+    if table_exists(c, 'analyses'):
+        c.execute('CREATE INDEX IF NOT EXISTS idx_analyses_offer_file ON analyses (job_offer_id, filename)')
+
+def _parse_failures(c, verbose=True):
+    """Réponses du modèle invalides (JSON ou schéma) et résultat de leur réparation"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS parse_failures (
+            id INTEGER PRIMARY KEY,
+            recorded_at REAL NOT NULL,
+            method TEXT,
+            error TEXT,
+            repaired INTEGER NOT NULL,
+            wasted_tokens INTEGER NOT NULL,
+            repair_tokens INTEGER NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_parse_failures_recorded ON parse_failures (recorded_at)')
+
+# Colonnes de l'index plein texte et leur poids dans le classement bm25. L'offre est
+# indexée sans poids : le filtre par offre est appliqué par l'index (job_offer_id : "..."),
+# avant le classement, au lieu de classer toutes les analyses de toutes les offres
+SEARCH_COLUMNS = [
+    ('nom_prenom', 10.0),
+    ('commentaire', 1.0),
+    ('filename', 5.0),
+    ('experience_pertinente', 2.0),
+    ('job_offer_id', 0.0),
+]
+
+def _rebuild_search_index(c):
+    """Reconstruit l'index plein texte à partir de `analyses` et le compacte"""
+    c.execute("INSERT INTO analyses_fts (analyses_fts) VALUES ('rebuild')")
+    c.execute("INSERT INTO analyses_fts (analyses_fts) VALUES ('optimize')")
+
+def _search_index(c, verbose=True):
+    """Index plein texte FTS5 des analyses, tenu à jour par des triggers"""
+    if not table_exists(c, 'analyses'):
+        return
+    add_missing_columns(c, 'analyses', [('experience_pertinente', 'TEXT')], verbose)
+    names = [name for name, _ in SEARCH_COLUMNS]
+    columns = ', '.join(names)
+    old_values = ', '.join(f'old.{name}' for name in names)
+    new_values = ', '.join(f'new.{name}' for name in names)
+    # Table à contenu externe : seul l'index est stocké, le texte reste dans `analyses`
+    c.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+            {columns},
+            content='analyses', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    weights = ', '.join(str(weight) for _, weight in SEARCH_COLUMNS)
+    c.execute("INSERT INTO analyses_fts (analyses_fts, rank) VALUES ('rank', ?)", (f'bm25({weights})',))
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS analyses_fts_insert AFTER INSERT ON analyses BEGIN
+            INSERT INTO analyses_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS analyses_fts_delete AFTER DELETE ON analyses BEGIN
+            INSERT INTO analyses_fts (analyses_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS analyses_fts_update AFTER UPDATE OF {columns} ON analyses BEGIN
+            INSERT INTO analyses_fts (analyses_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO analyses_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    ''')
+    _rebuild_search_index(c)
+
+# Listes de l'analyse enregistrées par analysis_skills (compétences normalisées) et
+# par analysis_points (phrases telles quelles) -> valeur de la colonne `kind`
+SKILL_LISTS = {'competences_matchees': 'matched', 'competences_manquantes': 'missing'}
+POINT_LISTS = {'points_forts': 'strength', 'points_faibles': 'weakness'}
+
+def insert_analysis_lists(c, analyses):
+    """
+    Enregistre les compétences et les points forts/faibles d'analyses déjà insérées :
+    `analyses` est une liste de (ID de l'analyse, dict de l'analyse)
+    """
+    skills, links, points = {}, [], []
+    for analysis_id, analysis in analyses:
+        for field, kind in SKILL_LISTS.items():
+            for name, label in canonical_skills(analysis.get(field)):
+                skills.setdefault(name, label)
+                links.append((kind, analysis_id, name))
+        for field, kind in POINT_LISTS.items():
+            texts = [text for text in analysis.get(field) or [] if isinstance(text, str) and text.strip()]
+            points.extend((analysis_id, kind, position, text.strip()) for position, text in enumerate(texts))
+    # Le libellé d'une compétence est celui de sa première apparition
+    c.executemany('INSERT OR IGNORE INTO skills (name, label) VALUES (?, ?)', skills.items())
+    c.executemany('''
+        INSERT OR IGNORE INTO analysis_skills (skill_id, kind, analysis_id)
+        SELECT id, ?, ? FROM skills WHERE name = ?
+    ''', links)
+    c.executemany('''
+        INSERT OR IGNORE INTO analysis_points (analysis_id, kind, position, text) VALUES (?, ?, ?, ?)
+    ''', points)
+
+def _skills(c, verbose=True):
+    """Compétences normalisées et points forts/faibles des analyses, avec leurs index"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS skills (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            label TEXT NOT NULL,
+            nb_matched INTEGER NOT NULL DEFAULT 0,
+            nb_missing INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Clé primaire (compétence, type, analyse) : les analyses d'une compétence sont lues
+    # dans l'index, triées par ID, ce qui rend l'intersection de plusieurs compétences rapide
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_skills (
+            skill_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            analysis_id INTEGER NOT NULL,
+            PRIMARY KEY (skill_id, kind, analysis_id),
+            FOREIGN KEY (skill_id) REFERENCES skills (id),
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_skills_analysis ON analysis_skills (analysis_id, kind)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_points (
+            analysis_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (analysis_id, kind, position),
+            FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+        ) WITHOUT ROWID
+    ''')
+    # Nombre d'analyses par compétence, pour les listes de compétences sans agrégation
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_analysis_skills_insert AFTER INSERT ON analysis_skills
+        BEGIN
+            UPDATE skills SET nb_matched = nb_matched + (NEW.kind = 'matched'),
+                              nb_missing = nb_missing + (NEW.kind = 'missing')
+            WHERE id = NEW.skill_id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_analysis_skills_delete AFTER DELETE ON analysis_skills
+        BEGIN
+            UPDATE skills SET nb_matched = nb_matched - (OLD.kind = 'matched'),
+                              nb_missing = nb_missing - (OLD.kind = 'missing')
+            WHERE id = OLD.skill_id;
+        END
+    ''')
+    if not table_exists(c, 'analyses'):
+        return
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_lists_delete AFTER DELETE ON analyses
+        BEGIN
+            DELETE FROM analysis_skills WHERE analysis_id = OLD.id;
+            DELETE FROM analysis_points WHERE analysis_id = OLD.id;
+        END
+    ''')
+    # Reprise de l'existant : seules les analyses faites par worker.py ont gardé la réponse
+    # complète du modèle (job_tasks.result) ; les autres n'avaient enregistré que les scores
+    if not table_exists(c, 'job_tasks'):
+        return
+    c.execute('''
+        SELECT t.analysis_id, t.result FROM job_tasks t
+        JOIN analyses a ON a.id = t.analysis_id
+        WHERE t.result IS NOT NULL
+    ''')
+    analyses = []
+    for analysis_id, result in c.fetchall():
+        try:
+            analysis = json.loads(json.loads(result)["content"])
+        except (ValueError, TypeError, KeyError):
+            continue
+        if isinstance(analysis, dict):
+            analyses.append((analysis_id, analysis))
+    insert_analysis_lists(c, analyses)
+    if analyses and verbose:
+        print(f"🧩 Compétences reprises pour {len(analyses)} analyse(s) du worker")
+
+def _cache_and_batch_tables(c, verbose=True):
+    """
+    Cache des réponses du modèle et suivi de l'API Batch. Ces tables n'étaient créées
+    que par init_db (db._create_schema) : une base migrée par `python migrate_db.py`
+    pouvait atteindre la dernière version sans elles.
+    """
+    # Cache des réponses du modèle (clé : PDF + offre + modèle + version du prompt)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            content TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            total_tokens INTEGER,
+            method TEXT,
+            created_at REAL,
+            last_used_at REAL,
+            nb_pages INTEGER
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used_at)')
+    # Suivi des lots soumis à l'API Batch d'OpenAI (mode hors ligne)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            id TEXT PRIMARY KEY,
+            job_offer_id TEXT,
+            input_file_id TEXT,
+            output_file_id TEXT,
+            error_file_id TEXT,
+            status TEXT,
+            created_at REAL,
+            updated_at REAL,
+            ingested_at REAL,
+            FOREIGN KEY (job_offer_id) REFERENCES job_offers (id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS batch_items (
+            batch_id TEXT,
+            custom_id TEXT,
+            filename TEXT,
+            method TEXT,
+            cache_key TEXT,
+            status TEXT,
+            PRIMARY KEY (batch_id, custom_id),
+            FOREIGN KEY (batch_id) REFERENCES batch_jobs (id)
+        )
+    ''')
+
+# (version, description, fonction) dans l'ordre d'application ; ne jamais renuméroter
+MIGRATIONS = [
+    (1, "colonnes historiques (job_offer_id, methode_analyse)", _legacy_columns),
+    (2, "dates au format ISO-8601", _iso_dates),
+    (3, "index sur analyses et job_offers", _indexes),
+    (4, "index des filtres de l'historique", _history_indexes),
+    (5, "agrégats par offre tenus à jour par triggers", _job_offer_stats),
+    (6, "compteur de version des données", _data_version),
+    (7, "points de reprise des analyses en ligne de commande", _analysis_runs),
+    (8, "file de travaux des processus worker", _job_queue),
+    (9, "durée des étapes des analyses", _timings),
+    (10, "consommation des analyses et agrégats par jour, offre et modèle", _usage_accounting),
+    (11, "index des doublons à l'import", _import_index),
+    (12, "réponses invalides du modèle et réparations", _parse_failures),
+    (13, "index plein texte des analyses (FTS5)", _search_index),
+    (14, "compétences normalisées et points forts/faibles des analyses", _skills),
+    (15, "tables du cache des réponses et de l'API Batch", _cache_and_batch_tables),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+# Version à partir de laquelle l'index plein texte existe
+SEARCH_INDEX_VERSION = next(version for version, _, migration in MIGRATIONS if migration is _search_index)
+
+def get_schema_version(c):
+    c.execute('PRAGMA user_version')
+    return c.fetchone()[0]
+
+def apply_migrations(c, verbose=True):
+    """
+    Applique les migrations au-delà de la version courante, dans la transaction
+    ouverte sur le curseur `c`. Retourne la version finale du schéma.
+    """
+    version = get_schema_version(c)
+    for target, description, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        if verbose:
+            print(f"🔄 Migration {target} : {description}...")
+        start = time.perf_counter()
+        migration(c, verbose)
+        c.execute(f'PRAGMA user_version = {target}')
+        version = target
+        if verbose:
+            print(f"✅ Migration {target} terminée ({time.perf_counter() - start:.2f} s)")
+    return version
+
+def migrate_database(path=DB_PATH):
+    """Migre la base de données vers la dernière version du schéma"""
+    print("🔄 Début de la migration de la base de données...")
+    
+    conn = sqlite3.connect(path, isolation_level=None)
+    c = conn.cursor()
+    
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        version = apply_migrations(c)
+        c.execute('COMMIT')
+        print(f"✅ Migration terminée avec succès ! (schéma version {version})")
         
     except Exception as e:
         print(f"❌ Erreur lors de la migration : {e}")
-        conn.rollback()
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
         raise
     finally:
         conn.close()
 
-def check_database_structure():
+def rebuild_search_index(path=DB_PATH):
+    """
+    Reconstruit l'index plein texte des analyses, par exemple après des écritures faites
+    sans les triggers (restauration, import SQL direct) ou pour le compacter
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    c = conn.cursor()
+    try:
+        if get_schema_version(c) < SEARCH_INDEX_VERSION:
+            print("⚠️ Index plein texte absent : lancez d'abord la migration")
+            return
+        print("🔎 Reconstruction de l'index plein texte...")
+        start = time.perf_counter()
+        c.execute('BEGIN IMMEDIATE')
+        _rebuild_search_index(c)
+        c.execute('COMMIT')
+        c.execute('SELECT COUNT(*) FROM analyses')
+        print(f"✅ Index reconstruit : {c.fetchone()[0]} analyses ({time.perf_counter() - start:.2f} s)")
+    finally:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        conn.close()
+
+def check_database_structure(path=DB_PATH):
     """Vérifie la structure actuelle de la base de données"""
-    if not os.path.exists(DB_PATH):
+    if not os.path.exists(path):
         print("ℹ️ Aucune base de données existante trouvée")
         return
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(path)
     c = conn.cursor()
     
     print("📊 Structure actuelle de la base de données :")
+    print(f"Version du schéma : {get_schema_version(c)} (dernière : {SCHEMA_VERSION})")
     
     # Lister les tables
     c.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -96,9 +767,20 @@ def check_database_structure():
         job_offers_columns = c.fetchall()
         print(f"Colonnes de 'job_offers' : {[col[1] for col in job_offers_columns]}")
     
+    c.execute("SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_%'")
+    print(f"Index : {[index[0] for index in c.fetchall()]}")
+    
     conn.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migration de la base de données CV_IA")
+    parser.add_argument("--rebuild-search", action="store_true",
+                        help="Reconstruit l'index plein texte des analyses, sans autre migration")
+    args = parser.parse_args()
+    if args.rebuild_search:
+        rebuild_search_index()
+        sys.exit(0)
+
     print("🚀 Script de migration de la base de données CV_IA")
     print("=" * 50)
     
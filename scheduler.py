@@ -0,0 +1,221 @@
+"""
+Ordonnanceur des appels au modèle : admission par seaux de jetons (requêtes et tokens
+par minute), nouvelles tentatives avec attente exponentielle aléatoire respectant
+Retry-After, et disjoncteur en cas d'erreurs serveur répétées.
+"""
+
+import random
+import sys
+import threading
+import time
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Limites par défaut (à ajuster selon le palier du compte OpenAI)
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+MAX_ATTEMPTS = 5
+BACKOFF_MULTIPLIER = 1.0     # première attente ~1 s, puis doublement
+BACKOFF_MAX_SECONDS = 60
+# Disjoncteur : ouverture après N échecs consécutifs, nouvel essai après le délai
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Levée sans appeler l'API tant que le disjoncteur est ouvert."""
+
+
+def _loaded_openai():
+    """
+    Module openai s'il est déjà chargé (sinon aucune exception ne peut en provenir) :
+    l'ordonnanceur n'impose pas l'import du SDK au démarrage.
+    """
+    return sys.modules.get("openai")
+
+
+def is_retryable(exc):
+    """Erreurs transitoires de l'API : limite de débit, erreurs 5xx, coupures réseau."""
+    openai = _loaded_openai()
+    if openai is None:
+        return False
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS_CODES or exc.status_code >= 500
+    return False
+
+
+def retry_after_seconds(exc):
+    """Délai demandé par l'API (en-têtes retry-after-ms / retry-after), ou None."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class TokenBucket:
+    """Seau de jetons rechargé en continu à `rate_per_minute`, partagé entre threads."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Bloque jusqu'à ce que `amount` jetons soient disponibles, puis les consomme."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                self.lock.wait((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta):
+        """Corrige le solde après coup (consommation réelle différente de l'estimation)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+            self.lock.notify_all()
+
+    def drain(self):
+        """Vide le seau (après un 429, pour ralentir tous les threads)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert sur les échecs consécutifs."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                raise CircuitOpenError("Disjoncteur ouvert : trop d'erreurs consécutives de l'API")
+            # Semi-ouvert : on laisse passer un essai, qui refermera ou rouvrira le circuit
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def seconds_until_retry(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+
+class RateLimitedScheduler:
+    """Point de passage unique des appels au modèle pour un processus."""
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_attempts=MAX_ATTEMPTS,
+                 breaker=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_attempts = max_attempts
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _wait(self, retry_state):
+        exc = retry_state.outcome.exception()
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, 0.5)
+        return wait_random_exponential(multiplier=BACKOFF_MULTIPLIER, max=BACKOFF_MAX_SECONDS)(retry_state)
+
+    def _before_sleep(self, retry_state):
+        self._count("retries")
+
+    def _attempt(self, fn, estimated_tokens):
+        self.breaker.before_call()
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+        self._count("calls")
+        try:
+            result = fn()
+        except Exception as e:
+            openai = _loaded_openai()
+            if openai is not None and isinstance(e, openai.RateLimitError):
+                self._count("rate_limited")
+                self.requests.drain()
+            elif is_retryable(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def call(self, fn, estimated_tokens=0, usage_tokens=None):
+        """
+        Exécute `fn()` après admission, avec nouvelles tentatives sur erreurs transitoires.
+        Si le disjoncteur est ouvert, lève CircuitOpenError immédiatement.
+        `usage_tokens(result)` retourne la consommation réelle, utilisée pour corriger
+        le seau de tokens par rapport à l'estimation.
+        """
+        retrying = Retrying(
+            retry=retry_if_exception(is_retryable),
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        try:
+            result = retrying(self._attempt, fn, estimated_tokens)
+        except Exception:
+            self._count("failures")
+            raise
+        if usage_tokens is not None:
+            self.tokens.adjust(usage_tokens(result) - estimated_tokens)
+        return result
+
+
+default_scheduler = RateLimitedScheduler()
+
+
+def configure(requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+              max_attempts=MAX_ATTEMPTS, breaker=None):
+    """Remplace l'ordonnanceur partagé (limites propres au compte, tests)."""
+    global default_scheduler
+    default_scheduler = RateLimitedScheduler(requests_per_minute, tokens_per_minute, max_attempts, breaker)
+    return default_scheduler
@@ -0,0 +1,112 @@
+"""
+Normalisation des compétences renvoyées par le modèle (competences_matchees,
+competences_manquantes) : « PostgreSQL », « postgres » et « Maîtrise de PostgreSQL »
+sont enregistrées sous la même clé dans la table `skills`, ce qui permet de chercher
+les candidats par compétence sur toutes les offres (voir db.py).
+
+La clé est le nom sans accents, en minuscules, sans précision entre parenthèses ni
+formule du type « maîtrise de », puis ramenée à sa forme canonique par CANONICAL_SKILLS.
+"""
+
+import functools
+import re
+import unicodedata
+
+# Clé canonique -> (libellé affiché, autres écritures déjà normalisées)
+CANONICAL_SKILLS = {
+    "python": ("Python", ["python3", "python 3"]),
+    "javascript": ("JavaScript", ["js", "java script", "ecmascript"]),
+    "typescript": ("TypeScript", ["ts"]),
+    "node.js": ("Node.js", ["node", "nodejs", "node js"]),
+    "react": ("React", ["reactjs", "react.js", "react js"]),
+    "vue.js": ("Vue.js", ["vue", "vuejs", "vue js"]),
+    "angular": ("Angular", ["angularjs", "angular.js"]),
+    "java": ("Java", []),
+    "c#": ("C#", ["csharp", "c sharp"]),
+    "c++": ("C++", ["cpp"]),
+    ".net": (".NET", ["dotnet", "dot net", ".net core"]),
+    "go": ("Go", ["golang"]),
+    "sql": ("SQL", []),
+    "postgresql": ("PostgreSQL", ["postgres", "postgre", "postgre sql", "postgre-sql"]),
+    "mysql": ("MySQL", []),
+    "mongodb": ("MongoDB", ["mongo"]),
+    "django": ("Django", []),
+    "fastapi": ("FastAPI", ["fast api"]),
+    "docker": ("Docker", []),
+    "kubernetes": ("Kubernetes", ["k8s"]),
+    "aws": ("AWS", ["amazon web services"]),
+    "azure": ("Azure", ["microsoft azure"]),
+    "gcp": ("Google Cloud", ["google cloud platform"]),
+    "ci/cd": ("CI/CD", ["cicd", "ci cd", "ci-cd", "integration continue"]),
+    "git": ("Git", []),
+    "linux": ("Linux", []),
+    "machine learning": ("Machine learning", ["ml", "apprentissage automatique"]),
+    "intelligence artificielle": ("IA", ["ia", "ai", "artificial intelligence"]),
+    "anglais": ("Anglais", ["english", "langue anglaise"]),
+    "gestion de projet": ("Gestion de projet", ["project management"]),
+}
+
+# Formules placées devant la compétence par le modèle (« Maîtrise de Python »)
+_QUALIFIERS = re.compile(
+    r"^(?:(?:tres|bonne|bonnes|solide|solides|forte|excellente) )*"
+    r"(?:maitrise|connaissances?|experience|pratique|notions?|expertise)"
+    r" (?:de la |de l'|des |du |de |d'|en |avec |sur )?"
+)
+# Précision finale entre parenthèses (« Docker (notions) »)
+_PARENTHESIS = re.compile(r"\s*\([^)]*\)\s*$")
+# Puces, guillemets et ponctuation autour de la compétence ; le point initial de « .NET »
+# et les « + » ou « # » finaux de « C++ » ou « C# » sont conservés
+_EDGES = re.compile(r"^[\s\-–—*•·,;:!?\"'«»]+|[\s\-–—*•·,;:!?\"'«».]+$")
+
+
+def fold(text):
+    """Forme de comparaison : sans accents, en minuscules, espaces normalisés."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.replace("’", "'").casefold().split())
+
+
+def _build_aliases():
+    aliases = {}
+    for key, (label, others) in CANONICAL_SKILLS.items():
+        for alias in (key, fold(label), *others):
+            aliases[alias] = key
+    return aliases
+
+ALIASES = _build_aliases()
+
+
+# Les mêmes compétences reviennent d'une analyse à l'autre : la normalisation est mémorisée
+@functools.lru_cache(maxsize=4096)
+def canonical_skill(name):
+    """
+    (clé, libellé) d'une compétence, ou None si le nom est vide. Le libellé est celui de
+    CANONICAL_SKILLS, ou à défaut le nom tel qu'écrit, débarrassé des précisions.
+    """
+    if not isinstance(name, str):
+        return None
+    cleaned = _EDGES.sub("", _PARENTHESIS.sub("", _EDGES.sub("", name)))
+    cleaned = " ".join(cleaned.split())
+    folded = fold(cleaned)
+    # La formule est repérée sur la forme repliée et retirée du libellé quand les deux
+    # formes ont la même longueur (sinon le libellé est la forme repliée)
+    qualifier = _QUALIFIERS.match(folded)
+    if qualifier and qualifier.end() < len(folded):
+        rest = folded[qualifier.end():]
+        cleaned = cleaned[-len(rest):] if len(cleaned) == len(folded) else rest
+        folded = rest
+    if not folded:
+        return None
+    key = ALIASES.get(folded, folded)
+    label = CANONICAL_SKILLS[key][0] if key in CANONICAL_SKILLS else cleaned
+    return key, label
+
+
+def canonical_skills(names):
+    """Compétences distinctes (clé, libellé) d'une liste, dans l'ordre de première apparition."""
+    seen = {}
+    for name in names or []:
+        skill = canonical_skill(name) if isinstance(name, str) else None
+        if skill is not None and skill[0] not in seen:
+            seen[skill[0]] = skill
+    return list(seen.values())
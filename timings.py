@@ -0,0 +1,90 @@
+"""
+Mesure du temps passé dans chaque étape d'une analyse (couche texte, rendu PDF,
+encodage des images, appel au modèle, décodage, écriture en base).
+
+Les étapes sont mesurées avec `span(étape)` et cumulées dans l'enregistrement ouvert
+par `recording()` dans le même thread ; en dehors d'un enregistrement, `span` ne
+mesure rien. Les durées sont enregistrées dans la table
+`timings` avec l'ID de l'analyse (db.insert_timings).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Étapes mesurées, dans l'ordre du pipeline ; « total » couvre tout le traitement d'un CV
+STAGES = ("cache", "text_layer", "render", "encode", "llm", "parse", "db_write", "total")
+QUANTILES = (0.5, 0.95, 0.99)
+
+_local = threading.local()
+
+
+@contextmanager
+def recording():
+    """Collecte les durées (ms) des étapes mesurées dans ce thread : {étape: durée cumulée}."""
+    previous = getattr(_local, "stages", None)
+    stages = _local.stages = {}
+    try:
+        yield stages
+    finally:
+        _local.stages = previous
+
+
+@contextmanager
+def span(stage):
+    """Mesure le bloc et ajoute sa durée à l'étape `stage` de l'enregistrement en cours."""
+    stages = getattr(_local, "stages", None)
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def percentile(sorted_values, q):
+    """Percentile (méthode du rang le plus proche) d'une liste déjà triée."""
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(rows):
+    """
+    Statistiques par étape à partir de lignes (étape, durée en ms), dans l'ordre de STAGES :
+    liste de dicts {stage, count, sum, p50, p95, p99}.
+    """
+    durations = {}
+    for stage, duration_ms in rows:
+        durations.setdefault(stage, []).append(duration_ms)
+    order = {stage: position for position, stage in enumerate(STAGES)}
+    summary = []
+    for stage in sorted(durations, key=lambda s: (order.get(s, len(order)), s)):
+        values = sorted(durations[stage])
+        stats = {"stage": stage, "count": len(values), "sum": sum(values)}
+        for q in QUANTILES:
+            stats[f"p{round(q * 100)}"] = percentile(values, q)
+        summary.append(stats)
+    return summary
+
+
+def prometheus_text(summary, gauges=None):
+    """
+    Export au format texte de Prometheus : un résumé `cv_stage_duration_seconds` par
+    étape (quantiles, somme, nombre), suivi des jauges `gauges` ({nom: valeur}).
+    """
+    lines = [
+        "# HELP cv_stage_duration_seconds Durée des étapes d'analyse d'un CV",
+        "# TYPE cv_stage_duration_seconds summary",
+    ]
+    for stats in summary:
+        label = f'stage="{stats["stage"]}"'
+        for q in QUANTILES:
+            value = stats[f"p{round(q * 100)}"] / 1000
+            lines.append(f'cv_stage_duration_seconds{{{label},quantile="{q}"}} {value:.6f}')
+        lines.append(f"cv_stage_duration_seconds_sum{{{label}}} {stats['sum'] / 1000:.6f}")
+        lines.append(f"cv_stage_duration_seconds_count{{{label}}} {stats['count']}")
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
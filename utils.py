@@ -1,34 +1,79 @@
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    print("PyMuPDF (fitz) not found. Please install it with: pip install PyMuPDF")
-    raise ImportError("PyMuPDF is required for PDF processing")
-
 import base64
+import math
 from io import BytesIO
-from PIL import Image
-import tempfile
-import os
+from PIL import Image, ImageChops
+
+# Facteur de zoom appliqué au rendu des pages (2.0 ≈ 144 dpi)
+RENDER_ZOOM = 2.0
+
+def _fitz():
+    """Import différé de PyMuPDF, coûteux au démarrage : chargé au premier rendu."""
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        print("PyMuPDF (fitz) not found. Please install it with: pip install PyMuPDF")
+        raise ImportError("PyMuPDF is required for PDF processing")
+    return fitz
 
-def pdf_to_images_from_bytes(pdf_bytes):
+def _open_pdf_bytes(pdf_bytes):
+    """Ouvre un PDF directement depuis la mémoire, sans fichier temporaire."""
+    return _fitz().open(stream=pdf_bytes, filetype="pdf")
+
+def _pixmap_to_image(pix):
+    """Construit une PIL.Image à partir du buffer brut du pixmap (sans passer par PNG)."""
+    mode = "RGBA" if pix.alpha else "RGB"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples, "raw", mode, pix.stride)
+
+def _render_pages(doc, zoom):
+    matrix = _fitz().Matrix(zoom, zoom)
+    for page in doc:
+        yield page.get_pixmap(matrix=matrix)
+
+def pdf_to_images_from_bytes(pdf_bytes, zoom=RENDER_ZOOM):
     """Convertit un PDF (bytes) en liste de PIL.Image (pour Streamlit)."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(pdf_bytes)
-        tmp_path = tmp.name
-    images = pdf_to_images_from_path(tmp_path)
-    os.unlink(tmp_path)
-    return images
-
-def pdf_to_images_from_path(pdf_path):
+    with _open_pdf_bytes(pdf_bytes) as doc:
+        return [_pixmap_to_image(pix) for pix in _render_pages(doc, zoom)]
+
+def pdf_to_images_from_path(pdf_path, zoom=RENDER_ZOOM):
     """Convertit un PDF (chemin) en liste de PIL.Image."""
-    doc = fitz.open(pdf_path)
-    images = []
-    for page in doc:
-        pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
-        img = Image.open(BytesIO(pix.tobytes("png")))
-        images.append(img)
-    doc.close()
-    return images
+    with _fitz().open(pdf_path) as doc:
+        return [_pixmap_to_image(pix) for pix in _render_pages(doc, zoom)]
+
+# --- Couche texte des PDF générés numériquement ---
+
+TEXT_LAYER_MIN_CHARS_PER_PAGE = 200   # en dessous, la page est considérée sans texte
+TEXT_LAYER_MIN_WORD_RATIO = 0.5       # part minimale de « vrais mots » parmi les tokens
+
+def extract_text_layer(pdf_bytes):
+    """Extrait la couche texte de chaque page du PDF (liste de str, une par page)."""
+    with _open_pdf_bytes(pdf_bytes) as doc:
+        return [page.get_text("text", sort=True) for page in doc]
+
+def score_text_layer(pages_text):
+    """
+    Évalue la qualité de la couche texte entre 0 et 1 :
+    couverture des pages, proportion de caractères lisibles et de mots plausibles.
+    Un PDF scanné ou composé d'images obtient un score proche de 0.
+    """
+    if not pages_text:
+        return 0.0
+
+    covered = sum(1 for text in pages_text if len("".join(text.split())) >= TEXT_LAYER_MIN_CHARS_PER_PAGE)
+    coverage = covered / len(pages_text)
+
+    text = "".join(pages_text)
+    visible = [ch for ch in text if not ch.isspace()]
+    if not visible:
+        return 0.0
+    garbage = sum(1 for ch in visible if ch == "\ufffd" or not ch.isprintable() or "\ue000" <= ch <= "\uf8ff")
+    readable = 1 - garbage / len(visible)
+
+    tokens = text.split()
+    words = sum(1 for token in tokens if 2 <= len(token.strip(".,;:!?()[]«»\"'")) <= 25
+                and any(ch.isalpha() for ch in token))
+    word_ratio = words / len(tokens)
+
+    return round(coverage * readable * min(1.0, word_ratio / TEXT_LAYER_MIN_WORD_RATIO), 3)
 
 def image_to_base64(image: Image.Image) -> str:
     """Convertit une PIL.Image en chaîne Base64."""
@@ -51,3 +96,159 @@ def build_vision_payload(images, prompt_text):
     return contents
 
 
+# --- Optimisation de la charge utile des images envoyées au modèle ---
+
+# Estimation locale des tokens image (tuiles de 512 px, valeurs GPT-5)
+IMAGE_TOKENS_BASE = 70
+IMAGE_TOKENS_PER_TILE = 140
+IMAGE_TILE_SIZE = 512
+IMAGE_MAX_SIDE = 2048
+IMAGE_MAX_SHORT_SIDE = 768
+
+# Seuils de l'optimiseur
+BLANK_THRESHOLD = 245       # niveau de gris au-dessus duquel un pixel est considéré blanc
+CROP_PADDING = 16           # marge conservée autour du contenu (px)
+MONOCHROME_TOLERANCE = 12   # écart max entre canaux pour considérer la page sans couleur
+JPEG_QUALITY = 85
+PNG_COMPRESS_LEVEL = 1      # compression rapide : le gain d'un niveau élevé ne vaut pas son coût CPU
+PHOTO_MIN_COLORS = 1024     # au-delà (sur une vignette), la page contient une photo : JPEG
+# Petit côté minimal pour que le texte reste lisible : ~95 dpi sur la largeur utile d'un A4 recadré
+MIN_READABLE_SHORT_SIDE = 640
+# Densité d'encre (page recadrée) -> petit côté cible : seule une page presque vide descend
+# au minimum lisible
+DENSITY_TARGETS = ((0.02, IMAGE_MAX_SHORT_SIDE), (0.0, MIN_READABLE_SHORT_SIDE))
+
+def estimate_image_tokens(width, height, detail="high"):
+    """Estime les tokens facturés pour une image, selon la méthode de redimensionnement de l'API."""
+    if detail == "low":
+        return IMAGE_TOKENS_BASE
+    scale = min(1.0, IMAGE_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, IMAGE_MAX_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_TOKENS_BASE + IMAGE_TOKENS_PER_TILE * tiles
+
+def crop_blank_margins(image, padding=CROP_PADDING):
+    """Supprime les marges blanches autour du contenu de la page."""
+    mask = image.convert("L").point(lambda p: 255 if p < BLANK_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(0, left - padding),
+        max(0, top - padding),
+        min(image.width, right + padding),
+        min(image.height, bottom + padding),
+    ))
+
+def is_monochrome(image, tolerance=MONOCHROME_TOLERANCE):
+    """Indique si la page ne contient pas de couleur significative (analyse sur une vignette)."""
+    if image.mode in ("1", "L", "LA"):
+        return True
+    thumb = image.convert("RGB")
+    thumb.thumbnail((256, 256))
+    r, g, b = thumb.split()
+    spread = max(
+        ImageChops.difference(r, g).getextrema()[1],
+        ImageChops.difference(g, b).getextrema()[1],
+    )
+    return spread <= tolerance
+
+def content_density(image):
+    """Proportion de pixels non blancs de la page (0 à 1), calculée sur une vignette."""
+    thumb = image.convert("L")
+    thumb.thumbnail((256, 256))
+    histogram = thumb.histogram()
+    return sum(histogram[:BLANK_THRESHOLD]) / max(1, thumb.width * thumb.height)
+
+def is_photographic(image, min_colors=PHOTO_MIN_COLORS):
+    """Indique si la page contient une photo ou un fond dégradé (nombre de couleurs d'une vignette)."""
+    thumb = image.convert("RGB")
+    thumb.thumbnail((256, 256))
+    return thumb.getcolors(maxcolors=min_colors) is None
+
+def _target_size(width, height, density):
+    """Choisit les dimensions finales selon la densité, alignées sur la grille de tuiles."""
+    target_short = next(target for min_density, target in DENSITY_TARGETS if density >= min_density)
+    scale = min(1.0, target_short / min(width, height), IMAGE_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+
+    # Si le grand côté déborde de peu sur une tuile supplémentaire, on réduit légèrement,
+    # sans descendre sous la résolution lisible
+    long_side = max(width, height)
+    tiles = math.ceil(long_side / IMAGE_TILE_SIZE)
+    if tiles > 1 and long_side <= (tiles - 1) * IMAGE_TILE_SIZE * 1.10:
+        shrink = (tiles - 1) * IMAGE_TILE_SIZE / long_side
+        if min(width, height) * shrink >= MIN_READABLE_SHORT_SIDE:
+            width, height = width * shrink, height * shrink
+    return max(1, round(width)), max(1, round(height))
+
+def _encode(image, fmt):
+    buf = BytesIO()
+    if fmt == "JPEG":
+        image.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    else:
+        image.save(buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return buf.getvalue()
+
+def optimize_page_image(image):
+    """
+    Prépare une page pour l'API vision : recadrage des marges, niveaux de gris si la
+    page est sans couleur, résolution adaptée à la densité du contenu recadré (jamais
+    sous MIN_READABLE_SHORT_SIDE), puis un seul encodage : JPEG pour une page en couleur
+    contenant une photo, PNG sinon (texte net). Le format n'a pas d'effet sur les tokens,
+    seulement sur le poids.
+
+    Retourne un dict : mime, data (bytes), width, height, tokens, original_tokens,
+    grayscale, density.
+    """
+    original_tokens = estimate_image_tokens(image.width, image.height)
+    page = crop_blank_margins(image)
+    density = content_density(page)
+    grayscale = is_monochrome(page)
+    fmt = "PNG" if grayscale or not is_photographic(page) else "JPEG"
+
+    page = page.convert("L" if grayscale else "RGB")
+    size = _target_size(page.width, page.height, density)
+    if size != page.size:
+        page = page.resize(size, Image.LANCZOS)
+
+    data = _encode(page, fmt)
+    return {
+        "mime": f"image/{fmt.lower()}",
+        "data": data,
+        "width": page.width,
+        "height": page.height,
+        "tokens": estimate_image_tokens(page.width, page.height),
+        "original_tokens": original_tokens,
+        "grayscale": grayscale,
+        "density": round(density, 3),
+    }
+
+def image_data_url(encoded):
+    """Construit l'URL data: base64 d'une image produite par `optimize_page_image`."""
+    return f"data:{encoded['mime']};base64,{base64.b64encode(encoded['data']).decode()}"
+
+def payload_report(images):
+    """
+    Compare, page par page, l'encodage PNG brut et l'encodage optimisé.
+    Retourne une liste de dicts (octets et tokens estimés avant/après).
+    """
+    report = []
+    for page_no, image in enumerate(images, start=1):
+        before = _encode(image, "PNG")
+        after = optimize_page_image(image)
+        report.append({
+            "page": page_no,
+            "bytes_before": len(before),
+            "bytes_after": len(after["data"]),
+            "tokens_before": estimate_image_tokens(image.width, image.height),
+            "tokens_after": after["tokens"],
+            "format": after["mime"],
+            "size_after": f"{after['width']}x{after['height']}",
+            "grayscale": after["grayscale"],
+            "density": after["density"],
+        })
+    return report
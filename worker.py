@@ -0,0 +1,216 @@
+"""
+Processus worker de la file de travaux : exécute les analyses mises en file par
+l'interface (enqueue_job), indépendamment de la session Streamlit. Plusieurs workers
+(sur la même base) se partagent les tâches ; chaque tâche est tenue par un bail
+renouvelé tant que le worker est vivant, puis reprise par un autre s'il s'arrête.
+
+Usage :
+    python worker.py [--threads 4] [--idle-exit 300]
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import config
+import scheduler
+from analysis import analyze_cv_cached, get_client, parse_analysis, usage_record
+from db import (init_db, claim_task, complete_task, fail_task, release_worker_tasks, renew_leases,
+                save_task_partial, register_worker, unregister_worker, count_live_workers, insert_timings)
+from timings import recording, span
+
+# Durée d'un bail, renouvelé toutes les HEARTBEAT_SECONDS tant que la tâche est en cours
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 15
+# Attente entre deux recherches de tâche quand la file est vide
+POLL_SECONDS = 1.0
+# Nombre de tentatives par tâche (arrêt du worker compris) avant l'échec définitif
+MAX_TASK_ATTEMPTS = 3
+# Attente avant de retenter une tâche en échec transitoire (si le disjoncteur est fermé)
+RETRY_DELAY_SECONDS = 10
+# Intervalle minimal entre deux enregistrements de l'aperçu d'une tâche en cours
+PARTIAL_SAVE_SECONDS = 1.0
+
+WORKER_LOG = "worker.log"
+
+# Dernier démarrage d'un worker par ensure_worker (le temps qu'il se signale)
+_spawned_at = float("-inf")
+
+
+def is_transient(error):
+    return scheduler.is_retryable(error) or isinstance(error, scheduler.CircuitOpenError)
+
+
+class Worker:
+    """Threads d'analyse d'un processus, plus un thread de renouvellement des baux."""
+
+    def __init__(self, client, threads=config.MAX_CONCURRENT_ANALYSES, idle_exit=None):
+        self.client = client
+        self.threads = threads
+        self.idle_exit = idle_exit
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.stopping = threading.Event()
+        self.held = set()
+        self.held_lock = threading.Lock()
+        self.last_activity = time.monotonic()
+
+    def _heartbeat(self):
+        while not self.stopping.wait(HEARTBEAT_SECONDS):
+            with self.held_lock:
+                task_ids = list(self.held)
+            renew_leases(self.id, task_ids, LEASE_SECONDS)
+            idle = not task_ids and time.monotonic() - self.last_activity > (self.idle_exit or float("inf"))
+            if idle:
+                print(f"💤 Aucune tâche depuis {self.idle_exit} s : arrêt du worker")
+                self.stopping.set()
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            task = claim_task(self.id, LEASE_SECONDS, MAX_TASK_ATTEMPTS)
+            if task is None:
+                self.stopping.wait(POLL_SECONDS)
+                continue
+            with self.held_lock:
+                self.held.add(task["id"])
+            try:
+                self._process(task)
+            finally:
+                with self.held_lock:
+                    self.held.discard(task["id"])
+                self.last_activity = time.monotonic()
+
+    def _process(self, task):
+        """Traite une tâche et enregistre la durée de ses étapes si l'analyse est enregistrée."""
+        with recording() as stages:
+            with span("total"):
+                analysis_id = self._analyze(task)
+        if analysis_id is not None:
+            insert_timings([(analysis_id, stages)])
+
+    def _analyze(self, task):
+        label = f"lot {task['job_id']} · {task['filename']}"
+        partial = None
+        if config.STREAM_RESPONSES:
+            last_saved = 0.0
+
+            def partial(fields):
+                nonlocal last_saved
+                if time.monotonic() - last_saved >= PARTIAL_SAVE_SECONDS:
+                    last_saved = time.monotonic()
+                    save_task_partial(task["id"], self.id, fields)
+
+        try:
+            result = analyze_cv_cached(task["pdf_bytes"], task["job_offer"], task["job_offer_id"], self.client,
+                                       force=task["force"], on_partial=partial)
+        except Exception as e:
+            if is_transient(e):
+                delay = max(scheduler.default_scheduler.breaker.seconds_until_retry(), RETRY_DELAY_SECONDS)
+                fail_task(task["id"], self.id, str(e), retry_after=delay, max_attempts=MAX_TASK_ATTEMPTS)
+            else:
+                fail_task(task["id"], self.id, str(e))
+            print(f"❌ {label} (tentative {task['attempt']}) : {e}")
+            return
+        if result is None:
+            fail_task(task["id"], self.id, "PDF vide ou illisible")
+            print(f"❌ {label} : PDF vide ou illisible")
+            return
+        try:
+            with span("parse"):
+                parsed = parse_analysis(result["content"])
+        except ValueError:
+            fail_task(task["id"], self.id, "Réponse invalide")
+            print(f"❌ {label} : réponse invalide")
+            return
+
+        parsed["methode_analyse"] = result.get("method")
+        with span("db_write"):
+            analysis_id = complete_task(task["id"], self.id, task["filename"], parsed, task["job_offer_id"], result,
+                                        usage_record(result))
+        if analysis_id is not None:
+            source = " (cache)" if result.get("cached") else ""
+            print(f"✅ {label} : {parsed.get('score_global', 0)}/100{source}")
+        else:
+            print(f"⚠️ {label} : bail perdu, résultat ignoré")
+        return analysis_id
+
+    def run(self):
+        """Traite la file jusqu'à l'arrêt (Ctrl+C, SIGTERM ou inactivité avec --idle-exit)."""
+        register_worker(self.id, os.getpid(), socket.gethostname())
+        print(f"👷 Worker {self.id} démarré ({self.threads} analyses simultanées)")
+        threads = [threading.Thread(target=self._loop, name=f"worker-{n}", daemon=True)
+                   for n in range(self.threads)]
+        threads.append(threading.Thread(target=self._heartbeat, name="worker-heartbeat", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            try:
+                while not self.stopping.wait(0.5):
+                    pass
+            except KeyboardInterrupt:
+                # Premier Ctrl+C : on termine les analyses en cours sans en commencer d'autres
+                print("\n⏸️ Arrêt demandé : fin des analyses en cours (Ctrl+C à nouveau pour quitter)")
+                self.stopping.set()
+            for thread in threads[:-1]:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            print("⏹️ Arrêt immédiat : les tâches en cours sont remises en file")
+        finally:
+            self.stopping.set()
+            release_worker_tasks(self.id)
+            unregister_worker(self.id)
+
+
+def ensure_worker():
+    """
+    Démarre un worker en arrière-plan si aucun n'a donné signe de vie récemment ; il
+    s'arrête seul après une période d'inactivité. Retourne True si un worker est actif
+    ou en cours de démarrage.
+    """
+    global _spawned_at
+    if count_live_workers(3 * HEARTBEAT_SECONDS):
+        return True
+    if time.monotonic() - _spawned_at < 3 * HEARTBEAT_SECONDS:
+        return True
+    if not config.OPENAI_API_KEY:
+        return False
+    _spawned_at = time.monotonic()
+    # La clé peut venir des secrets Streamlit, que le worker ne lit pas
+    env = {**os.environ, "OPENAI_API_KEY": config.OPENAI_API_KEY}
+    # Même répertoire courant que l'appelant : même base de données (DB_PATH relatif)
+    with open(WORKER_LOG, "a") as log:
+        subprocess.Popen([sys.executable, "-u", os.path.abspath(__file__), "--idle-exit", "300"],
+                         env=env, stdout=log, stderr=subprocess.STDOUT,
+                         stdin=subprocess.DEVNULL, start_new_session=True)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=config.MAX_CONCURRENT_ANALYSES,
+                        help="Nombre d'analyses simultanées de ce worker")
+    parser.add_argument("--idle-exit", type=float, default=None,
+                        help="Arrêter le worker après ce nombre de secondes sans tâche")
+    parser.add_argument("--rpm", type=int, default=scheduler.DEFAULT_REQUESTS_PER_MINUTE,
+                        help="Limite de requêtes par minute du compte")
+    parser.add_argument("--tpm", type=int, default=scheduler.DEFAULT_TOKENS_PER_MINUTE,
+                        help="Limite de tokens par minute du compte")
+    args = parser.parse_args()
+
+    if not config.OPENAI_API_KEY:
+        sys.exit("⚠️ Clé API OpenAI non configurée (OPENAI_API_KEY)")
+    init_db()
+    scheduler.configure(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    # SIGTERM est traité comme Ctrl+C : fin des analyses en cours puis arrêt
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    Worker(get_client(max_retries=0), max(1, args.threads), args.idle_exit).run()
+
+
+if __name__ == "__main__":
+    main()